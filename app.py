@@ -5,7 +5,7 @@ import httpx
 import streamlit as st
 from bs4 import BeautifulSoup
 
-from simplify_html import extract_ssr_data, simplify_html_for_llm
+from simplify_html import Simplifier, SimplifyStats, extract_ssr_data
 
 st.set_page_config(page_title="HTML Simplifier for LLMs", page_icon="✨", layout="wide")
 
@@ -25,6 +25,17 @@ This tool helps you prepare HTML content for Large Language Models (like ChatGPT
 # Input method selection at the top
 input_method = st.radio("Choose input method:", ["Direct HTML", "URL"], horizontal=True)
 
+# Output format selection
+# Label -> (output format, code language, file extension)
+output_formats = {
+    "HTML": ("html", "html", "html"),
+    "Markdown": ("markdown", "markdown", "md"),
+    "JSON AST": ("json", "json", "json"),
+}
+output_format_label = st.radio("Output format:", list(output_formats), horizontal=True)
+output_format, output_language, output_extension = output_formats[output_format_label]
+main_content = st.checkbox("Keep only the main content (drops navigation, sidebars, footers and banners)")
+
 html_content = ""
 
 if input_method == "Direct HTML":
@@ -38,7 +49,7 @@ else:
                 response.raise_for_status()
                 html_content = response.text
                 st.success("Successfully fetched HTML from URL!")
-        except Exception as e:
+        except (httpx.HTTPError, httpx.InvalidURL) as e:
             st.error(f"Error fetching URL: {str(e)}")
 
 if html_content:
@@ -48,7 +59,10 @@ if html_content:
             soup = BeautifulSoup(html_content, "html.parser")
             prettified_html = str(soup.prettify())  # Convert to string to fix type error
 
-            simplified_html = simplify_html_for_llm(html_content)
+            stats = SimplifyStats()
+            simplified_html = (
+                Simplifier(main_content=main_content).run(html_content, output_format=output_format, stats=stats).output
+            )
 
             # Extract SSR data
             ssr_candidates = extract_ssr_data(html_content)
@@ -57,10 +71,10 @@ if html_content:
             col1, col2 = st.columns(2)
             with col1:
                 st.download_button(
-                    label="Download Simplified HTML",
+                    label=f"Download Simplified {output_format_label}",
                     data=simplified_html,
-                    file_name="simplified.html",
-                    mime="text/html",
+                    file_name=f"simplified.{output_extension}",
+                    mime="application/json" if output_format == "json" else f"text/{output_language}",
                 )
             with col2:
                 st.download_button(
@@ -71,7 +85,9 @@ if html_content:
                 )
 
             # Display results in tabs
-            tab1, tab2, tab3 = st.tabs(["Original HTML", "Simplified HTML", "SSR Data"])
+            tab1, tab2, tab3, tab4 = st.tabs(
+                ["Original HTML", f"Simplified {output_format_label}", "SSR Data", "Stage Stats"]
+            )
 
             with tab1:
                 # Truncate large HTML content
@@ -84,7 +100,7 @@ if html_content:
                     st.info("HTML content truncated. Use the download button above to get the full content.")
 
             with tab2:
-                st.code(simplified_html, language="html", height=600, line_numbers=True)
+                st.code(simplified_html, language=output_language, height=600, line_numbers=True)
 
             with tab3:
                 if ssr_candidates:
@@ -98,6 +114,30 @@ if html_content:
                 else:
                     st.info("No SSR data candidates found in the HTML.")
 
+            with tab4:
+                col1, col2, col3 = st.columns(3)
+                col1.metric("Input", f"{stats.input_bytes:,} bytes")
+                col2.metric(
+                    "Output",
+                    f"{stats.output_bytes:,} bytes",
+                    delta=f"-{stats.input_bytes - stats.output_bytes:,} bytes",
+                    delta_color="inverse",
+                )
+                col3.metric("Time", f"{stats.wall_seconds * 1000:.1f} ms")
+                st.dataframe(
+                    [
+                        {
+                            "Stage": stage.name,
+                            "Wall (ms)": round(stage.wall_seconds * 1000, 2),
+                            "CPU (ms)": round(stage.cpu_seconds * 1000, 2),
+                            "Nodes visited": stage.nodes_visited,
+                            "Nodes removed": stage.nodes_removed,
+                        }
+                        for stage in stats.stages
+                    ],
+                    use_container_width=True,
+                )
+
             # Show extract_ssr_data function code
             st.divider()
             st.subheader("Extract SSR Data Function")
@@ -0,0 +1,22 @@
+"""
+Offline benchmarks for ``simplify_html`` on a deterministic, scalable corpus of generated pages.
+
+Run ``python -m benchmarks --sizes 10KB,1MB,50MB -o results.json`` for throughput, latency percentiles and per-stage
+time and peak RSS as JSON. Add ``--memory`` for tracemalloc peak and retained memory per stage with the top
+allocation sites instead.
+"""
+
+from benchmarks.corpus import PAGE_KINDS, generate_page, parse_size
+from benchmarks.memory import TracemallocHooks, memory_profile
+from benchmarks.runner import FUNCTIONS, benchmark, run_benchmarks
+
+__all__ = [
+    "FUNCTIONS",
+    "PAGE_KINDS",
+    "TracemallocHooks",
+    "benchmark",
+    "generate_page",
+    "memory_profile",
+    "parse_size",
+    "run_benchmarks",
+]
@@ -0,0 +1,170 @@
+"""
+Deterministic generator of realistic pages for the benchmarks.
+
+Every page is built from a seeded ``random.Random``, so the same kind, size and seed always give the same bytes.
+"""
+
+import base64
+import json
+import random
+import re
+from collections.abc import Callable
+
+_TAILWIND_CLASSES = (
+    "flex", "grid", "hidden", "block", "items-center", "justify-between", "gap-4", "p-4", "px-6", "py-2", "mt-4",
+    "mb-2", "w-full", "h-10", "rounded-lg", "shadow-md", "bg-white", "bg-gray-100", "text-gray-700", "text-sm",
+    "font-semibold", "border", "border-gray-200", "hover:bg-gray-50", "md:flex", "lg:grid-cols-3", "transition",
+    "duration-200", "relative", "absolute", "z-10", "opacity-75", "space-y-2", "truncate", "sr-only",
+)  # fmt: skip
+_SEMANTIC_CLASSES = ("card", "product", "price", "title", "nav-item", "js-toggle", "content-section", "item")
+_WORDS = (
+    "lorem", "ipsum", "dolor", "sit", "amet", "product", "price", "shipping", "review", "customer", "order", "account",
+    "search", "results", "category", "delivery", "return", "policy", "support", "offer", "update", "release", "news",
+)  # fmt: skip
+_ICON = (
+    '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24" class="w-5 h-5"><path stroke-linecap="round" '
+    'stroke-linejoin="round" stroke-width="2" d="M4 6h16M4 12h16M4 18h16M12 4v16M6 8l12 8"/></svg>'
+)
+_SIZE_RE = re.compile(r"^(\d+(?:\.\d+)?)\s*([KMG]?B?)$", re.IGNORECASE)
+_SIZE_UNITS = {"": 1, "B": 1, "K": 1_000, "KB": 1_000, "M": 1_000_000, "MB": 1_000_000, "G": 10**9, "GB": 10**9}
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(words)).capitalize()
+
+
+def _classes(rng: random.Random, count: int) -> str:
+    classes = rng.sample(_TAILWIND_CLASSES, count)
+    if rng.random() < 0.3:
+        classes.append(rng.choice(_SEMANTIC_CLASSES))
+    return " ".join(classes)
+
+
+def _tailwind_card(rng: random.Random, index: int) -> str:
+    price = f"{rng.randint(1, 500)}.{rng.randint(0, 99):02d}"
+    hidden = '<span class="sr-only">Open menu</span>' if rng.random() < 0.5 else ""
+    return (
+        f'<div class="{_classes(rng, 6)}" data-testid="card-{index}" data-v-{rng.randrange(16**6):06x}="">'
+        f'<div class="{_classes(rng, 4)}"><img src="/img/{index}.webp" srcset="/img/{index}@2x.webp 2x" '
+        f'alt="{_text(rng, 3)}" class="{_classes(rng, 3)}"></div>'
+        f'<div class="{_classes(rng, 5)}"><h3 class="{_classes(rng, 3)}">{_text(rng, 4)}</h3>'
+        f'<p class="{_classes(rng, 4)}">{_text(rng, rng.randint(8, 30))}</p>'
+        f'<span class="{_classes(rng, 3)}" style="color: #333">${price}</span></div>'
+        f'<button type="button" class="{_classes(rng, 7)}" onclick="addToCart({index})">{_ICON}{hidden}Add</button>'
+        "</div>"
+    )
+
+
+def _wrapper_soup(rng: random.Random, index: int) -> str:
+    depth = rng.randint(5, 30)
+    tags = [rng.choice(("div", "div", "div", "span", "section")) for _ in range(depth)]
+    opening = "".join(f'<{tag} class="{_classes(rng, 2)}">' if rng.random() < 0.5 else f"<{tag}>" for tag in tags)
+    closing = "".join(f"</{tag}>" for tag in reversed(tags))
+    return f"{opening}<p>{_text(rng, rng.randint(3, 15))} {index}</p>{closing}"
+
+
+def _list_or_table(rng: random.Random, index: int) -> str:
+    kind = rng.choice(("ul", "ol", "table", "select"))
+    count = rng.randint(20, 400)
+    if kind == "table":
+        header = "".join(f"<th>{_text(rng, 1)}</th>" for _ in range(6))
+        rows = "".join(
+            "<tr>" + "".join(f"<td>{rng.randint(0, 10**6)}</td>" for _ in range(6)) + "</tr>" for _ in range(count)
+        )
+        return f'<table class="{_classes(rng, 2)}"><thead><tr>{header}</tr></thead><tbody>{rows}</tbody></table>'
+    if kind == "select":
+        options = "".join(f'<option value="{number}">{_text(rng, 2)}</option>' for number in range(count))
+        return f'<select name="choice-{index}">{options}</select>'
+    items = "".join(
+        f'<li class="{_classes(rng, 2)}"><a href="/item/{n}">{_text(rng, 3)}</a></li>' for n in range(count)
+    )
+    return f"<{kind}>{items}</{kind}>"
+
+
+def _ssr_record(rng: random.Random, index: int) -> dict:
+    return {
+        "id": index,
+        "slug": f"item-{index}",
+        "title": _text(rng, 4),
+        "price": rng.randint(100, 50_000) / 100,
+        "tags": [rng.choice(_WORDS) for _ in range(rng.randint(1, 5))],
+        "inStock": rng.random() < 0.8,
+    }
+
+
+def _ssr_blob(rng: random.Random, index: int) -> str:
+    # The SSR payload styles recognized by ``extract_ssr_data``, in turn
+    records = [_ssr_record(rng, index * 100 + offset) for offset in range(rng.randint(20, 100))]
+    data = json.dumps({"props": {"pageProps": {"items": records}}, "page": f"/list/{index}"})
+    style = index % 4
+    if style == 0:
+        return f'<script id="__NEXT_DATA__" type="application/json">{data}</script>'
+    if style == 1:
+        return f"<script>window.__INITIAL_STATE__ = {data};</script>"
+    if style == 2:
+        return f'<script>window.__DATA__ = JSON.parse("{json.dumps(data)[1:-1]}");</script>'
+    return f'<script>var state = atob("{base64.b64encode(data.encode()).decode()}");</script>'
+
+
+# Page kind -> block generator; each page repeats the blocks of its kind until it reaches the requested size
+PAGE_KINDS: dict[str, Callable[[random.Random, int], str]] = {
+    "tailwind_spa": _tailwind_card,
+    "wrapper_soup": _wrapper_soup,
+    "lists_tables": _list_or_table,
+    "ssr_blob": _ssr_blob,
+}
+
+
+def parse_size(size: str) -> int:
+    """
+    Parse a size such as ``"10KB"``, ``"1.5MB"`` or ``"2048"`` into bytes (decimal units).
+
+    Args:
+        size (str): The size to parse
+
+    Returns:
+        int: The size in bytes
+    """
+    match = _SIZE_RE.match(size.strip())
+    if not match:
+        raise ValueError(f"Invalid size {size!r}, expected e.g. 10KB or 50MB")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).upper()])
+
+
+def generate_page(kind: str, size: int, seed: int = 0) -> str:
+    """
+    Generate a page of the given kind with at least ``size`` UTF-8 bytes (overshooting by at most one block).
+
+    Args:
+        kind (str): One of ``PAGE_KINDS``: ``"tailwind_spa"``, ``"wrapper_soup"``, ``"lists_tables"`` or
+            ``"ssr_blob"``
+        size (int): Target size in bytes
+        seed (int): Seed of the random generator
+
+    Returns:
+        str: The page
+    """
+    block = PAGE_KINDS[kind]
+    rng = random.Random(f"{kind}:{seed}")
+    head = (
+        f'<!DOCTYPE html><html lang="en"><head><meta charset="utf-8"><title>{_text(rng, 4)}</title>'
+        '<meta name="viewport" content="width=device-width, initial-scale=1">'
+        '<link rel="stylesheet" href="/assets/app.css"><style>.card{display:flex}</style></head>'
+        f'<body class="{_classes(rng, 3)}"><nav class="{_classes(rng, 4)}">'
+        + "".join(f'<a href="/section/{n}" class="{_classes(rng, 3)}">{_text(rng, 1)}</a>' for n in range(8))
+        + '</nav><main id="app">'
+    )
+    tail = (
+        '</main><footer class="site-footer"><p>&copy; 2024 Example</p></footer>'
+        '<script src="/assets/app.js"></script></body></html>'
+    )
+    parts = [head]
+    total = len(head.encode()) + len(tail.encode())
+    index = 0
+    while total < size:
+        part = block(rng, index)
+        parts.append(part)
+        total += len(part.encode())
+        index += 1
+    parts.append(tail)
+    return "".join(parts)
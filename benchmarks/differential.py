@@ -0,0 +1,294 @@
+"""
+Differential harness: runs a reference and a candidate engine on the same corpus and proves they agree.
+
+An engine is any function from HTML to text, named as ``module:function`` or ``path/to/file.py:function``. To compare
+against an older release, export its module, e.g. ``git show v0.1.0:simplify_html.py > legacy_simplify.py``, and pass
+``--reference legacy_simplify.py:simplify_html_for_llm``.
+"""
+
+import argparse
+import difflib
+import importlib
+import importlib.util
+import json
+import math
+import random
+import re
+import sys
+import time
+from collections.abc import Callable, Iterator
+from pathlib import Path
+
+from benchmarks.corpus import PAGE_KINDS, generate_page
+
+_TOKEN_RE = re.compile(r"<[^>]*>|[^<]+|<")
+_FUZZ_TAGS = (
+    "div", "span", "p", "a", "ul", "ol", "li", "table", "tr", "td", "th", "section", "article", "nav", "main", "h1",
+    "h2", "b", "i", "pre", "code", "form", "select", "option", "button", "dialog", "template", "noscript", "svg",
+)  # fmt: skip
+_FUZZ_VOID_TAGS = ("br", "img", "input", "meta", "link", "hr")
+_FUZZ_ATTRIBUTES = (
+    'class="flex p-4 text-sm"', 'class="card item"', 'class="hidden"', 'class="sr-only md:block"', "hidden",
+    'aria-hidden="true"', 'style="display:none"', 'style="color: red"', 'id="main"', 'data-testid="x"',
+    'onclick="go()"', 'href="/path?utm_source=a&amp;ref=b"', 'src="data:image/png;base64,iVBORw0KGgoAAAANSUhEUg"',
+    'srcset="a.png 1x, b.png 2x"', 'type="hidden"', "open", 'role="navigation"', 'lang="en"',
+)  # fmt: skip
+_FUZZ_TEXTS = (
+    "Hello", "world", "&amp; &lt;tag&gt;", "  spaced   text  ", "Ünïcödé ✓", "x" * 200, "1, 2, 3, 4, 5, 6", "\n",
+)  # fmt: skip
+
+
+def load_engine(spec: str) -> Callable[[str], str]:
+    """
+    Load an engine from ``module:function`` or ``path/to/file.py:function``.
+
+    Args:
+        spec (str): The engine to load
+
+    Returns:
+        Callable[[str], str]: The engine
+    """
+    module_name, _, function_name = spec.rpartition(":")
+    if not module_name or not function_name:
+        raise ValueError(f"Invalid engine {spec!r}, expected module:function or path/to/file.py:function")
+    if module_name.endswith(".py"):
+        path = Path(module_name)
+        module_spec = importlib.util.spec_from_file_location(f"_engine_{path.stem}", path)
+        if module_spec is None:
+            raise ValueError(f"Cannot load {module_name}")
+        module = importlib.util.module_from_spec(module_spec)
+        module_spec.loader.exec_module(module)
+    else:
+        module = importlib.import_module(module_name)
+    return getattr(module, function_name)
+
+
+def fuzz_html(rng: random.Random, elements: int = 60) -> str:
+    """
+    Generate random, often malformed HTML: nested tags with noisy attributes, entities, comments, scripts, unclosed
+    elements and stray end tags.
+
+    Args:
+        rng (random.Random): The random generator
+        elements (int): Number of elements to generate
+
+    Returns:
+        str: The document
+    """
+    parts = ["<html><head><title>Fuzz</title><meta name='description' content='d'></head><body>"]
+    open_tags = []
+    for _ in range(elements):
+        roll = rng.random()
+        if roll < 0.45 and len(open_tags) < 12:
+            tag = rng.choice(_FUZZ_TAGS)
+            attributes = " ".join(rng.sample(_FUZZ_ATTRIBUTES, rng.randint(0, 3)))
+            parts.append(f"<{tag} {attributes}>" if attributes else f"<{tag}>")
+            open_tags.append(tag)
+        elif roll < 0.7 and open_tags:
+            # Mostly well nested, sometimes left open or closed out of order
+            tag = open_tags.pop() if rng.random() < 0.9 else open_tags.pop(rng.randrange(len(open_tags)))
+            if rng.random() < 0.95:
+                parts.append(f"</{tag}>")
+        elif roll < 0.8:
+            parts.append(f"<{rng.choice(_FUZZ_VOID_TAGS)} {rng.choice(_FUZZ_ATTRIBUTES)}>")
+        elif roll < 0.85:
+            parts.append(rng.choice(("<!-- comment -->", "<script>var a = 1 < 2;</script>", "<style>p{}</style>")))
+        elif roll < 0.87:
+            parts.append(rng.choice(("</div>", "</p>", "<", "&nbsp;", "<!doctype html>")))
+        else:
+            parts.append(rng.choice(_FUZZ_TEXTS))
+    parts.extend(f"</{tag}>" for tag in reversed(open_tags))
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def corpus(fuzz_documents: int = 200, seed: int = 0) -> Iterator[tuple[str, str]]:
+    """
+    Yield ``(name, html)`` for the generated pages of every kind at a few sizes, then for fuzzed documents.
+
+    Args:
+        fuzz_documents (int): Number of fuzzed documents
+        seed (int): Seed of the generated and fuzzed documents
+
+    Returns:
+        Iterator[tuple[str, str]]: The named documents
+    """
+    for kind in PAGE_KINDS:
+        for size in (2_000, 20_000):
+            yield f"{kind}:{size}", generate_page(kind, size, seed)
+    rng = random.Random(seed)
+    for number in range(fuzz_documents):
+        yield f"fuzz:{number}", fuzz_html(rng, rng.randint(5, 120))
+
+
+def normalize(output: str) -> str:
+    """
+    Normalize an engine output for comparison: line endings, indentation and blank lines are ignored.
+
+    Args:
+        output (str): The output of an engine
+
+    Returns:
+        str: The normalized output
+    """
+    lines = (line.strip() for line in output.replace("\r\n", "\n").split("\n"))
+    return "\n".join(line for line in lines if line)
+
+
+def _output(engine: Callable[[str], str], html: str) -> str:
+    # An engine that raises only agrees with one that raises the same exception type
+    try:
+        return normalize(engine(html))
+    except Exception as error:  # noqa: BLE001 - any engine failure is an outcome to compare, not a harness error
+        return f"<raised {type(error).__name__}>"
+
+
+def minimize(html: str, fails: Callable[[str], bool], max_tests: int = 500) -> str:
+    """
+    Shrink a failing input with delta debugging over its tags and text runs.
+
+    Args:
+        html (str): An input for which ``fails`` is true
+        fails (Callable[[str], bool]): Whether an input still shows the failure
+        max_tests (int): Most calls of ``fails``
+
+    Returns:
+        str: A smaller input that still fails (1-minimal in tokens when ``max_tests`` is not reached)
+    """
+    tokens = _TOKEN_RE.findall(html)
+    granularity = 2
+    tests = 0
+    while len(tokens) >= 2 and tests < max_tests:
+        size = math.ceil(len(tokens) / granularity)
+        for start in range(0, len(tokens), size):
+            complement = tokens[:start] + tokens[start + size :]
+            tests += 1
+            if complement and fails("".join(complement)):
+                tokens = complement
+                granularity = max(granularity - 1, 2)
+                break
+            if tests >= max_tests:
+                break
+        else:
+            if granularity >= len(tokens):
+                break
+            granularity = min(granularity * 2, len(tokens))
+    return "".join(tokens)
+
+
+def compare(
+    reference: Callable[[str], str],
+    candidate: Callable[[str], str],
+    documents: Iterator[tuple[str, str]],
+    max_mismatches: int = 10,
+    progress: Callable[[str], None] | None = None,
+) -> dict:
+    """
+    Run both engines on every document, diff their normalized outputs and minimize the inputs that disagree.
+
+    Args:
+        reference (Callable[[str], str]): The engine whose output is correct
+        candidate (Callable[[str], str]): The engine under test
+        documents (Iterator[tuple[str, str]]): Named documents, e.g. from ``corpus``
+        max_mismatches (int): Mismatches to diff and minimize; later ones are only counted
+        progress (Callable[[str], None] | None): Called with a line for each mismatch
+
+    Returns:
+        dict: The document and mismatch counts, each reported mismatch with its diff and minimized input, and the
+        throughput of both engines
+    """
+    mismatches = []
+    mismatch_count = 0
+    count = 0
+    total_bytes = 0
+    seconds = {"reference": 0.0, "candidate": 0.0}
+    for name, html in documents:
+        count += 1
+        total_bytes += len(html.encode())
+        outputs = {}
+        # Alternate the order, so that neither engine always runs on a warm cache
+        order = (("reference", reference), ("candidate", candidate))
+        for label, engine in order if count % 2 else order[::-1]:
+            started = time.perf_counter()
+            outputs[label] = _output(engine, html)
+            seconds[label] += time.perf_counter() - started
+        if outputs["reference"] == outputs["candidate"]:
+            continue
+
+        mismatch_count += 1
+        if len(mismatches) >= max_mismatches:
+            continue
+        diff = difflib.unified_diff(
+            outputs["reference"].splitlines(), outputs["candidate"].splitlines(), "reference", "candidate", lineterm=""
+        )
+        minimized = minimize(html, lambda text: _output(reference, text) != _output(candidate, text))
+        mismatches.append({"document": name, "diff": "\n".join(diff), "minimized": minimized})
+        if progress is not None:
+            progress(f"mismatch on {name}, minimized to {len(minimized)} characters: {minimized[:200]!r}")
+
+    throughput = {label: total_bytes / elapsed / 1e6 if elapsed else math.inf for label, elapsed in seconds.items()}
+    return {
+        "documents": count,
+        "mismatch_count": mismatch_count,
+        "mismatches": mismatches,
+        "throughput_mb_per_s": throughput,
+        "speedup": seconds["reference"] / seconds["candidate"] if seconds["candidate"] else math.inf,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check that a candidate engine gives the same output as the reference on a generated and fuzzed "
+        "corpus, and compare their throughput."
+    )
+    parser.add_argument("candidate", help="Engine under test, as module:function or path/to/file.py:function")
+    parser.add_argument(
+        "--reference",
+        default="simplify_html:simplify_html_for_llm",
+        help="Reference engine (default: simplify_html:simplify_html_for_llm)",
+    )
+    parser.add_argument("--fuzz", type=int, default=200, help="Number of fuzzed documents (default: 200)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the corpus (default: 0)")
+    parser.add_argument("--max-mismatches", type=int, default=10, help="Mismatches to diff and minimize (default: 10)")
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=argparse.FileType("w"),
+        default=sys.stdout,
+        help="JSON report file (default: write to stdout)",
+    )
+    args = parser.parse_args()
+
+    try:
+        reference = load_engine(args.reference)
+        candidate = load_engine(args.candidate)
+    except (ValueError, ImportError, AttributeError) as error:
+        parser.error(str(error))
+
+    try:
+        report = compare(
+            reference,
+            candidate,
+            corpus(args.fuzz, args.seed),
+            args.max_mismatches,
+            lambda line: print(line, file=sys.stderr),
+        )
+        report = {"reference": args.reference, "candidate": args.candidate, **report}
+        json.dump(report, args.output, indent=2)
+        args.output.write("\n")
+    finally:
+        if args.output != sys.stdout:
+            args.output.close()
+    throughput = report["throughput_mb_per_s"]
+    print(
+        f"{report['documents']} documents, {report['mismatch_count']} mismatches; reference "
+        f"{throughput['reference']:.2f} MB/s, candidate {throughput['candidate']:.2f} MB/s "
+        f"(speedup {report['speedup']:.2f}x)",
+        file=sys.stderr,
+    )
+    if report["mismatch_count"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Memory benchmark mode: tracemalloc peak and retained memory per stage, with the top allocation sites.
+"""
+
+import gc
+import tracemalloc
+
+from simplify_html import Simplifier, SimplifyHooks, SimplifyStats, StageStats, extract_ssr_data
+
+# Allocations made by the profiling itself are left out of the allocation sites
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+)
+
+
+def _snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+
+
+class TracemallocHooks(SimplifyHooks):
+    """
+    Hooks that record the tracemalloc peak and retained memory of each stage; tracemalloc must be tracing.
+
+    Attributes:
+        top (int): Allocation sites to report per stage, by growth of the memory they hold (0 to skip the snapshots,
+            which are slow on large documents)
+        stages (list[dict]): Per stage: ``peak_bytes`` reached above the memory held when it started,
+            ``retained_bytes`` still held when it ended, and ``top_sites``
+        peak (int): Highest traced memory reached during any stage, in absolute bytes
+    """
+
+    def __init__(self, top: int = 10):
+        self.top = top
+        self.stages = []
+        self.peak = 0
+        self._started = 0
+        self._snapshot = None
+
+    def on_stage_start(self, name: str, nodes: int) -> None:
+        self._snapshot = _snapshot() if self.top else None
+        tracemalloc.reset_peak()
+        self._started = tracemalloc.get_traced_memory()[0]
+
+    def on_stage_end(self, stage: StageStats) -> None:
+        current, peak = tracemalloc.get_traced_memory()
+        self.peak = max(self.peak, peak)
+        record = {"name": stage.name, "peak_bytes": peak - self._started, "retained_bytes": current - self._started}
+        if self._snapshot is not None:
+            record["top_sites"] = [
+                {
+                    "site": f"{diff.traceback[0].filename}:{diff.traceback[0].lineno}",
+                    "size_diff_bytes": diff.size_diff,
+                    "count_diff": diff.count_diff,
+                }
+                for diff in _snapshot().compare_to(self._snapshot, "lineno")[: self.top]
+            ]
+        self.stages.append(record)
+
+
+def memory_profile(function_name: str, html: str, top: int = 10) -> dict:
+    """
+    Run ``function_name`` on ``html`` under tracemalloc and report the memory of the whole run and of each stage.
+
+    Args:
+        function_name (str): ``"simplify_html_for_llm"`` or ``"extract_ssr_data"``
+        html (str): The page
+        top (int): Allocation sites to report per stage
+
+    Returns:
+        dict: ``peak_bytes`` of the run, ``retained_bytes`` (the result) once garbage is collected, and the per-stage records of
+        ``TracemallocHooks``
+    """
+    hooks = TracemallocHooks(top)
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        started = tracemalloc.get_traced_memory()[0]
+        if function_name == "extract_ssr_data":
+            result = extract_ssr_data(html, hooks=[hooks])
+        else:
+            result = Simplifier(hooks=[hooks]).run(html, stats=SimplifyStats())
+        # Each stage resets the peak, so the highest one is kept by the hooks
+        peak = max(tracemalloc.get_traced_memory()[1], hooks.peak)
+        # Parse trees are cyclic, so what is retained is only known after a collection
+        gc.collect()
+        current = tracemalloc.get_traced_memory()[0]
+        del result
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+    return {
+        "function": function_name,
+        "size_bytes": len(html.encode()),
+        "peak_bytes": peak - started,
+        "retained_bytes": current - started,
+        "stages": hooks.stages,
+    }
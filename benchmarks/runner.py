@@ -0,0 +1,301 @@
+"""
+Benchmark runner: throughput, latency percentiles and per-stage time and peak RSS on the generated corpus.
+"""
+
+import argparse
+import json
+import math
+import platform
+import statistics
+import sys
+import time
+from collections.abc import Callable
+
+import bs4
+
+from benchmarks.corpus import PAGE_KINDS, generate_page, parse_size
+from benchmarks.memory import memory_profile
+from simplify_html import Simplifier, SimplifyHooks, SimplifyStats, StageStats, extract_ssr_data, simplify_html_for_llm
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_SIZES = ("10KB", "100KB", "1MB")
+
+
+def _reset_peak_rss() -> None:
+    """
+    Reset the peak RSS of the process to its current RSS, where the kernel supports it (Linux).
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss() -> int:
+    """
+    Return the peak RSS of the process in bytes since the last reset (or since start-up where it cannot be reset).
+    """
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class PeakRssHooks(SimplifyHooks):
+    """
+    Hooks that record the peak RSS reached during each stage.
+
+    Attributes:
+        peaks (dict[str, int]): Stage name -> peak RSS in bytes
+    """
+
+    def __init__(self):
+        self.peaks = {}
+
+    def on_stage_start(self, name: str, nodes: int) -> None:
+        _reset_peak_rss()
+
+    def on_stage_end(self, stage: StageStats) -> None:
+        self.peaks[stage.name] = max(self.peaks.get(stage.name, 0), _peak_rss())
+
+
+def _percentile(values: list[float], fraction: float) -> float:
+    # Nearest-rank percentile, which stays meaningful for a handful of runs
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+def _time_runs(function: Callable[[str], object], html: str, runs: int, budget: float) -> list[float]:
+    """
+    Call ``function`` on ``html`` up to ``runs`` times, stopping early once ``budget`` seconds have passed.
+    """
+    function(html)  # Warm-up
+    latencies = []
+    deadline = time.perf_counter() + budget
+    while len(latencies) < runs and (not latencies or time.perf_counter() < deadline):
+        started = time.perf_counter()
+        function(html)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def _stage_profile(function_name: str, html: str) -> list[dict]:
+    """
+    Run ``function_name`` once more, instrumented, and return the time, node counts and peak RSS of each stage.
+    """
+    if function_name == "extract_ssr_data":
+        _reset_peak_rss()
+        started = (time.perf_counter(), time.process_time())
+        extract_ssr_data(html)
+        wall, cpu = time.perf_counter() - started[0], time.process_time() - started[1]
+        return [{"name": "extract_ssr_data", "wall_seconds": wall, "cpu_seconds": cpu, "peak_rss_bytes": _peak_rss()}]
+
+    rss = PeakRssHooks()
+    stats = SimplifyStats()
+    Simplifier(hooks=[rss]).run(html, stats=stats)
+    return [
+        {
+            "name": stage.name,
+            "wall_seconds": stage.wall_seconds,
+            "cpu_seconds": stage.cpu_seconds,
+            "nodes_visited": stage.nodes_visited,
+            "nodes_removed": stage.nodes_removed,
+            "peak_rss_bytes": rss.peaks[stage.name],
+        }
+        for stage in stats.stages
+    ]
+
+
+# Benchmarked function name -> function of the HTML
+FUNCTIONS: dict[str, Callable[[str], object]] = {
+    "simplify_html_for_llm": simplify_html_for_llm,
+    "extract_ssr_data": extract_ssr_data,
+}
+
+
+def benchmark(function_name: str, html: str, runs: int = 5, budget: float = 10.0) -> dict:
+    """
+    Benchmark one function on one page.
+
+    Args:
+        function_name (str): One of ``FUNCTIONS``
+        html (str): The page
+        runs (int): Most timed runs, after one warm-up run
+        budget (float): Seconds after which no further timed run is started (at least one always runs)
+
+    Returns:
+        dict: Latency percentiles, throughput and the per-stage profile
+    """
+    size = len(html.encode())
+    latencies = _time_runs(FUNCTIONS[function_name], html, runs, budget)
+    mean = statistics.mean(latencies)
+    return {
+        "function": function_name,
+        "size_bytes": size,
+        "runs": len(latencies),
+        "latency_seconds": {
+            "min": min(latencies),
+            "p50": _percentile(latencies, 0.5),
+            "p99": _percentile(latencies, 0.99),
+            "mean": mean,
+        },
+        "throughput_mb_per_s": size / mean / 1e6,
+        "pages_per_s": 1 / mean,
+        "stages": _stage_profile(function_name, html),
+    }
+
+
+def run_benchmarks(
+    kinds: tuple[str, ...] = tuple(PAGE_KINDS),
+    sizes: tuple[int, ...] = tuple(parse_size(size) for size in DEFAULT_SIZES),
+    functions: tuple[str, ...] = tuple(FUNCTIONS),
+    runs: int = 5,
+    budget: float = 10.0,
+    seed: int = 0,
+    progress: Callable[[str], None] | None = None,
+    memory: bool = False,
+    top: int = 10,
+) -> dict:
+    """
+    Benchmark every function on a generated page of every kind and size.
+
+    In memory mode each function runs once under tracemalloc (see ``memory_profile``) instead of being timed.
+
+    Args:
+        kinds (tuple[str, ...]): Page kinds from ``PAGE_KINDS``
+        sizes (tuple[int, ...]): Page sizes in bytes
+        functions (tuple[str, ...]): Functions from ``FUNCTIONS``
+        runs (int): Most timed runs per page and function
+        budget (float): Seconds of timed runs per page and function
+        seed (int): Seed of the page generator
+        progress (Callable[[str], None] | None): Called with a line of progress after each benchmark
+        memory (bool): Report tracemalloc peak and retained memory per stage instead of timings
+        top (int): Allocation sites to report per stage in memory mode
+
+    Returns:
+        dict: The environment, the configuration and one result per page and function, ready to dump as JSON
+    """
+    results = []
+    for kind in kinds:
+        for size in sizes:
+            html = generate_page(kind, size, seed)
+            for function_name in functions:
+                if memory:
+                    result = {"kind": kind, **memory_profile(function_name, html, top)}
+                    line = f"peak {result['peak_bytes'] / 1e6:.1f} MB, retained {result['retained_bytes'] / 1e6:.1f} MB"
+                else:
+                    result = {"kind": kind, **benchmark(function_name, html, runs, budget)}
+                    line = (
+                        f"{result['throughput_mb_per_s']:.2f} MB/s, {result['pages_per_s']:.1f} pages/s, "
+                        f"p50 {result['latency_seconds']['p50'] * 1000:.1f} ms, "
+                        f"p99 {result['latency_seconds']['p99'] * 1000:.1f} ms"
+                    )
+                results.append(result)
+                if progress is not None:
+                    progress(f"{function_name} {kind} {result['size_bytes']:,} B: {line}")
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "beautifulsoup4": bs4.__version__,
+        },
+        "config": {
+            "kinds": list(kinds),
+            "sizes": list(sizes),
+            "mode": "memory" if memory else "time",
+            "runs": runs,
+            "budget": budget,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark simplify_html on a generated corpus of realistic pages.")
+    parser.add_argument(
+        "--kinds",
+        default=",".join(PAGE_KINDS),
+        help=f"Comma-separated page kinds (default: {','.join(PAGE_KINDS)})",
+    )
+    parser.add_argument(
+        "--sizes",
+        default=",".join(DEFAULT_SIZES),
+        help=f"Comma-separated page sizes from 10KB to 50MB (default: {','.join(DEFAULT_SIZES)})",
+    )
+    parser.add_argument(
+        "--functions",
+        default=",".join(FUNCTIONS),
+        help=f"Comma-separated functions to benchmark (default: {','.join(FUNCTIONS)})",
+    )
+    parser.add_argument("--runs", type=int, default=5, help="Most timed runs per page and function (default: 5)")
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=10.0,
+        metavar="SECONDS",
+        help="Stop timing a page once this much time has passed; one run always completes (default: 10)",
+    )
+    parser.add_argument(
+        "--memory",
+        action="store_true",
+        help="Report tracemalloc peak and retained memory per stage, with the top allocation sites, instead of timings",
+    )
+    parser.add_argument(
+        "--top", type=int, default=10, help="Allocation sites to report per stage in memory mode (default: 10)"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the page generator (default: 0)")
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=argparse.FileType("w"),
+        default=sys.stdout,
+        help="JSON results file (default: write to stdout)",
+    )
+    args = parser.parse_args()
+
+    kinds = tuple(args.kinds.split(","))
+    functions = tuple(args.functions.split(","))
+    for name, known in (*((kind, PAGE_KINDS) for kind in kinds), *((function, FUNCTIONS) for function in functions)):
+        if name not in known:
+            parser.error(f"unknown name {name!r}, expected one of {', '.join(known)}")
+    try:
+        sizes = tuple(parse_size(size) for size in args.sizes.split(","))
+    except ValueError as error:
+        parser.error(str(error))
+
+    try:
+        results = run_benchmarks(
+            kinds,
+            sizes,
+            functions,
+            args.runs,
+            args.budget,
+            args.seed,
+            lambda line: print(line, file=sys.stderr),
+            args.memory,
+            args.top,
+        )
+        json.dump(results, args.output, indent=2)
+        args.output.write("\n")
+    finally:
+        if args.output != sys.stdout:
+            args.output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,92 +1,145 @@
 import argparse
 import base64
+import cProfile
+import gc
+import glob
+import gzip
+import hashlib
 import html
 import json
+import os
+import pstats
 import re
+import signal
+import socket
+import socketserver
+import stat
+import statistics
 import sys
-from urllib.parse import unquote
+import threading
+import time
+import zlib
+from collections import deque
+from collections.abc import Callable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Executor, ProcessPoolExecutor, as_completed, wait
+from contextlib import nullcontext, suppress
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field, replace
+from functools import lru_cache, partial
+from html import unescape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import chain
+from typing import BinaryIO
+from urllib.parse import parse_qs, unquote, urlsplit
 
-from bs4 import BeautifulSoup, Comment, NavigableString
+from bs4 import (
+    BeautifulSoup,
+    Comment,
+    Declaration,
+    Doctype,
+    NavigableString,
+    PageElement,
+    ProcessingInstruction,
+    Tag,
+    UnicodeDammit,
+)
+from bs4.element import AttributeValueWithCharsetSubstitution
 
 from tailwind import Tailwind
 
 
-def extract_ssr_data(html_content):
-    soup = BeautifulSoup(html_content, "html.parser")
+def extract_ssr_data(html_content, hooks=None):
+    """
+    Extract the server-side rendered state embedded in a page as JSON scripts, script assignments or attributes.
 
-    ssr_candidates = []
+    Args:
+        html_content (str): The page
+        hooks (list[SimplifyHooks] | None): Callbacks around the ``parse``, ``json_scripts``, ``inline_scripts`` and
+            ``data_attributes`` stages; without them the stages are not instrumented
 
-    # 1. <script type="application/json">
-    for script in soup.find_all("script", type="application/json"):
-        if script.get("id", "").lower() in {"__ssr_data__", "ssr-data", "__next_data__"} or "ssr" in script.get("id", "").lower():
-            try:
-                ssr_candidates.append(json.loads(script.string))
-            except Exception:
-                pass
-
-    # 2. Inline JS assignment: window.ssrData = {...};
-    for script in soup.find_all("script", type=lambda x: x in [None, "text/javascript"]):
-        script_text = script.string or ""
-        # Match window.ssrData = { ... };
-        match = re.search(r"window\.[\w_]+(?:\.[\w_]+)*\s*=\s*({[\s\S]*})\s*;?", script_text, re.DOTALL)
-        if match:
-            try:
-                # Clean up the JSON string by removing extra whitespace and newlines
-                json_str = re.sub(r'\s+', ' ', match.group(1)).strip()
-                ssr_json = json.loads(json_str)
-                ssr_candidates.append(ssr_json)
-            except Exception:
-                pass
-
-        # 3. Match JSON.parse("{...}") style
-        match = re.search(r'JSON\.parse\(\s*"(.*?)"\s*\)', script_text, re.DOTALL)
-        if match:
-            try:
-                json_str = match.group(1)
-                json_str = json_str.encode().decode("unicode_escape")  # decode escaped characters
-                ssr_json = json.loads(json_str)
-                ssr_candidates.append(ssr_json)
-            except Exception:
-                pass
-
-        # 4. Match base64-decoded SSR
-        match = re.search(r'atob\("([^"]+)"(?:\.replace\(/&#x3D;/g,"="\))?\)', script_text)
-        if match:
-            try:
-                base64_data = match.group(1).replace("&#x3D;", "=")  # handle HTML entity
-                decoded = base64.b64decode(base64_data)
-                # If escape(...) and decodeURIComponent(...) are used
-                decoded = html.unescape(decoded.decode("utf-8"))  # handles escape()
-                decoded = unquote(decoded)  # handles decodeURIComponent()
-                ssr_json = json.loads(decoded)
-                ssr_candidates.append(ssr_json)
-                print(4)
-            except Exception:
-                pass
-
-    # 5. <div id="..." data-ssr='...'>
-    for tag in soup.find_all(True, attrs={"data-ssr": True}):
-        try:
-            data = json.loads(tag.attrs["data-ssr"])
-            ssr_candidates.append(data)
-        except Exception:
-            pass
+    Returns:
+        list: The decoded SSR payloads, in the order they were found
+    """
+    stats = SimplifyStats(input_bytes=len(html_content.encode())) if hooks else None
+    recorder = _StageRecorder(stats, tuple(hooks)) if hooks else None
+    try:
+        with _stage(recorder, "parse"):
+            soup = BeautifulSoup(html_content, "html.parser")
+            if recorder is not None:
+                recorder.soup = soup
 
-    return ssr_candidates
+        ssr_candidates = []
 
+        with _stage(recorder, "json_scripts"):
+            # 1. <script type="application/json">
+            for script in soup.find_all("script", type="application/json"):
+                if script.get("id", "").lower() in {"__ssr_data__", "ssr-data", "__next_data__"} or "ssr" in script.get("id", "").lower():
+                    try:
+                        ssr_candidates.append(json.loads(script.string))
+                    except Exception:
+                        pass
 
-def is_tailwind_class(class_name: str) -> bool:
-    """
-    Check if a class name is likely a Tailwind CSS class using the Tailwind parser.
+        with _stage(recorder, "inline_scripts"):
+            # 2. Inline JS assignment: window.ssrData = {...};
+            for script in soup.find_all("script", type=lambda x: x in [None, "text/javascript"]):
+                script_text = script.string or ""
+                # Match window.ssrData = { ... };
+                match = re.search(r"window\.[\w_]+(?:\.[\w_]+)*\s*=\s*({[\s\S]*})\s*;?", script_text, re.DOTALL)
+                if match:
+                    try:
+                        # Clean up the JSON string by removing extra whitespace and newlines
+                        json_str = re.sub(r'\s+', ' ', match.group(1)).strip()
+                        ssr_json = json.loads(json_str)
+                        ssr_candidates.append(ssr_json)
+                    except Exception:
+                        pass
 
-    Args:
-        class_name (str): The class name to check
+                # 3. Match JSON.parse("{...}") style
+                match = re.search(r'JSON\.parse\(\s*"(.*?)"\s*\)', script_text, re.DOTALL)
+                if match:
+                    try:
+                        json_str = match.group(1)
+                        json_str = json_str.encode().decode("unicode_escape")  # decode escaped characters
+                        ssr_json = json.loads(json_str)
+                        ssr_candidates.append(ssr_json)
+                    except Exception:
+                        pass
 
-    Returns:
-        bool: True if the class appears to be a Tailwind class
-    """
-    # Common semantic class names that should be preserved even though they might match patterns
-    common_semantic_classes = [
+                # 4. Match base64-decoded SSR
+                match = re.search(r'atob\("([^"]+)"(?:\.replace\(/&#x3D;/g,"="\))?\)', script_text)
+                if match:
+                    try:
+                        base64_data = match.group(1).replace("&#x3D;", "=")  # handle HTML entity
+                        decoded = base64.b64decode(base64_data)
+                        # If escape(...) and decodeURIComponent(...) are used
+                        decoded = html.unescape(decoded.decode("utf-8"))  # handles escape()
+                        decoded = unquote(decoded)  # handles decodeURIComponent()
+                        ssr_json = json.loads(decoded)
+                        ssr_candidates.append(ssr_json)
+                    except Exception:
+                        pass
+
+        with _stage(recorder, "data_attributes"):
+            # 5. <div id="..." data-ssr='...'>
+            for tag in soup.find_all(True, attrs={"data-ssr": True}):
+                try:
+                    data = json.loads(tag.attrs["data-ssr"])
+                    ssr_candidates.append(data)
+                except Exception:
+                    pass
+
+        return ssr_candidates
+    finally:
+        for hook in hooks or ():
+            hook.on_document_done(stats)
+
+
+# The Tailwind tables are only read, so a single instance is built at import
+_TAILWIND = Tailwind()
+
+# Common semantic class names that should be preserved even though they might match patterns
+_SEMANTIC_CLASS_NAMES = frozenset(
+    [
         "container",
         "wrapper",
         "section",
@@ -115,9 +168,118 @@ def is_tailwind_class(class_name: str) -> bool:
         "custom-class",
         "my-wrapper",
     ]
+)
+
+# Other common Tailwind patterns
+_TAILWIND_PATTERNS = [
+    r"^flex(-\w+)?$",
+    r"^grid(-\w+)?$",
+    r"^justify-\w+$",
+    r"^items-\w+$",
+    r"^space-[xy]-\d+$",
+    r"^text-(xs|sm|base|lg|xl|2xl|3xl|4xl|5xl|6xl|7xl|8xl|9xl)$",
+    r"^font-(thin|extralight|light|normal|medium|semibold|bold|extrabold|black)$",
+    r"^rounded(-\w+)?$",
+    r"^shadow(-\w+)?$",
+    r"^opacity-\d+$",
+    r"^z-\d+$",
+    r"^order-\d+$",
+    r"^col-span-\d+$",
+    r"^row-span-\d+$",
+    r"^translate-[xy]-\d+$",
+    r"^scale-\d+$",
+    r"^rotate-\d+$",
+    r"^skew-[xy]-\d+$",
+    r"^duration-\d+$",
+    r"^delay-\d+$",
+    r"^ease-\w+$",
+    r"^blur(-\w+)?$",
+    r"^brightness-\d+$",
+    r"^contrast-\d+$",
+    r"^grayscale(-\d+)?$",
+    r"^hue-rotate-\d+$",
+    r"^invert(-\d+)?$",
+    r"^saturate-\d+$",
+    r"^sepia(-\d+)?$",
+    # Add patterns for pointer events and positioning
+    r"^pointer-events-\w+$",
+    r"^absolute$",
+    r"^relative$",
+    r"^fixed$",
+    r"^sticky$",
+    r"^static$",
+    # Add patterns for group hover states
+    r"^group-hover:[a-zA-Z0-9-]+$",
+    # Add patterns for positioning utilities
+    r"^-(top|right|bottom|left)-\d+$",
+    # Add patterns for hover-related classes
+    r"^hover[A-Z][a-zA-Z0-9]+$",
+    # Add patterns for width and height utilities
+    r"^w-(\d+|full|auto|screen)$",
+    r"^h-(\d+|full|auto|screen)$",
+    # Add patterns for responsive variants
+    r"^(sm|md|lg|xl|2xl):[\w-]+(\[\d+px\])?$",
+    # Add patterns for flex utilities
+    r"^flex-(none|auto|initial|1|grow|shrink)$",
+    # Add patterns for gap utilities
+    r"^gap-\d+$",
+    # Add patterns for hidden and screen-reader utilities
+    r"^hidden$",
+    r"^(not-)?sr-only$",
+    # Add pattern for group utility
+    r"^group$",
+]
+_TAILWIND_PATTERN_RE = re.compile("|".join(f"(?:{pattern})" for pattern in _TAILWIND_PATTERNS))
+# Colons separate variants from the utility, except inside arbitrary values such as [&:hover]
+_TAILWIND_VARIANT_SPLIT_RE = re.compile(r":(?![^\[]*\])")
+_TAILWIND_VARIANT_RE = re.compile(
+    r"^(?:(?:max-)?(?:sm|md|lg|xl|2xl)|dark|print|motion-(?:safe|reduce)|(?:group|peer)(?:-[\w-]+)?|hover|active"
+    r"|focus(?:-within|-visible)?|visited|disabled|checked|open|first|last|odd|even|before|after|placeholder"
+    r"|(?:aria|data)-[\w-]+|\[[^\]]*\])$"
+)
+# Display utilities, which only read as Tailwind behind a variant (a bare "table" or "block" may be a site's own class)
+_TAILWIND_DISPLAY_UTILITIES = frozenset(
+    [
+        "block",
+        "inline",
+        "inline-block",
+        "flex",
+        "inline-flex",
+        "grid",
+        "inline-grid",
+        "table",
+        "inline-table",
+        "table-cell",
+        "table-row",
+        "flow-root",
+        "contents",
+        "list-item",
+        "not-sr-only",
+    ]
+)
+
+
+def _split_tailwind_variants(class_name: str) -> tuple[list[str], str]:
+    """
+    Split a class name such as ``md:hover:block`` into its variants and its utility.
+    """
+    *variants, utility = _TAILWIND_VARIANT_SPLIT_RE.split(class_name)
+    return variants, utility
+
+
+@lru_cache(maxsize=8192)
+def is_tailwind_class(class_name: str) -> bool:
+    """
+    Check if a class name is likely a Tailwind CSS class using the Tailwind parser.
+
+    Args:
+        class_name (str): The class name to check
 
+    Returns:
+        bool: True if the class appears to be a Tailwind class
+    """
     # Preserve these common semantic class names
-    if class_name in common_semantic_classes:
+    if class_name in _SEMANTIC_CLASS_NAMES:
         return False
 
     # Also preserve classes with semantic prefixes/suffixes
@@ -131,14 +293,20 @@ def is_tailwind_class(class_name: str) -> bool:
     ):
         return False
 
-    # Initialize Tailwind parser
-    tw = Tailwind()
+    # Utilities behind variants such as md:, hover: or dark: apply on some screens or states only
+    variants, utility = _split_tailwind_variants(class_name)
+    if (
+        variants
+        and all(_TAILWIND_VARIANT_RE.match(variant) for variant in variants)
+        and (utility in _TAILWIND_DISPLAY_UTILITIES or is_tailwind_class(utility))
+    ):
+        return True
 
     # Split the class name into parts
     parts = class_name.split("-")
 
     # Check if the first part is a known Tailwind prefix
-    if parts[0] in tw.classes:
+    if parts[0] in _TAILWIND.classes:
         return True
 
     # Check for padding and margin utilities with decimal values
@@ -159,73 +327,107 @@ def is_tailwind_class(class_name: str) -> bool:
         return True
 
     # Check for color utilities like bg-gray-100, text-red-500, etc.
-    if len(parts) >= 3 and parts[0] in ["bg", "text", "border"] and parts[1] in tw.colors:
+    if len(parts) >= 3 and parts[0] in ["bg", "text", "border"] and parts[1] in _TAILWIND.colors:
         return True
 
     # Check for other common Tailwind patterns
-    common_patterns = [
-        r"^flex(-\w+)?$",
-        r"^grid(-\w+)?$",
-        r"^justify-\w+$",
-        r"^items-\w+$",
-        r"^space-[xy]-\d+$",
-        r"^text-(xs|sm|base|lg|xl|2xl|3xl|4xl|5xl|6xl|7xl|8xl|9xl)$",
-        r"^font-(thin|extralight|light|normal|medium|semibold|bold|extrabold|black)$",
-        r"^rounded(-\w+)?$",
-        r"^shadow(-\w+)?$",
-        r"^opacity-\d+$",
-        r"^z-\d+$",
-        r"^order-\d+$",
-        r"^col-span-\d+$",
-        r"^row-span-\d+$",
-        r"^translate-[xy]-\d+$",
-        r"^scale-\d+$",
-        r"^rotate-\d+$",
-        r"^skew-[xy]-\d+$",
-        r"^duration-\d+$",
-        r"^delay-\d+$",
-        r"^ease-\w+$",
-        r"^blur(-\w+)?$",
-        r"^brightness-\d+$",
-        r"^contrast-\d+$",
-        r"^grayscale(-\d+)?$",
-        r"^hue-rotate-\d+$",
-        r"^invert(-\d+)?$",
-        r"^saturate-\d+$",
-        r"^sepia(-\d+)?$",
-        # Add patterns for pointer events and positioning
-        r"^pointer-events-\w+$",
-        r"^absolute$",
-        r"^relative$",
-        r"^fixed$",
-        r"^sticky$",
-        r"^static$",
-        # Add patterns for group hover states
-        r"^group-hover:[a-zA-Z0-9-]+$",
-        # Add patterns for positioning utilities
-        r"^-(top|right|bottom|left)-\d+$",
-        # Add patterns for hover-related classes
-        r"^hover[A-Z][a-zA-Z0-9]+$",
-        # Add patterns for width and height utilities
-        r"^w-(\d+|full|auto|screen)$",
-        r"^h-(\d+|full|auto|screen)$",
-        # Add patterns for responsive variants
-        r"^(sm|md|lg|xl|2xl):[\w-]+(\[\d+px\])?$",
-        # Add patterns for flex utilities
-        r"^flex-(none|auto|initial|1|grow|shrink)$",
-        # Add patterns for gap utilities
-        r"^gap-\d+$",
-        # Add pattern for hidden utility
-        r"^hidden$",
-        # Add pattern for group utility
-        r"^group$",
-    ]
 
-    for pattern in common_patterns:
-        if re.match(pattern, class_name):
-            return True
+    return _TAILWIND_PATTERN_RE.match(class_name) is not None
 
-    return False
+
+def _is_decomposed(element: PageElement) -> bool:
+    """
+    Check whether ``element`` was decomposed, for example together with a removed ancestor.
+
+    ``PageElement.decomposed`` reads a missing attribute on live tags, which bs4 turns into a search of the whole
+    subtree; reading the flag from the instance dictionary keeps the check constant-time on deep documents.
+    """
+    return element.__dict__.get("_decomposed", False)
+
+
+def _decompose_all(nodes: list[PageElement]) -> None:
+    """
+    Decompose many elements at once, rebuilding each affected ``contents`` list a single time.
+
+    Removing children one by one deletes from the middle of their parent's ``contents`` every time, which is
+    quadratic for containers with hundreds of thousands of children.
+    """
+    parents = {}
+    for node in nodes:
+        if node.parent is not None:
+            parents.setdefault(id(node.parent), (node.parent, set()))[1].add(id(node))
+    for parent, removed in parents.values():
+        parent.contents = [child for child in parent.contents if id(child) not in removed]
+    for node in nodes:
+        # Skip elements that were removed together with an ancestor in the list
+        if _is_decomposed(node):
+            continue
+        # Without a parent, decompose() only unlinks the node from its siblings and neighbours
+        node.parent = None
+        node.decompose()
+
+
+def _last_descendant(node: PageElement) -> PageElement:
+    """
+    Return the last node of the subtree rooted at ``node`` in document order.
+    """
+    while isinstance(node, Tag) and node.contents:
+        node = node.contents[-1]
+    return node
+
+
+def _swap_children(parent: Tag, swaps: dict[int, list[PageElement]]) -> None:
+    """
+    Replace children of ``parent``, keyed by ``id``, with runs of detached nodes, rebuilding ``contents`` a single
+    time.
+
+    This is ``replace_with`` for many children at once; the document-order and sibling links are spliced directly.
+    """
+    for old in parent.contents:
+        nodes = swaps.get(id(old))
+        if nodes is None:
+            continue
+        old_last = _last_descendant(old)
+        previous, previous_element = old.previous_sibling, old.previous_element
+        following, following_element = old.next_sibling, old_last.next_element
+        for node in nodes:
+            node.parent = parent
+            node.previous_sibling, node.previous_element = previous, previous_element
+            if previous is not None:
+                previous.next_sibling = node
+            if previous_element is not None:
+                previous_element.next_element = node
+            previous, previous_element = node, _last_descendant(node)
+        previous.next_sibling, previous_element.next_element = following, following_element
+        if following is not None:
+            following.previous_sibling = previous
+        if following_element is not None:
+            following_element.previous_element = previous_element
+        old.parent = old.previous_sibling = old.next_sibling = old.previous_element = old_last.next_element = None
+    parent.contents = [node for child in parent.contents for node in swaps.get(id(child), (child,))]
+
+
+def _remove_tailwind_classes_from(element: Tag) -> None:
+    """
+    Remove Tailwind CSS classes from a single element while preserving other classes.
+    """
+    # Get the class attribute value
+    class_attr = element.attrs["class"]
+
+    # Handle both string and list class attributes
+    if isinstance(class_attr, str):
+        classes = class_attr.split()
+    else:
+        classes = class_attr
+
+    # Filter out Tailwind classes
+    non_tailwind_classes = [cls for cls in classes if not is_tailwind_class(cls)]
+
+    if non_tailwind_classes:
+        element.attrs["class"] = non_tailwind_classes
+    else:
+        # If all classes were Tailwind classes, remove the class attribute entirely
+        del element.attrs["class"]
 
 
 def remove_tailwind_classes(soup: BeautifulSoup) -> None:
@@ -237,165 +439,3630 @@ def remove_tailwind_classes(soup: BeautifulSoup) -> None:
     """
     for element in soup.find_all(True):  # Find all elements
         if "class" in element.attrs:  # Check if element has class attribute
-            # Get the class attribute value
-            class_attr = element.attrs["class"]
+            _remove_tailwind_classes_from(element)
 
-            # Handle both string and list class attributes
-            if isinstance(class_attr, str):
-                classes = class_attr.split()
-            else:
-                classes = class_attr
 
-            # Filter out Tailwind classes
-            non_tailwind_classes = [cls for cls in classes if not is_tailwind_class(cls)]
+@dataclass(frozen=True)
+class AttributePolicy:
+    """
+    Controls which attributes survive simplification.
+
+    Rules are checked in order: ``allow`` names are always kept, ``deny`` names and ``deny_prefixes`` are removed,
+    ``allow_prefixes`` are kept, and everything else is kept only if ``keep_unlisted`` is set. The ``class``
+    attribute, when kept, is additionally filtered for Tailwind classes.
+
+    Attributes:
+        allow (tuple[str, ...]): Attribute names that are always kept
+        allow_prefixes (tuple[str, ...]): Attribute name prefixes that are kept
+        deny (tuple[str, ...]): Attribute names that are removed
+        deny_prefixes (tuple[str, ...]): Attribute name prefixes that are removed (event handlers, tracking, framework
+            noise)
+        keep_unlisted (bool): Keep attributes that match no rule
+        max_query_length (int | None): Query strings in ``href``/``src`` longer than this are replaced with ``?...``
+        tag_overrides (dict[str, AttributePolicy]): Policies that replace this one for specific tags
+    """
+
+    allow: tuple[str, ...] = ("aria-label",)
+    allow_prefixes: tuple[str, ...] = ()
+    deny: tuple[str, ...] = (
+        "style",
+        "ping",
+        "nonce",
+        "integrity",
+        "crossorigin",
+        "referrerpolicy",
+        "decoding",
+        "loading",
+        "fetchpriority",
+        "jsaction",
+        "jscontroller",
+        "jsname",
+        "jslog",
+        "data-reactid",
+        "data-reactroot",
+    )
+    deny_prefixes: tuple[str, ...] = (
+        "on",
+        "aria-",
+        "data-gtm",
+        "data-ga-",
+        "data-track",
+        "data-analytics",
+        "data-v-",
+        "ng-",
+        "_ngcontent",
+        "_nghost",
+    )
+    keep_unlisted: bool = True
+    max_query_length: int | None = 64
+    tag_overrides: dict[str, "AttributePolicy"] = field(default_factory=dict)
+
+
+DEFAULT_ATTRIBUTE_POLICY = AttributePolicy()
+
+_URL_ATTRIBUTES = ("href", "src")
+
+
+class _AttributeRules:
+    """
+    An ``AttributePolicy`` compiled into sets and prefix tuples, so each attribute is checked in constant time.
+    """
+
+    def __init__(self, policy: AttributePolicy):
+        self.allow = frozenset(policy.allow)
+        self.deny = frozenset(policy.deny)
+        self.allow_prefixes = tuple(policy.allow_prefixes)
+        self.deny_prefixes = tuple(policy.deny_prefixes)
+        self.keep_unlisted = policy.keep_unlisted
+        self.max_query_length = policy.max_query_length
+        self.tag_rules = {tag: _AttributeRules(override) for tag, override in policy.tag_overrides.items()}
+
+    def keeps(self, name: str) -> bool:
+        """
+        Check whether an attribute named ``name`` is kept.
+        """
+        if name in self.allow:
+            return True
+        if name in self.deny or name.startswith(self.deny_prefixes):
+            return False
+        if self.allow_prefixes and name.startswith(self.allow_prefixes):
+            return True
+        return self.keep_unlisted
+
+    def apply(self, element: Tag) -> None:
+        """
+        Filter the attributes of ``element`` in place, including its Tailwind classes.
+        """
+        rules = self.tag_rules.get(element.name, self) if self.tag_rules else self
+        attrs = element.attrs
+        for name in [name for name in attrs if not rules.keeps(name)]:
+            del attrs[name]
+
+        if rules.max_query_length is not None:
+            for name in _URL_ATTRIBUTES:
+                value = attrs.get(name)
+                if isinstance(value, str):
+                    base, _, query = value.partition("?")
+                    if len(query) > rules.max_query_length:
+                        attrs[name] = f"{base}?..."
+
+        if "class" in attrs:
+            _remove_tailwind_classes_from(element)
+
+
+@dataclass(frozen=True)
+class FoldPolicy:
+    """
+    Controls how runs of repeated children (list items, similar divs, rows, options) are folded.
+
+    Attributes:
+        keep_first (int): Number of leading items to keep
+        keep_last (int): Number of trailing items to keep
+        min_items (int): Runs shorter than this are never folded
+        annotation (str): Marker inserted in place of the folded items; ``{count}`` and ``{tag}`` are substituted
+        as_comment (bool): Insert the marker as an HTML comment (``<!-- 497 more li -->``) instead of text
+        tags (tuple[str, ...]): Container tags whose children are considered for folding
+        max_columns (int | None): Truncate table rows wider than this many cells, at least 1 (default: keep all
+            columns)
+    """
+
+    keep_first: int = 3
+    keep_last: int = 0
+    min_items: int = 4
+    annotation: str = "... (+{count})"
+    as_comment: bool = False
+    tags: tuple[str, ...] = ("ul", "ol", "div", "table", "select")
+    max_columns: int | None = None
+
+    def __post_init__(self):
+        if self.max_columns is not None and self.max_columns < 1:
+            raise ValueError(f"max_columns must be at least 1, got {self.max_columns}")
+
+    def marker(self, count: int, tag: str) -> NavigableString:
+        """
+        Build the node that replaces ``count`` folded ``tag`` items.
+        """
+        text = self.annotation.format(count=count, tag=tag)
+        marker = Comment(f" {text} ") if self.as_comment else NavigableString(text)
+        # Remember the count so a later, stronger fold can merge this marker into its own
+        marker.folded = count
+        return marker
+
+
+DEFAULT_FOLD_POLICY = FoldPolicy()
+
+
+def _folded_count(node) -> int:
+    """
+    Return how many items a marker left by an earlier fold stands for, or 0 for any other node.
+    """
+    return getattr(node, "folded", 0) if isinstance(node, NavigableString) else 0
+
+
+def _pop_markers(nodes: list) -> int:
+    """
+    Extract the fold markers among ``nodes`` and return the total count they stood for.
+    """
+    count = 0
+    for node in nodes:
+        if _folded_count(node):
+            count += node.folded
+            node.extract()
+    return count
+
+
+def _find_list_tag(nodes: list, min_count: int = 3) -> str | None:
+    """
+    Find the most frequent child tag that appears at least ``min_count`` times.
+    """
+    # Detect list-like elements by checking patterns
+    # 1. Check if there are multiple <li> tags (for ul, ol)
+    # 2. Check if there are multiple <a> tags (common for linked lists)
+    # 3. Check if there are multiple similar tags
+    list_candidates = {}
+    for node in nodes:
+        if not isinstance(node, Tag):
+            continue
+        list_candidates[node.name] = list_candidates.get(node.name, 0) + 1
+
+    list_tag = None
+    max_count = min_count - 1  # At least 3 elements to be considered a list by default
+    for tag, count in list_candidates.items():
+        if count > max_count:
+            max_count = count
+            list_tag = tag
+    return list_tag
+
+
+def fold_children(element: Tag, policy: FoldPolicy = DEFAULT_FOLD_POLICY) -> int:
+    """
+    Fold the repeated children of a single container according to ``policy``.
+
+    Args:
+        element (Tag): The container whose direct children are folded
+        policy (FoldPolicy): The fold policy to apply
+
+    Returns:
+        int: Number of items that were folded away
+    """
+    children = list(element.children)
+    list_tag = _find_list_tag(children, min(3, policy.min_items))
+    if list_tag is None:
+        return 0
+
+    total = sum(1 for node in children if isinstance(node, Tag) and node.name == list_tag)
+    head = policy.keep_first
+    tail_start = total - policy.keep_last
+    if total < policy.min_items or tail_start <= head:
+        return 0
 
-            if non_tailwind_classes:
-                element.attrs["class"] = non_tailwind_classes
+    count = tail_start - head + _pop_markers(children)
+    seen = 0
+    annotated = False
+    removed = []
+    for node in children:
+        if isinstance(node, Tag):
+            if node.name != list_tag:
+                continue
+            seen += 1
+            if head < seen <= tail_start:
+                if not annotated:
+                    node.insert_before(policy.marker(count, list_tag))
+                    annotated = True
+                removed.append(node)
+        elif isinstance(node, NavigableString) and not isinstance(node, Comment) and node.parent is element:
+            text = node.strip()
+            if not text or "," not in text:
+                continue
+            if seen == head and not annotated:
+                # Keep the comma after the last leading element and put the marker right after it
+                comma = NavigableString(", ")
+                node.replace_with(comma)
+                comma.insert_after(policy.marker(count, list_tag))
+                annotated = True
+            elif head < seen < tail_start or (seen == tail_start and not policy.keep_last):
+                removed.append(node)
             else:
-                # If all classes were Tailwind classes, remove the class attribute entirely
-                del element.attrs["class"]
+                # Keep the commas between kept elements
+                node.replace_with(NavigableString(", "))
+    _decompose_all(removed)
+    return count
 
 
-def simplify_html_for_llm(html: str) -> str:
+def _child_tags(element: Tag, names: tuple[str, ...]) -> list[Tag]:
     """
-    Simplifies HTML content by removing unnecessary elements for LLM processing.
+    Return the direct children of ``element`` whose tag name is in ``names``.
+    """
+    return [node for node in element.children if isinstance(node, Tag) and node.name in names]
+
+
+def _truncate_row(row: Tag, max_columns: int, policy: FoldPolicy) -> None:
+    """
+    Drop the cells of ``row`` beyond ``max_columns`` and mark how many were dropped.
+    """
+    cells = _child_tags(row, ("td", "th"))
+    if len(cells) <= max_columns:
+        return
+    cells[max_columns - 1].insert_after(policy.marker(len(cells) - max_columns, cells[max_columns].name))
+    _decompose_all(cells[max_columns:])
+
+
+def fold_table(table: Tag, policy: FoldPolicy = DEFAULT_FOLD_POLICY) -> int:
+    """
+    Fold the body rows of a table, keeping its header rows, and optionally truncate wide rows by column.
+
+    Rows are collected in a single pass over the table sections, so folded rows are never serialized.
 
     Args:
-        html (str): The HTML content to simplify
+        table (Tag): The table to fold
+        policy (FoldPolicy): The fold policy to apply
 
     Returns:
-        str: Simplified HTML with unnecessary elements removed
+        int: Number of body rows that were folded away
     """
-    soup = BeautifulSoup(html, "html.parser")
+    header_rows = []
+    body_rows = []
+    bodies = []
+    body_nodes = list(table.children)
+    for section in _child_tags(table, ("thead", "tbody", "tfoot", "tr")):
+        if section.name == "tr":
+            body_rows.append(section)
+        elif section.name == "tbody":
+            bodies.append(section)
+            body_rows.extend(_child_tags(section, ("tr",)))
+            body_nodes.extend(section.children)
+        else:
+            header_rows.extend(_child_tags(section, ("tr",)))
 
-    # Remove script and style elements
-    for element in soup.find_all(["script", "style"]):
-        element.decompose()
+    # A leading row made only of <th> cells is a header even without <thead>
+    if not header_rows and body_rows:
+        cells = _child_tags(body_rows[0], ("td", "th"))
+        if cells and all(cell.name == "th" for cell in cells):
+            header_rows.append(body_rows.pop(0))
 
-    # Remove comments
-    for comment in soup.find_all(string=lambda text: isinstance(text, Comment)):
-        comment.extract()
+    folded = 0
+    head = policy.keep_first
+    tail_start = len(body_rows) - policy.keep_last
+    if len(body_rows) >= policy.min_items and tail_start > head:
+        folded = tail_start - head
+        body_rows[head].insert_before(policy.marker(folded + _pop_markers(body_nodes), "tr"))
+        _decompose_all(body_rows[head:tail_start])
+        body_rows = body_rows[:head] + body_rows[tail_start:]
+        # Sections whose rows were all folded are left with whitespace at most; the marker keeps its own section
+        _decompose_all(
+            [
+                section
+                for section in bodies
+                if all(
+                    isinstance(node, NavigableString) and not _folded_count(node) and not node.strip()
+                    for node in section.contents
+                )
+            ]
+        )
 
-    # Remove meta tags
-    for meta in soup.find_all("meta"):
-        meta.decompose()
+    if policy.max_columns is not None:
+        for row in header_rows + body_rows:
+            _truncate_row(row, policy.max_columns, policy)
 
-    # Remove link tags (except for hyperlinks)
-    for link in soup.find_all("link"):
-        link.decompose()
+    return folded
 
-    # Remove noscript tags
-    for noscript in soup.find_all("noscript"):
-        noscript.decompose()
 
-    # Remove empty elements
-    for element in soup.find_all():
-        if len(element.get_text(strip=True)) == 0 and not element.find_all():
-            element.decompose()
+def fold_repeated_children(soup: BeautifulSoup, policy: FoldPolicy = DEFAULT_FOLD_POLICY) -> None:
+    """
+    Fold lists, similar divs, table rows and select options in a single pass over the containers.
+
+    Args:
+        soup (BeautifulSoup): The BeautifulSoup object to process
+        policy (FoldPolicy): The fold policy to apply
+    """
+    for element in soup.find_all(policy.tags):
+        # Skip containers that were removed together with a folded ancestor
+        if _is_decomposed(element):
+            continue
+        _checkpoint()
+        if element.name == "table":
+            fold_table(element, policy)
+        else:
+            fold_children(element, policy)
+
+
+_SEMANTIC_WRAPPER_TAGS = ("section", "article", "header", "footer", "main", "aside", "nav", "figure")
+
+
+@dataclass(frozen=True)
+class WrapperPolicy:
+    """
+    Controls which single-child wrapper elements are collapsed.
+
+    Attributes:
+        tags (tuple[str, ...]): Generic wrapper tags that are unwrapped when they have no attributes and a single
+            child element
+        preserve_semantic (bool): Keep semantic sectioning tags (``section``, ``article``, ``nav``, ...); when
+            ``False`` they are unwrapped like ``tags``
+    """
+
+    tags: tuple[str, ...] = ("div", "span")
+    preserve_semantic: bool = True
+
+    @property
+    def wrapper_tags(self) -> frozenset[str]:
+        """
+        Return every tag name that may be unwrapped under this policy.
+        """
+        return frozenset(self.tags if self.preserve_semantic else self.tags + _SEMANTIC_WRAPPER_TAGS)
+
+
+DEFAULT_WRAPPER_POLICY = WrapperPolicy()
+
+
+def _only_child_tag(element: Tag) -> tuple[Tag | None, bool, bool]:
+    """
+    Return the single child element of ``element`` if all of its other children are whitespace, else ``None``, and
+    whether there was whitespace before and after it.
+    """
+    only = None
+    space_before = space_after = False
+    for child in element.contents:
+        if isinstance(child, Tag):
+            if only is not None:
+                return None, False, False
+            only = child
+        elif not isinstance(child, NavigableString) or child.strip():
+            return None, False, False
+        elif only is None:
+            space_before = True
+        else:
+            space_after = True
+    return only, space_before, space_after
+
+
+def collapse_wrappers(soup: BeautifulSoup, policy: WrapperPolicy = DEFAULT_WRAPPER_POLICY) -> int:
+    """
+    Unwrap chains of attribute-less wrappers that hold a single child element, in one post-order pass.
+
+    ``<div><div><div><p>text</p></div></div></div>`` becomes ``<p>text</p>``, which shortens the output and the
+    depth of every later traversal.
+
+    Args:
+        soup (BeautifulSoup): The BeautifulSoup object to process
+        policy (WrapperPolicy): The wrapper policy to apply
+
+    Returns:
+        int: Number of unwrapped elements
+    """
+    wrapper_tags = policy.wrapper_tags
+    # Replacements per parent, applied together once all of the parent's children have been visited
+    swaps = {}
+    collapsed = 0
+    # Children come before their parents, so a whole chain collapses from the inside out
+    for element in reversed(list(soup.descendants)):
+        if not isinstance(element, Tag):
+            continue
+        if id(element) in swaps:
+            _swap_children(element, swaps.pop(id(element)))
+        if element.name not in wrapper_tags or element.attrs:
+            continue
+        child, space_before, space_after = _only_child_tag(element)
+        if child is not None:
+            # The wrapper kept its child apart from the text around it if it had whitespace or is a block, so a space
+            # is kept in its place
+            block = element.name in _MARKDOWN_BLOCK_TAGS
+            nodes = [child.extract()]
+            if element.previous_sibling is not None and (space_before or block):
+                nodes.insert(0, NavigableString(" "))
+            if element.next_sibling is not None and (space_after or block):
+                nodes.append(NavigableString(" "))
+            swaps.setdefault(id(element.parent), {})[id(element)] = nodes
+            collapsed += 1
+    if id(soup) in swaps:
+        _swap_children(soup, swaps.pop(id(soup)))
+    return collapsed
+
+
+@dataclass(frozen=True)
+class PayloadPolicy:
+    """
+    Controls how heavy, low-information payloads (inline SVG, data URIs, responsive image lists) are pruned.
+
+    Attributes:
+        svg_placeholder (str | None): Text that replaces the contents of inline ``<svg>`` elements; ``{title}`` is
+            substituted with the SVG title or ``aria-label``. ``None`` removes SVGs entirely
+        max_data_uri_length (int | None): ``data:`` URIs longer than this are truncated to their media type and
+            ``data_uri_marker``. ``None`` keeps data URIs as they are
+        data_uri_marker (str): Marker that replaces the payload of a truncated data URI
+        drop_attributes (tuple[str, ...]): Attributes that are removed from every element
+        remove_tags (tuple[str, ...]): Tags that are removed together with their contents
+    """
+
+    svg_placeholder: str | None = "[svg{title}]"
+    max_data_uri_length: int | None = 64
+    data_uri_marker: str = "..."
+    drop_attributes: tuple[str, ...] = ("srcset", "sizes")
+    remove_tags: tuple[str, ...] = ("template",)
+
+
+DEFAULT_PAYLOAD_POLICY = PayloadPolicy()
+
+_DATA_URI_RE = re.compile(r"data:([^,\s\"')]*),[^\s\"')]*")
+_SVG_KEPT_ATTRIBUTES = ("id", "class", "role", "aria-label")
+
+
+def _replace_svg(svg: Tag, placeholder: str) -> None:
+    """
+    Replace the contents of an inline SVG with a short text placeholder.
+    """
+    title_tag = svg.find("title")
+    title = svg.get("aria-label") or (title_tag.get_text(strip=True) if title_tag else "")
+    _decompose_all(list(svg.contents))
+    svg.attrs = {name: value for name, value in svg.attrs.items() if name in _SVG_KEPT_ATTRIBUTES}
+    svg.append(NavigableString(placeholder.format(title=f": {title}" if title else "")))
+
+
+def prune_heavy_payloads(soup: BeautifulSoup, policy: PayloadPolicy = DEFAULT_PAYLOAD_POLICY) -> None:
+    """
+    Remove or shrink heavy payloads so that later stages process far fewer nodes and bytes.
+
+    Args:
+        soup (BeautifulSoup): The BeautifulSoup object to process
+        policy (PayloadPolicy): The payload policy to apply
+    """
+    max_length = policy.max_data_uri_length
+
+    def truncate(match: re.Match) -> str:
+        if len(match.group(0)) <= max_length:
+            return match.group(0)
+        return f"data:{match.group(1)},{policy.data_uri_marker}"
 
-    # Remove Tailwind classes
-    remove_tailwind_classes(soup)
+    for element in soup.find_all(True):
+        # Skip elements that were removed together with a pruned ancestor
+        if _is_decomposed(element):
+            continue
+        _checkpoint()
 
-    # Fold lists or similar divs with more than 3 items
-    for element in soup.find_all(["ul", "ol", "div"]):
-        # Skip if element doesn't have direct children
-        if not element.find_all(recursive=False):
+        if element.name in policy.remove_tags:
+            element.decompose()
             continue
 
-        # Get all nodes (elements and text nodes)
-        nodes = []
-        for node in element.children:
-            if isinstance(node, NavigableString):
-                if node.strip():
-                    nodes.append(node)
+        if element.name == "svg":
+            if policy.svg_placeholder is None:
+                element.decompose()
             else:
-                nodes.append(node)
+                _replace_svg(element, policy.svg_placeholder)
+            continue
 
-        # Detect list-like elements by checking patterns
-        # 1. Check if there are multiple <li> tags (for ul, ol)
-        # 2. Check if there are multiple <a> tags (common for linked lists)
-        # 3. Check if there are multiple similar tags
-        list_candidates = {}
-        for node in nodes:
-            if not hasattr(node, "name") or not node.name:
+        for name in policy.drop_attributes:
+            element.attrs.pop(name, None)
+
+        if max_length is not None:
+            for name, value in element.attrs.items():
+                if isinstance(value, str) and "data:" in value:
+                    element.attrs[name] = _DATA_URI_RE.sub(truncate, value)
+
+
+_HIDDEN_STYLE_RE = re.compile(
+    r"(?:^|;)\s*(?:display\s*:\s*none|visibility\s*:\s*hidden|(?:left|top)\s*:\s*-\d{4,}px)\s*(?:!important\s*)?(?:;|$)",
+    re.IGNORECASE,
+)
+_HIDDEN_CLASSES = ("hidden", "sr-only")
+
+
+def _is_hidden(element: Tag, classes: bool) -> bool:
+    """
+    Check whether an element is not rendered, using only its own attributes.
+    """
+    attrs = element.attrs
+    if "hidden" in attrs and attrs["hidden"] != "until-found":
+        return True
+    if attrs.get("aria-hidden") == "true":
+        return True
+    if element.name == "input" and str(attrs.get("type", "")).lower() == "hidden":
+        return True
+    if element.name == "dialog" and "open" not in attrs:
+        return True
+    style = attrs.get("style")
+    if style and _HIDDEN_STYLE_RE.search(style):
+        return True
+    if classes:
+        hidden = False
+        for name in attrs.get("class") or ():
+            if not is_tailwind_class(name):
                 continue
-            if node.name not in list_candidates:
-                list_candidates[node.name] = 0
-            list_candidates[node.name] += 1
-
-        # Find the most frequent tag that appears more than once
-        list_tag = None
-        max_count = 2  # At least 3 elements to be considered a list
-        for tag, count in list_candidates.items():
-            if count > max_count:
-                max_count = count
-                list_tag = tag
-
-        # Find elements that are considered part of the list
-        list_elements = [node for node in nodes if hasattr(node, "name") and node.name == list_tag] if list_tag else []
-
-        if len(list_elements) > 3:
-            # Keep track of what we've seen
-            seen_elements = 0
-            last_kept_element = None
-
-            # Process all nodes
-            for node in list(element.children):
-                if hasattr(node, "name") and node.name == list_tag:
-                    seen_elements += 1
-                    if seen_elements > 3:
-                        node.decompose()
-                    else:
-                        last_kept_element = node
-                elif isinstance(node, NavigableString):
-                    text = node.strip()
-                    if text and "," in text:
-                        if seen_elements > 3:
-                            node.extract()
-                        elif seen_elements == 3:
-                            # Keep the comma after the third element and add ellipsis
-                            node.replace_with(NavigableString(", ..."))
-                        else:
-                            # Keep the comma for elements 1 and 2
-                            node.replace_with(NavigableString(", "))
-
-            # If we haven't added ellipsis yet (no comma after third element)
-            if last_kept_element is not None and not any("..." in str(n) for n in last_kept_element.next_siblings):
-                last_kept_element.insert_after(" ...")
-
-    return soup.prettify()
-
-
-def main():
-    parser = argparse.ArgumentParser(
-        description="Simplify HTML content by removing unnecessary elements and folding long lists."
-    )
-    parser.add_argument(
-        "input",
-        nargs="?",
-        type=argparse.FileType("r"),
-        default=sys.stdin,
-        help="Input HTML file (default: read from stdin)",
-    )
-    parser.add_argument(
-        "-o",
-        "--output",
-        type=argparse.FileType("w"),
-        default=sys.stdout,
-        help="Output file (default: write to stdout)",
+            variants, utility = _split_tailwind_variants(name)
+            if not variants:
+                hidden = hidden or utility in _HIDDEN_CLASSES
+            elif utility in _TAILWIND_DISPLAY_UTILITIES:
+                # Variants such as md:flex or group-hover:block show the element again on some screens or states
+                return False
+        return hidden
+    return False
+
+
+def remove_hidden_elements(soup: BeautifulSoup, classes: bool = False) -> int:
+    """
+    Remove subtrees that browsers do not render.
+
+    Elements with the ``hidden`` attribute, ``aria-hidden="true"``, ``display:none``, ``visibility:hidden`` or
+    off-screen inline styles, hidden inputs and closed dialogs are removed together with their descendants.
+
+    Args:
+        soup (BeautifulSoup): The BeautifulSoup object to process
+        classes (bool): Also remove elements with the Tailwind ``hidden`` or ``sr-only`` classes, unless a responsive
+            variant such as ``md:flex`` shows them again
+
+    Returns:
+        int: Number of removed subtrees
+    """
+    hidden = []
+    stack = [soup]
+    while stack:
+        _checkpoint()
+        for child in stack.pop().contents:
+            if isinstance(child, Tag):
+                # The descendants of a hidden element are removed with it and never checked
+                (hidden if _is_hidden(child, classes) else stack).append(child)
+    _decompose_all(hidden)
+    return len(hidden)
+
+
+_LETTER_RUN_RE = re.compile(r"[A-Za-z]+")
+_DIGIT_RUN_RE = re.compile(r"[0-9]+")
+_SYMBOL_RE = re.compile(r"[^\sA-Za-z0-9]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of LLM tokens in a text without a tokenizer.
+
+    Every run of letters costs one token plus one per 6 letters, every run of digits one token plus one per 3 digits,
+    and every other non-space character (punctuation, non-ASCII) and every line break one token.
+
+    Args:
+        text (str): The text to estimate
+
+    Returns:
+        int: The estimated number of tokens
+    """
+    return (
+        sum(1 + len(run) // 6 for run in _LETTER_RUN_RE.findall(text))
+        + sum(1 + len(run) // 3 for run in _DIGIT_RUN_RE.findall(text))
+        + len(_SYMBOL_RE.findall(text))
+        + text.count("\n")
     )
 
-    args = parser.parse_args()
 
-    try:
-        html_content = args.input.read()
-        simplified = simplify_html_for_llm(html_content)
-        args.output.write(simplified)
+def _own_tokens(node) -> int:
+    """
+    Estimate the tokens a single node contributes to prettified output, excluding its children.
+    """
+    if isinstance(node, Tag):
+        attrs = "".join(
+            f' {name}="{html.escape(value if isinstance(value, str) else " ".join(value), quote=False)}"'
+            for name, value in node.attrs.items()
+        )
+        return estimate_tokens(f"<{node.name}{attrs}></{node.name}>") + 2
+    # Measured as serialized: escaped text, comments and declarations with their delimiters
+    text = node.output_ready("minimal").strip() if node.strip() else ""
+    return estimate_tokens(text) + 1 if text else 0
+
+
+# Subtrees dropped, in priority order, when folding, stripping and truncating are not enough
+_LOW_VALUE_TAGS = (("nav",), ("footer", "aside"), ("form", "select", "button", "iframe"), ("header",))
+_BUDGET_KEPT_ATTRIBUTES = frozenset({"id", "href", "data-nid"})
+
+
+class _TokenBudget:
+    """
+    Applies progressively stronger reductions to a simplified tree until its estimated size fits a token budget.
+
+    The estimate is updated from per-node deltas as the tree is reduced. Each node is estimated once, when it is first
+    seen or changed, and subtree sizes are summed again from those estimates at most once per reduction step, so the
+    document is never re-serialized or re-estimated between steps.
+    """
+
+    def __init__(self, soup: BeautifulSoup, fold_policy: FoldPolicy):
+        self.soup = soup
+        self.fold_policy = fold_policy
+        # id -> (node, its own tokens); holding the node keeps its id from being reused by a new one
+        self._own_sizes = {}
+        self.total = self._measure()
+        self._steps = [
+            partial(self._fold, 2),
+            partial(self._fold, 1),
+            self._strip_attributes,
+            partial(self._truncate_text, 200),
+            partial(self._truncate_text, 50),
+            *(partial(self._drop_tags, tags) for tags in _LOW_VALUE_TAGS),
+            self._drop_trailing,
+        ]
+
+    @property
+    def exhausted(self) -> bool:
+        """
+        Whether every reduction step has been applied.
+        """
+        return not self._steps
+
+    def reduce(self, target: int) -> bool:
+        """
+        Apply reductions in priority order until the estimate fits ``target``.
+
+        Args:
+            target (int): The estimated token count to fit
+
+        Returns:
+            bool: True if the estimate fits the target
+        """
+        while self.total > target and self._steps:
+            _checkpoint()
+            # The last step, dropping trailing content, can be applied again for a tighter target
+            final = len(self._steps) == 1
+            before = self.total
+            (self._steps[0] if final else self._steps.pop(0))(target)
+            if final and self.total >= before:
+                self._steps.clear()
+        return self.total <= target
+
+    def _own(self, node: PageElement) -> int:
+        cached = self._own_sizes.get(id(node))
+        if cached is None:
+            cached = self._own_sizes[id(node)] = (node, _own_tokens(node))
+        return cached[1]
+
+    def _measure(self) -> int:
+        nodes = list(self.soup.descendants)
+        sizes = {id(node): self._own(node) for node in nodes}
+        sizes[id(self.soup)] = 0
+        for node in reversed(nodes):
+            sizes[id(node.parent)] += sizes[id(node)]
+        self._sizes = sizes
+        self._dirty = False
+        return sizes[id(self.soup)]
+
+    def _refresh(self) -> None:
+        if self._dirty:
+            self.total = self._measure()
+
+    def _remove(self, node: Tag) -> None:
+        self.total -= self._sizes[id(node)]
+        node.decompose()
+        self._dirty = True
+
+    def _fold(self, keep: int, target: int) -> None:
+        self._refresh()
+        policy = replace(
+            self.fold_policy, keep_first=min(keep, self.fold_policy.keep_first), keep_last=0, min_items=keep + 1
+        )
+        for element in self.soup.find_all(policy.tags):
+            if _is_decomposed(element):
+                continue
+            # Tables fold rows inside their tbody sections, so those are measured child by child as well
+            scope = [element, *_child_tags(element, ("tbody",))] if element.name == "table" else [element]
+            scope_ids = {id(parent) for parent in scope}
+            before = [node for parent in scope for node in parent.contents if id(node) not in scope_ids]
+            if fold_table(element, policy) if element.name == "table" else fold_children(element, policy):
+                # Nodes in ``before`` are still referenced, so their ids cannot have been reused by new markers
+                original = {id(node) for node in before}
+                after = [node for parent in scope for node in parent.contents if id(node) not in scope_ids]
+                self.total -= sum(self._sizes[id(node)] for node in before)
+                self.total += sum(self._sizes[id(node)] if id(node) in original else self._own(node) for node in after)
+                self._dirty = True
+
+    def _strip_attributes(self, target: int) -> None:
+        for element in self.soup.find_all(True):
+            if element.attrs.keys() - _BUDGET_KEPT_ATTRIBUTES:
+                before = self._own(element)
+                element.attrs = {
+                    name: value for name, value in element.attrs.items() if name in _BUDGET_KEPT_ATTRIBUTES
+                }
+                after = _own_tokens(element)
+                self._own_sizes[id(element)] = (element, after)
+                self.total += after - before
+                self._dirty = True
+
+    def _truncate_text(self, limit: int, target: int) -> None:
+        for string in self.soup.find_all(string=True):
+            text = string.strip()
+            if type(string) is NavigableString and len(text) > limit:
+                truncated = NavigableString(text[:limit].rstrip() + "...")
+                self.total += self._own(truncated) - self._own(string)
+                string.replace_with(truncated)
+                self._dirty = True
+
+    def _drop_tags(self, names: tuple[str, ...], target: int) -> None:
+        self._refresh()
+        for element in self.soup.find_all(names):
+            if not _is_decomposed(element):
+                self._remove(element)
+
+    def _drop_trailing(self, target: int) -> None:
+        self._refresh()
+        root = self.soup.body or self.soup
+        marker_tokens = _own_tokens(NavigableString("... (truncated)"))
+        while self.total > target:
+            elements = [node for node in root.children if isinstance(node, Tag)]
+            if not elements:
+                break
+            dropped = []
+            for element in reversed(elements[1:]):
+                # Leave room for the marker that replaces the dropped elements
+                if dropped and self.total + marker_tokens <= target:
+                    break
+                self.total -= self._sizes[id(element)]
+                dropped.append(element)
+            if dropped:
+                _decompose_all(dropped)
+                self._dirty = True
+                root.append(NavigableString("... (truncated)"))
+                self.total += marker_tokens
+            root = elements[0]
+
+
+@dataclass(frozen=True)
+class Chunk:
+    """
+    A piece of simplified HTML that fits a token budget.
+
+    Attributes:
+        html (str): Whole sibling elements (or pieces of one long text), serialized
+        path (tuple[str, ...]): Descriptors (``tag#id.class``) of the ancestors of those elements, outermost first;
+            on deeply nested trees, the ancestors between the outermost one and the innermost ones are elided as
+            ``"..."``
+        tokens (int): Estimated tokens of ``html`` plus the path
+    """
+
+    html: str
+    path: tuple[str, ...]
+    tokens: int
+
+    @property
+    def context(self) -> str:
+        """
+        The ancestor path joined as a CSS-like selector.
+        """
+        return " > ".join(self.path)
+
+
+def _describe(tag: Tag) -> str:
+    """
+    Describe a tag as ``name#id.class`` for chunk paths.
+    """
+    descriptor = tag.name
+    if isinstance(tag.get("id"), str):
+        descriptor += f"#{tag['id']}"
+    classes = tag.get("class")
+    if classes:
+        descriptor += "".join(f".{cls}" for cls in (classes.split() if isinstance(classes, str) else classes))
+    return descriptor
+
+
+class _ChunkFrame:
+    """
+    A tag being walked by the chunker, with the fitting children that are not emitted yet.
+    """
+
+    __slots__ = (
+        "budget", "children", "cut", "descriptor", "node", "outermost", "overflowed", "parent", "path_tokens",
+        "pending", "size",
+    )  # fmt: skip
+
+    def __init__(self, node: Tag, parent: "_ChunkFrame | None", max_tokens: int):
+        self.node = node
+        self.children = iter(node.contents)
+        self.parent = parent
+        # The path is kept as a chain of descriptors and its size summed along it, so deep trees stay linear. Past
+        # the cut, the frame whose ancestors up to the outermost one are elided, the path is
+        # ``(outermost, "...", *descriptors from the cut down)``
+        self.cut = None
+        if parent is None:
+            self.descriptor = self.outermost = None
+            self.path_tokens = 0
+        else:
+            self.descriptor = _describe(node)
+            if parent.descriptor is None:
+                self.outermost = self.descriptor
+                self.path_tokens = estimate_tokens(self.descriptor)
+            else:
+                self.outermost = parent.outermost
+                self.cut = parent.cut
+                self.path_tokens = parent.path_tokens + estimate_tokens(f" > {self.descriptor}")
+                # Past half the budget the path would crowd out the content, so it is cut again at this frame
+                if self.path_tokens > max_tokens // 2:
+                    self.cut = self
+                    self.path_tokens = estimate_tokens(f"{self.outermost} > ... > {self.descriptor}")
+        self.budget = max(1, max_tokens - self.path_tokens)
+        self.pending = []
+        self.size = 0
+        self.overflowed = False
+
+    @property
+    def path(self) -> tuple[str, ...]:
+        """
+        Descriptors of the walked tag and its ancestors, outermost first.
+
+        The walk stops at the cut, so it costs at most half the token budget in steps, however deep the tree is.
+        """
+        descriptors = []
+        frame = self
+        while frame.descriptor is not None:
+            descriptors.append(frame.descriptor)
+            if frame is self.cut:
+                descriptors += ["...", self.outermost]
+                break
+            frame = frame.parent
+        return tuple(reversed(descriptors))
+
+
+def _split_text(text: str, budget: int) -> Iterator[tuple[str, int]]:
+    """
+    Split a long text at whitespace into pieces that fit ``budget`` tokens.
+    """
+    piece = []
+    size = 0
+    for word in text.split():
+        cost = estimate_tokens(word)
+        if piece and size + cost > budget:
+            yield " ".join(piece), size
+            piece, size = [], 0
+        piece.append(word)
+        size += cost
+    if piece:
+        yield " ".join(piece), size
+
+
+def iter_chunks(soup: BeautifulSoup, max_tokens: int, overlap: int = 0) -> Iterator[Chunk]:
+    """
+    Split a simplified tree into chunks of at most ``max_tokens`` estimated tokens along element boundaries.
+
+    The tree is walked once, post-order, with an explicit stack. An element that fits the budget is kept whole and
+    grouped with its fitting siblings; an element that does not fit is replaced by its children, and its descriptor
+    becomes part of their path. Only text longer than the budget is split, at whitespace. Paths longer than half the
+    budget, on deeply nested trees, are shortened to the outermost ancestor, ``...`` and the innermost tags.
+
+    Args:
+        soup (BeautifulSoup): The simplified tree to split
+        max_tokens (int): Token budget per chunk, including the path
+        overlap (int): Tokens of trailing sibling elements repeated at the start of the next chunk of the same parent
+
+    Yields:
+        Chunk: The chunks in document order
+    """
+    formatter = soup.formatter_for_name("minimal")
+    stack = [_ChunkFrame(soup, None, max_tokens)]
+    # Frames whose pending children precede anything emitted next, outermost first
+    waiting = []
+
+    def pack(frame: _ChunkFrame) -> Iterator[Chunk]:
+        path_tokens = frame.path_tokens
+        units = []
+        size = 0
+        for unit, unit_size in frame.pending:
+            if units and size + unit_size > frame.budget:
+                yield Chunk("".join(text for text, _ in units), frame.path, size + path_tokens)
+                kept = []
+                kept_size = 0
+                for text, text_size in reversed(units):
+                    if kept_size + text_size > overlap or kept_size + text_size + unit_size > frame.budget:
+                        break
+                    kept.insert(0, (text, text_size))
+                    kept_size += text_size
+                units, size = kept, kept_size
+            text = "".join(iter_html(unit)) if isinstance(unit, Tag) else f"{unit.output_ready(formatter).strip()}\n"
+            units.append((text, unit_size))
+            size += unit_size
+        if units:
+            yield Chunk("".join(text for text, _ in units), frame.path, size + path_tokens)
+        frame.pending = []
+
+    def flush_waiting() -> Iterator[Chunk]:
+        for frame in waiting:
+            yield from pack(frame)
+        waiting.clear()
+
+    while stack:
+        frame = stack[-1]
+        child = next(frame.children, None)
+        if child is not None:
+            if isinstance(child, Tag):
+                stack.append(_ChunkFrame(child, frame, max_tokens))
+                continue
+            size = _own_tokens(child)
+            if not size:
+                continue
+            if size <= frame.budget:
+                if not frame.pending:
+                    waiting.append(frame)
+                frame.pending.append((child, size))
+                frame.size += size
+                continue
+            # A text longer than the budget: emit everything before it, then the text in pieces
+            yield from flush_waiting()
+            path_tokens = frame.path_tokens
+            # Each piece is emitted on its own line, which costs one more token
+            for text, text_size in _split_text(child.output_ready(formatter).strip(), frame.budget - 1):
+                yield Chunk(f"{text}\n", frame.path, text_size + 1 + path_tokens)
+            frame.overflowed = True
+            continue
+
+        stack.pop()
+        if waiting and waiting[-1] is frame:
+            waiting.pop()
+        total = frame.size + (_own_tokens(frame.node) if stack else 0)
+        parent = stack[-1] if stack else None
+        if parent is not None and not frame.overflowed and total <= parent.budget:
+            if not parent.pending:
+                waiting.append(parent)
+            parent.pending.append((frame.node, total))
+            parent.size += total
+            continue
+
+        # The element does not fit: its preceding content goes first, then its own children
+        yield from flush_waiting()
+        yield from pack(frame)
+        if parent is not None:
+            parent.overflowed = True
+
+
+_START, _END, _TEXT = range(3)
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _iter_events(root: Tag) -> Iterator[tuple[int, PageElement]]:
+    """
+    Walk the descendants of ``root`` with an explicit stack.
+
+    Yields ``(_START, tag)`` when a tag opens, ``(_END, tag)`` when it closes and ``(_TEXT, string)`` for strings.
+    """
+    stack = [(root, iter(root.contents))]
+    while stack:
+        tag, children = stack[-1]
+        node = next(children, None)
+        if node is None:
+            stack.pop()
+            if stack:
+                yield _END, tag
+        elif isinstance(node, Tag):
+            yield _START, node
+            stack.append((node, iter(node.contents)))
+        else:
+            yield _TEXT, node
+
+
+def _attribute_text(value) -> str:
+    """
+    Return an attribute value as a string, joining multi-valued attributes such as ``class``.
+    """
+    return value if isinstance(value, str) else " ".join(value)
+
+
+# Indentation stops growing at this depth, so prettified output stays linear in the size of very deep documents
+_MAX_INDENT_DEPTH = 64
+
+
+def _start_tag(tag: Tag, formatter) -> str:
+    """
+    Format the opening tag of ``tag`` the way ``Tag.prettify`` does.
+    """
+    attrs = ""
+    for name, value in formatter.attributes(tag):
+        if value is None:
+            attrs += f" {name}"
+            continue
+        text = value.substitute_encoding("utf-8") if isinstance(value, AttributeValueWithCharsetSubstitution) else value
+        attrs += f" {name}={formatter.quoted_attribute_value(formatter.attribute_value(_attribute_text(text)))}"
+    prefix = f"{tag.prefix}:" if tag.prefix else ""
+    void = (formatter.void_element_close_prefix or "") if tag.is_empty_element else ""
+    return f"<{prefix}{tag.name}{attrs}{void}>"
+
+
+def iter_html(root: Tag, max_indent_depth: int = _MAX_INDENT_DEPTH) -> Iterator[str]:
+    """
+    Serialize a tree as prettified HTML with an explicit stack, streamed in fragments.
+
+    The output matches ``Tag.prettify()``, except that indentation is capped at ``max_indent_depth`` levels.
+
+    Args:
+        root (Tag): The tree or element to serialize; the element itself is included unless it is the document
+        max_indent_depth (int): Deepest indentation level
+
+    Yields:
+        str: Fragments whose concatenation is the HTML document
+    """
+    formatter = root.formatter_for_name("minimal")
+    events = _iter_events(root)
+    if not root.hidden:
+        events = chain([(_START, root)], events, [(_END, root)])
+    level = 0
+    # The <pre>-like element whose contents are written verbatim, if any
+    literal = None
+    for event, node in events:
+        indent = formatter.indent * min(level, max_indent_depth)
+        if event == _TEXT:
+            piece = node.output_ready(formatter)
+            if literal is not None:
+                yield piece
+            elif piece := piece.strip():
+                yield f"{indent}{piece}\n"
+        elif node.is_empty_element:
+            if event == _START:
+                yield _start_tag(node, formatter) if literal is not None else f"{indent}{_start_tag(node, formatter)}\n"
+        elif event == _START:
+            level += 1
+            if literal is not None:
+                yield _start_tag(node, formatter)
+            elif node.preserve_whitespace_tags and node.name in node.preserve_whitespace_tags:
+                literal = node
+                yield f"{indent}{_start_tag(node, formatter)}"
+            else:
+                yield f"{indent}{_start_tag(node, formatter)}\n"
+        else:
+            level -= 1
+            end_tag = f"</{node.prefix}:{node.name}>" if node.prefix else f"</{node.name}>"
+            if node is literal:
+                literal = None
+                yield f"{end_tag}\n"
+            elif literal is not None:
+                yield end_tag
+            else:
+                yield f"{formatter.indent * min(level, max_indent_depth)}{end_tag}\n"
+
+
+def iter_json_ast(soup: BeautifulSoup) -> Iterator[str]:
+    """
+    Serialize a simplified tree as a compact JSON AST, streamed in fragments.
+
+    Elements become ``[tag, attrs, children]`` and text becomes a string with runs of whitespace collapsed to one
+    space (except inside ``<pre>``); the document is a list of its top-level nodes.
+
+    Args:
+        soup (BeautifulSoup): The simplified tree to serialize
+
+    Yields:
+        str: Fragments whose concatenation is the JSON document
+    """
+    # Whether the next node is the first in its children list, one entry per open list
+    first = [True]
+    pre = 0
+    yield "["
+    for event, node in _iter_events(soup):
+        if event == _END:
+            first.pop()
+            pre -= node.name == "pre"
+            yield "]]"
+            continue
+        if event == _TEXT:
+            if isinstance(node, (Doctype, Declaration, ProcessingInstruction)) or not node.strip():
+                continue
+            text = node if pre else _WHITESPACE_RE.sub(" ", node)
+            fragment = json.dumps(text, ensure_ascii=False)
+        else:
+            attrs = {name: _attribute_text(value) for name, value in node.attrs.items()}
+            fragment = f"[{json.dumps(node.name)},{json.dumps(attrs, ensure_ascii=False, separators=(',', ':'))},["
+        yield fragment if first[-1] else f",{fragment}"
+        first[-1] = False
+        if event == _START:
+            first.append(True)
+            pre += node.name == "pre"
+    yield "]"
+
+
+_MARKDOWN_BLOCK_TAGS = frozenset(
+    {
+        "address", "article", "aside", "body", "dd", "details", "dialog", "div", "dl", "dt", "fieldset",
+        "figcaption", "figure", "footer", "form", "header", "html", "main", "nav", "p", "section", "summary",
+    }
+)  # fmt: skip
+_MARKDOWN_EMPHASIS = {"strong": "**", "b": "**", "em": "*", "i": "*", "s": "~~", "del": "~~"}
+_BACKTICK_RUN_RE = re.compile(r"`+")
+
+
+class _MarkdownWriter:
+    """
+    Turns the events of ``_iter_events`` into Markdown fragments, tracking line breaks, lists, quotes and tables.
+    """
+
+    def __init__(self):
+        self.newlines = 0  # line breaks owed before the next output
+        self.started = False  # whether anything has been output yet
+        self.space = False  # a collapsed space is owed before the next inline text
+        self.after_text = False  # whether the last event was inline text
+        self.lists = []  # [ordered, next number] per open list
+        self.quote = 0
+        self.gap_quote = 0  # shallowest quote depth since the last output, which the owed blank lines belong to
+        self.code_fences = []  # backtick fence per open inline code span
+        self.pre = 0
+        self.tables = []  # [rows seen, cells in the current row] per open table
+        self.skip = 0  # depth inside <head>, where only the title is rendered
+        self.title = False
+
+    def _block(self, newlines: int) -> None:
+        self.newlines = max(self.newlines, newlines)
+        self.gap_quote = min(self.gap_quote, self.quote)
+        self.space = False
+
+    def _out(self, text: str, item: bool = False) -> str:
+        if self.newlines or not self.started:
+            depth = len(self.lists) - 1 if item else len(self.lists)
+            lead = ""
+            if self.started:
+                # Blank lines inside a quote are continued with ">", so a quote spanning paragraphs stays one quote;
+                # the lines before a quote opens or after it closes are outside of it
+                gap = ("> " * min(self.gap_quote, self.quote)).rstrip()
+                lead = "\n" + f"{gap}\n" * (self.newlines - 1)
+            text = f"{lead}{'> ' * self.quote}{'   ' * max(depth, 0)}{text}"
+        elif self.space:
+            text = f" {text}"
+        self.newlines = 0
+        self.started = True
+        self.space = False
+        self.gap_quote = self.quote
+        return text
+
+    def start(self, tag: Tag) -> str:
+        self.after_text = False
+        name = tag.name
+        if name == "head":
+            self.skip += 1
+        if self.skip and name != "title":
+            return ""
+        if name == "title" or (len(name) == 2 and name[0] == "h" and name[1] in "123456"):
+            self.title = self.title or name == "title"
+            self._block(2)
+            return self._out("#" * (int(name[1]) if name != "title" else 1) + " ")
+        if name in ("ul", "ol", "select"):
+            self._block(2 if not self.lists else 1)
+            self.lists.append([name == "ol", 1])
+        elif name in ("li", "option"):
+            self._block(1)
+            if not self.lists:
+                return self._out("- ", item=True)
+            ordered, number = self.lists[-1]
+            self.lists[-1][1] += 1
+            return self._out(f"{number}. " if ordered else "- ", item=True)
+        elif name == "blockquote":
+            self._block(2)
+            self.quote += 1
+        elif name == "pre":
+            self._block(2)
+            self.pre += 1
+            return self._out("```\n")
+        elif name == "code" and not self.pre:
+            # The fence is longer than any run of backticks in the code, and padded if the code has backticks
+            runs = _BACKTICK_RUN_RE.findall(tag.get_text())
+            fence = "`" * (max(map(len, runs), default=0) + 1)
+            self.code_fences.append(f" {fence}" if runs else fence)
+            return self._out(f"{fence} " if runs else fence)
+        elif name in _MARKDOWN_EMPHASIS:
+            return self._out(_MARKDOWN_EMPHASIS[name])
+        elif name == "a":
+            return self._out("[")
+        elif name == "img":
+            return self._out(f"![{_attribute_text(tag.get('alt', ''))}]({_attribute_text(tag.get('src', ''))})")
+        elif name == "br":
+            self._block(1)
+        elif name == "hr":
+            self._block(2)
+            text = self._out("---")
+            self._block(2)
+            return text
+        elif name == "table":
+            self._block(2)
+            self.tables.append([0, 0])
+        elif name == "tr":
+            self._block(1)
+            if self.tables:
+                self.tables[-1][1] = 0
+            return self._out("|")
+        elif name in ("td", "th"):
+            if self.tables:
+                self.tables[-1][1] += 1
+            self.space = True
+        elif name in _MARKDOWN_BLOCK_TAGS:
+            self._block(2)
+        return ""
+
+    def end(self, tag: Tag) -> str:
+        self.after_text = False
+        name = tag.name
+        if name == "head":
+            self.skip -= 1
+            return ""
+        if self.skip and name != "title":
+            return ""
+        text = ""
+        if name == "title" or (len(name) == 2 and name[0] == "h" and name[1] in "123456"):
+            self.title = self.title and name != "title"
+            self._block(2)
+        elif name in ("ul", "ol", "select"):
+            self.lists.pop()
+            self._block(2 if not self.lists else 1)
+        elif name in ("li", "option"):
+            self._block(1)
+        elif name == "blockquote":
+            self.quote -= 1
+            self._block(2)
+        elif name == "pre":
+            self.pre -= 1
+            text = "\n```"
+            self._block(2)
+        elif name == "code" and self.code_fences:
+            text = self.code_fences.pop()
+        elif name in _MARKDOWN_EMPHASIS:
+            text = _MARKDOWN_EMPHASIS[name]
+        elif name == "a":
+            href = tag.get("href")
+            text = f"]({_attribute_text(href)})" if href else "]"
+        elif name in ("td", "th"):
+            text = " |"
+        elif name == "tr" and self.tables:
+            table = self.tables[-1]
+            table[0] += 1
+            if table[0] == 1:
+                # The first row is the header, so the separator row follows it
+                text = "\n|" + " --- |" * table[1]
+            self._block(1)
+        elif name == "table" and self.tables:
+            self.tables.pop()
+            self._block(2)
+        elif name in _MARKDOWN_BLOCK_TAGS:
+            self._block(2)
+        if text:
+            self.started = True
+            self.space = False
+        return text
+
+    def text(self, node: NavigableString) -> str:
+        if (self.skip and not self.title) or isinstance(node, (Doctype, Declaration, ProcessingInstruction)):
+            return ""
+        if isinstance(node, Comment):
+            return self._out(f"<!--{node}-->")
+        if self.pre:
+            return self._out(str(node)) if node.strip() or not self.newlines else ""
+        text = " ".join(node.split())
+        if not text:
+            self.space = self.space or self.started
+            return ""
+        if self.tables:
+            text = text.replace("|", "\\|")
+        # Parsing never leaves two strings side by side, so adjacent ones had an element (say a <br>) removed
+        # between them and are kept apart
+        self.space = self.space or node[0].isspace() or self.after_text
+        text = self._out(text)
+        self.space = node[-1].isspace()
+        self.after_text = True
+        return text
+
+
+def iter_markdown(soup: BeautifulSoup) -> Iterator[str]:
+    """
+    Serialize a simplified tree as Markdown, streamed in fragments.
+
+    Headings, paragraphs, lists, links, emphasis, code, quotes and tables are converted; other tags contribute only
+    their text.
+
+    Args:
+        soup (BeautifulSoup): The simplified tree to serialize
+
+    Yields:
+        str: Fragments whose concatenation is the Markdown document
+    """
+    writer = _MarkdownWriter()
+    for event, node in _iter_events(soup):
+        if event == _START:
+            fragment = writer.start(node)
+        elif event == _END:
+            fragment = writer.end(node)
+        else:
+            fragment = writer.text(node)
+        if fragment:
+            yield fragment
+    if writer.started:
+        yield "\n"
+
+
+OUTPUT_FORMATS = ("html", "markdown", "json")
+
+
+def serialize(soup: BeautifulSoup, output_format: str = "html") -> str:
+    """
+    Serialize a simplified tree in one of ``OUTPUT_FORMATS``.
+
+    Args:
+        soup (BeautifulSoup): The simplified tree to serialize
+        output_format (str): ``"html"`` (prettified), ``"markdown"`` or ``"json"`` (compact ``[tag, attrs, children]``)
+
+    Returns:
+        str: The serialized document
+    """
+    if output_format == "html":
+        return "".join(iter_html(soup))
+    if output_format == "markdown":
+        return "".join(iter_markdown(soup))
+    if output_format == "json":
+        return "".join(iter_json_ast(soup))
+    raise ValueError(f"Unknown output format {output_format!r}, expected one of {', '.join(OUTPUT_FORMATS)}")
+
+
+# Head metadata kept by main-content extraction, by <meta> name or property
+_KEY_METADATA = frozenset(
+    {"description", "author", "keywords", "og:title", "og:description", "og:type", "og:site_name", "og:url"}
+)
+_CONTENT_TAG_WEIGHTS = {
+    "article": 25,
+    "main": 25,
+    "section": 5,
+    "div": 5,
+    "td": 3,
+    "blockquote": 3,
+    "form": -15,
+    "ul": -3,
+    "ol": -3,
+    "header": -25,
+    "footer": -25,
+    "nav": -25,
+    "aside": -25,
+}
+_PARAGRAPH_TAGS = frozenset({"p", "pre", "td", "blockquote"})
+_POSITIVE_HINT_RE = re.compile(r"article|body|content|entry|main|page|post|story|text|blog", re.IGNORECASE)
+_NEGATIVE_HINT_RE = re.compile(
+    r"ad-|ads|banner|breadcrumb|combx|comment|consent|cookie|footer|footnote|masthead|menu|meta|modal|nav|popup|"
+    r"promo|related|share|shoutbox|sidebar|skyscraper|social|sponsor|subscribe|widget",
+    re.IGNORECASE,
+)
+
+
+def _is_key_metadata(meta: Tag) -> bool:
+    """
+    Check whether a ``<meta>`` tag carries metadata worth keeping next to the main content.
+    """
+    name = meta.get("name") or meta.get("property") or ""
+    return isinstance(name, str) and name.lower() in _KEY_METADATA
+
+
+def _hint_weight(tag: Tag) -> int:
+    """
+    Weight a tag by the words in its class and id.
+    """
+    hints = f"{_attribute_text(tag.get('class', ''))} {_attribute_text(tag.get('id', ''))}"
+    if not hints.strip():
+        return 0
+    return 25 * bool(_POSITIVE_HINT_RE.search(hints)) - 25 * bool(_NEGATIVE_HINT_RE.search(hints))
+
+
+def extract_main_content(soup: BeautifulSoup) -> Tag | None:
+    """
+    Keep only the main content of a page, plus its title and key head metadata.
+
+    Blocks are scored in one bottom-up pass: every paragraph-like element scores by its length and commas, and adds
+    its score to its parent and half of it to its grandparent. Candidates are then weighted by tag semantics and
+    class/id hints, and penalized by their link density. Everything in ``<body>`` outside the best candidate is
+    removed.
+
+    Args:
+        soup (BeautifulSoup): The BeautifulSoup object to process
+
+    Returns:
+        Tag | None: The element kept as main content, or None if no candidate was found and nothing was removed
+    """
+    text_lengths = {}
+    link_lengths = {}
+    commas = {}
+    scores = {}
+    candidates = {}
+    for node in reversed(list(soup.descendants)):
+        _checkpoint()
+        parent = node.parent
+        if not isinstance(node, Tag):
+            if type(node) is NavigableString:
+                text_lengths[id(parent)] = text_lengths.get(id(parent), 0) + len(node.strip())
+                commas[id(parent)] = commas.get(id(parent), 0) + node.count(",")
+            continue
+
+        # All children were visited before, so the subtree totals of ``node`` are complete
+        text_length = text_lengths.get(id(node), 0)
+        link_length = text_length if node.name == "a" else link_lengths.get(id(node), 0)
+        comma_count = commas.get(id(node), 0)
+        text_lengths[id(parent)] = text_lengths.get(id(parent), 0) + text_length
+        link_lengths[id(parent)] = link_lengths.get(id(parent), 0) + link_length
+        commas[id(parent)] = commas.get(id(parent), 0) + comma_count
+        link_lengths[id(node)] = link_length
+
+        if node.name in _PARAGRAPH_TAGS and text_length >= 25:
+            score = 1 + comma_count + min(text_length // 100, 3)
+            for ancestor, share in ((parent, 1), (parent.parent if parent else None, 0.5)):
+                if isinstance(ancestor, Tag) and ancestor is not soup:
+                    candidates[id(ancestor)] = ancestor
+                    scores[id(ancestor)] = scores.get(id(ancestor), 0) + score * share
+
+    best = None
+    best_score = 0
+    for key, candidate in candidates.items():
+        if candidate.name in ("html", "body"):
+            continue
+        text_length = text_lengths.get(key, 0)
+        link_density = link_lengths.get(key, 0) / text_length if text_length else 1
+        score = (scores[key] + _CONTENT_TAG_WEIGHTS.get(candidate.name, 0) + _hint_weight(candidate)) * (
+            1 - link_density
+        )
+        if score > best_score:
+            best, best_score = candidate, score
+    if best is None:
+        return None
+
+    # Remove everything beside the path from <body> down to the main content
+    node = best
+    while node.parent is not None and node.name not in ("body", "html"):
+        _decompose_all([sibling for sibling in node.parent.contents if sibling is not node])
+        node = node.parent
+
+    # Keep only the title and key metadata in <head>
+    if soup.head is not None:
+        _decompose_all(
+            [
+                element
+                for element in soup.head.find_all(True, recursive=False)
+                if element.name != "title" and not (element.name == "meta" and _is_key_metadata(element))
+            ]
+        )
+    return best
+
+
+# Containers whose subtrees are hashed for cross-page boilerplate detection
+_BOILERPLATE_TAGS = frozenset(
+    {
+        "aside", "details", "dialog", "div", "figure", "footer", "form", "header", "menu", "nav", "ol", "section",
+        "table", "ul",
+    }
+)  # fmt: skip
+
+
+def _subtree_digests(soup: BeautifulSoup) -> Iterator[tuple[Tag, str]]:
+    """
+    Hash every subtree bottom-up and yield the containers with their hash, innermost first.
+
+    A subtree hash covers tag names, ``id`` and ``class`` values and whitespace-normalized text, so it is stable
+    across pages that share a template. Other attributes (links, tracking IDs, nonces) are ignored.
+    """
+    hashers = {}
+    for node in reversed(list(soup.descendants)):
+        _checkpoint()
+        parent_key = id(node.parent)
+        parent_hasher = hashers.get(parent_key)
+        if parent_hasher is None:
+            parent_hasher = hashers[parent_key] = hashlib.blake2b(digest_size=8)
+        if isinstance(node, Tag):
+            # All children were visited before, so the hasher of ``node`` is complete
+            hasher = hashers.pop(id(node), None) or hashlib.blake2b(digest_size=8)
+            node_id = _attribute_text(node.get("id", ""))
+            hasher.update(f"<{node.name}#{node_id}.{_attribute_text(node.get('class', ''))}>".encode())
+            digest = hasher.digest()
+            parent_hasher.update(digest)
+            if node.name in _BOILERPLATE_TAGS:
+                yield node, digest.hex()
+        elif type(node) is NavigableString:
+            text = " ".join(node.split())
+            if text:
+                parent_hasher.update(text.encode())
+                parent_hasher.update(b"\0")
+
+
+def remove_boilerplate(soup: BeautifulSoup, hashes: frozenset[str]) -> None:
+    """
+    Remove every container subtree whose hash is in ``hashes``.
+
+    Args:
+        soup (BeautifulSoup): The BeautifulSoup object to process
+        hashes (frozenset[str]): Subtree hashes known to be boilerplate, see ``BoilerplateIndex.boilerplate_hashes``
+    """
+    _decompose_all([element for element, digest in _subtree_digests(soup) if digest in hashes])
+
+
+class BoilerplateIndex:
+    """
+    Frequencies of container subtrees across a sample of pages from one site.
+
+    Subtrees that appear on most pages (header, navigation, footer, cookie banners) are template boilerplate and can
+    be dropped with ``Simplifier(boilerplate=index)``.
+
+    Args:
+        counts (dict[str, int] | None): Number of pages each subtree hash was seen on
+        pages (int): Number of pages learned
+    """
+
+    def __init__(self, counts: dict[str, int] | None = None, pages: int = 0):
+        self.counts = counts or {}
+        self.pages = pages
+
+    def learn(self, html: str, simplifier: "Simplifier | None" = None) -> None:
+        """
+        Count the container subtrees of one page.
+
+        Args:
+            html (str): The page to learn from
+            simplifier (Simplifier | None): The simplifier whose cleanup stages are applied before hashing; use the
+                one that will later remove the boilerplate (default: a simplifier with default policies)
+        """
+        soup = BeautifulSoup(html, "html.parser")
+        (simplifier or Simplifier())._clean(soup)
+        for digest in {digest for _, digest in _subtree_digests(soup)}:
+            self.counts[digest] = self.counts.get(digest, 0) + 1
+        self.pages += 1
+
+    def boilerplate_hashes(self, threshold: float = 0.5) -> frozenset[str]:
+        """
+        Return the hashes of subtrees seen on more than ``threshold`` of the learned pages.
+
+        Args:
+            threshold (float): Fraction of pages, between 0 and 1
+
+        Returns:
+            frozenset[str]: The boilerplate subtree hashes
+        """
+        minimum = threshold * self.pages
+        return frozenset(digest for digest, count in self.counts.items() if count > minimum)
+
+    def save(self, path: str, min_count: int = 2) -> None:
+        """
+        Write the index to a JSON file, leaving out subtrees seen on fewer than ``min_count`` pages.
+
+        Args:
+            path (str): Destination file
+            min_count (int): Subtrees seen on fewer pages are unique content and are not persisted
+        """
+        counts = {digest: count for digest, count in self.counts.items() if count >= min_count}
+        with open(path, "w") as f:
+            json.dump({"pages": self.pages, "counts": counts}, f)
+
+    @classmethod
+    def load(cls, path: str) -> "BoilerplateIndex":
+        """
+        Read an index written by ``save``.
+
+        Args:
+            path (str): Source file
+
+        Returns:
+            BoilerplateIndex: The loaded index
+        """
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data["counts"], data["pages"])
+
+
+NODE_ID_ATTRIBUTE = "data-nid"
+
+
+def _original_positions(soup: BeautifulSoup) -> dict[int, tuple[int, str]]:
+    """
+    Record, for every tag of a freshly parsed tree, its parent and its ``name[position]`` XPath step.
+
+    Entries are keyed by ``id()`` and hold no references to the tags, so they stay valid for tags that survive
+    simplification while removed tags can be freed.
+    """
+    positions = {}
+    stack = [soup]
+    while stack:
+        parent = stack.pop()
+        _checkpoint()
+        counts = {}
+        for child in parent.contents:
+            if isinstance(child, Tag):
+                counts[child.name] = counts.get(child.name, 0) + 1
+                positions[id(child)] = (id(parent), f"{child.name}[{counts[child.name]}]")
+                stack.append(child)
+    return positions
+
+
+def _stamp_node_ids(soup: BeautifulSoup, positions: dict[int, tuple[int, str]]) -> list[tuple[Tag, str, str]]:
+    """
+    Stamp sequential IDs on the kept tags and resolve each one to its XPath in the original document.
+
+    Returns:
+        list[tuple[Tag, str, str]]: The stamped tags with their ID and original XPath, in document order
+    """
+    paths = {id(soup): ""}
+
+    def original_path(key: int) -> str:
+        # Resolve the chain of unresolved ancestors iteratively, memoizing every path on the way down
+        chain = []
+        while key not in paths:
+            parent, step = positions[key]
+            chain.append((key, step))
+            key = parent
+        path = paths[key]
+        for key, step in reversed(chain):
+            path = paths[key] = f"{path}/{step}"
+        return path
+
+    stamped = []
+    for number, tag in enumerate(soup.find_all(True), 1):
+        _checkpoint()
+        node_id = str(number)
+        tag.attrs = {NODE_ID_ATTRIBUTE: node_id, **tag.attrs}
+        stamped.append((tag, node_id, original_path(id(tag))))
+    return stamped
+
+
+LIMIT_ACTIONS = ("raise", "partial", "fallback")
+
+
+class LimitExceeded(Exception):
+    """
+    Raised when a document exceeds one of its ``ResourceLimits``.
+
+    Attributes:
+        limit (str): The limit that was hit: ``"deadline_seconds"``, ``"max_nodes"`` or ``"max_input_bytes"``
+    """
+
+    def __init__(self, limit: str, message: str):
+        super().__init__(message)
+        self.limit = limit
+
+
+@dataclass(frozen=True)
+class ResourceLimits:
+    """
+    Per-document limits, enforced cooperatively inside the stage loops.
+
+    Each limit has an action from ``LIMIT_ACTIONS``: ``"raise"`` a ``LimitExceeded``, return a ``"partial"`` result, or
+    ``"fallback"`` to the plain text of ``strip_html``.
+
+    Attributes:
+        deadline_seconds (float | None): Wall-clock time allowed per document, parsing included. The partial result
+            is the tree as far as parsing and the stages got, cut to at most the length of the input
+        max_nodes (int | None): Most parsed nodes (elements and strings) per document; parsing stops once the document
+            has more than ``max_nodes`` tags. The partial result simplifies the first ``max_nodes`` nodes
+        max_input_bytes (int | None): Largest input in UTF-8 bytes, checked before parsing. The partial result
+            simplifies the first ``max_input_bytes`` bytes
+        on_deadline (str): Action when the deadline passes
+        on_max_nodes (str): Action when the document has too many nodes
+        on_max_input_bytes (str): Action when the input is too large
+    """
+
+    deadline_seconds: float | None = None
+    max_nodes: int | None = None
+    max_input_bytes: int | None = None
+    on_deadline: str = "raise"
+    on_max_nodes: str = "raise"
+    on_max_input_bytes: str = "raise"
+
+    def __post_init__(self):
+        for action in (self.on_deadline, self.on_max_nodes, self.on_max_input_bytes):
+            if action not in LIMIT_ACTIONS:
+                raise ValueError(f"Unknown limit action {action!r}, expected one of {', '.join(LIMIT_ACTIONS)}")
+
+    def action(self, limit: str) -> str:
+        """
+        Return the action configured for ``limit``.
+        """
+        return {
+            "deadline_seconds": self.on_deadline,
+            "max_nodes": self.on_max_nodes,
+            "max_input_bytes": self.on_max_input_bytes,
+        }[limit]
+
+
+class _LimitTracker:
+    """
+    Tracks the limits of one document while it is simplified.
+    """
+
+    def __init__(self, limits: ResourceLimits):
+        self.limits = limits
+        self.deadline = None if limits.deadline_seconds is None else time.perf_counter() + limits.deadline_seconds
+        # The limit that was hit last, if any
+        self.exceeded = None
+        # The tree being simplified, serialized as is when the deadline passes with a partial result
+        self.soup = None
+
+    def exceed(self, limit: str, message: str) -> None:
+        """
+        Record that ``limit`` was hit and raise, unless the limit is handled by keeping a part of the document.
+        """
+        self.exceeded = limit
+        if limit == "deadline_seconds" or self.limits.action(limit) != "partial":
+            raise LimitExceeded(limit, message)
+
+    def check(self) -> None:
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            self.exceed("deadline_seconds", f"Deadline of {self.limits.deadline_seconds}s exceeded")
+
+    def check_input(self, html: str) -> str:
+        max_bytes = self.limits.max_input_bytes
+        # Each character takes one to four bytes, so most documents are checked without encoding them
+        if max_bytes is None or len(html) * 4 <= max_bytes:
+            return html
+        data = html.encode()
+        if len(data) <= max_bytes:
+            return html
+        self.exceed("max_input_bytes", f"Input of {len(data)} bytes exceeds {max_bytes} bytes")
+        return data[:max_bytes].decode(errors="ignore")
+
+    def check_nodes(self, soup: BeautifulSoup) -> None:
+        max_nodes = self.limits.max_nodes
+        if max_nodes is None:
+            return
+        for count, node in enumerate(soup.descendants):
+            if count == max_nodes:
+                self.exceed("max_nodes", f"Document has more than {max_nodes} nodes")
+                _truncate_tree(node)
+                return
+
+
+class _ParsingStopped(Exception):
+    """
+    Raised inside the parser to stop building a tree that exceeds its limits.
+    """
+
+
+class _LimitedSoup(BeautifulSoup):
+    """
+    A tree parsed with html.parser that stops parsing once the document has more than ``max_nodes`` tags or its
+    deadline passes, so that a document over its limits costs no more than the limits allow.
+
+    The string and tags open when parsing stops are closed as at the end of the document, so the tree holds the start
+    of the document for a partial result.
+    """
+
+    # Start tags parsed between two deadline checks
+    DEADLINE_INTERVAL = 256
+
+    def __init__(self, html: str, tracker: _LimitTracker):
+        self._tracker = tracker
+        self._tags = 0
+        super().__init__(html, "html.parser")
+
+    def _feed(self) -> None:
+        try:
+            super()._feed()
+        except _ParsingStopped:
+            self.endData()
+            while self.currentTag is not None and self.currentTag.name != self.ROOT_TAG_NAME:
+                self.popTag()
+
+    def handle_starttag(self, *args, **kwargs) -> Tag | None:
+        self._tags += 1
+        max_nodes = self._tracker.limits.max_nodes
+        if max_nodes is not None and self._tags > max_nodes:
+            raise _ParsingStopped
+        deadline = self._tracker.deadline
+        if deadline is not None and not self._tags % self.DEADLINE_INTERVAL and time.perf_counter() > deadline:
+            raise _ParsingStopped
+        return super().handle_starttag(*args, **kwargs)
+
+
+_ACTIVE_LIMITS: ContextVar[_LimitTracker | None] = ContextVar("simplify_html_limits", default=None)
+
+
+def _checkpoint() -> None:
+    """
+    Let the limits of the document being simplified interrupt a stage loop.
+    """
+    tracker = _ACTIVE_LIMITS.get()
+    if tracker is not None:
+        tracker.check()
+
+
+def _truncate_tree(node: PageElement) -> None:
+    """
+    Remove ``node`` and everything after it in document order.
+    """
+    removed = [node]
+    while node.parent is not None:
+        removed.extend(node.next_siblings)
+        node = node.parent
+    _decompose_all(removed)
+
+
+def _truncate_markup(soup: BeautifulSoup, max_length: int) -> None:
+    """
+    Cut ``soup`` at the first node in document order past which its markup, indentation aside, would be longer than
+    ``max_length`` characters.
+    """
+    used = 0
+    for node in soup.descendants:
+        if isinstance(node, Tag):
+            # The start and end tags, and each attribute with its quotes
+            used += 2 * len(node.name) + 5
+            for name, value in node.attrs.items():
+                used += len(name) + 4 + len(value if isinstance(value, str) else " ".join(value))
+        else:
+            used += len(node)
+        if used > max_length:
+            _truncate_tree(node)
+            return
+
+
+_STRIP_RE = re.compile(
+    r"<(script|style|noscript|template|svg)\b.*?</\1\s*>|<!--.*?-->|<(/?)([a-zA-Z][a-zA-Z0-9]*)?[^>]*>",
+    re.IGNORECASE | re.DOTALL,
+)
+_STRIP_BLOCK_TAGS = frozenset(
+    {"address", "article", "aside", "blockquote", "br", "dd", "div", "dl", "dt", "figcaption", "footer", "form",
+     "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li", "main", "nav", "ol", "p", "pre", "section", "table",
+     "td", "th", "title", "tr", "ul"}
+)  # fmt: skip
+_BLANK_RUN_RE = re.compile(r"[ \t\r\f\v]+")
+
+
+def strip_html(html: str) -> str:
+    """
+    Reduce HTML to its visible text in one regular-expression scan, without building a tree.
+
+    This is the cheap fallback for documents that exceed their ``ResourceLimits``: scripts, styles, comments and tags
+    are dropped, block-level tags become line breaks and entities are unescaped.
+
+    Args:
+        html (str): The HTML content to strip
+
+    Returns:
+        str: The text of the document, one block per line
+    """
+    lines = []
+    line = []
+    position = 0
+    for match in _STRIP_RE.finditer(html):
+        line.append(html[position : match.start()])
+        position = match.end()
+        if (match.group(3) or "").lower() in _STRIP_BLOCK_TAGS:
+            lines.append("".join(line))
+            line = []
+        else:
+            line.append(" ")
+    line.append(html[position:])
+    lines.append("".join(line))
+    stripped = (_BLANK_RUN_RE.sub(" ", unescape(text)).strip() for text in lines)
+    return "\n".join(text for text in stripped if text) + "\n"
+
+
+def _format_stripped(text: str, max_tokens: int | None, output_format: str) -> str:
+    """
+    Render the lines of a ``strip_html`` result in ``output_format`` (escaped text for HTML, a paragraph per line for
+    the JSON AST), keeping only the lines that fit ``max_tokens``.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format {output_format!r}, expected one of {', '.join(OUTPUT_FORMATS)}")
+
+    def render(line: str) -> str:
+        if output_format == "json":
+            return json.dumps(["p", {}, [line]], ensure_ascii=False, separators=(",", ":"))
+        return html.escape(line, quote=False) if output_format == "html" else line
+
+    # The brackets of the JSON list
+    used = 2 if output_format == "json" else 0
+    pieces = []
+    for line in text.splitlines():
+        piece = render(line)
+        # Each piece also costs its separator: a line break or a comma
+        cost = estimate_tokens(piece) + 1
+        if max_tokens is not None and used + cost > max_tokens:
+            # Keep the start of the line if it fits, then stop
+            start = next(_split_text(line, max_tokens - used - 1), ("", 0))[0]
+            piece = render(start)
+            cost = estimate_tokens(piece) + 1
+            if start and used + cost <= max_tokens:
+                pieces.append(piece)
+            break
+        pieces.append(piece)
+        used += cost
+    if output_format == "json":
+        return "[" + ",".join(pieces) + "]"
+    return "".join(f"{piece}\n" for piece in pieces)
+
+
+@dataclass
+class StageStats:
+    """
+    Measurements of one pipeline stage.
+
+    Attributes:
+        name (str): The stage, e.g. ``"parse"``, ``"hidden"``, ``"attributes"`` or ``"serialize"``
+        wall_seconds (float): Wall-clock time spent in the stage
+        cpu_seconds (float): CPU time spent in the stage by the process
+        nodes_visited (int): Nodes in the tree when the stage started (for ``"parse"``, the nodes it built)
+        nodes_removed (int): Net number of nodes the stage removed from the tree
+    """
+
+    name: str
+    wall_seconds: float
+    cpu_seconds: float
+    nodes_visited: int
+    nodes_removed: int
+
+
+@dataclass
+class SimplifyStats:
+    """
+    Per-stage instrumentation of a run, filled by ``Simplifier.run(html, stats=...)``.
+
+    Attributes:
+        stages (list[StageStats]): The stages that ran, in order; stages that are disabled are left out
+        input_bytes (int): Size of the input in UTF-8 bytes
+        output_bytes (int): Size of the output in UTF-8 bytes
+    """
+
+    stages: list[StageStats] = field(default_factory=list)
+    input_bytes: int = 0
+    output_bytes: int = 0
+
+    @property
+    def wall_seconds(self) -> float:
+        return sum(stage.wall_seconds for stage in self.stages)
+
+    @property
+    def cpu_seconds(self) -> float:
+        return sum(stage.cpu_seconds for stage in self.stages)
+
+    def to_dict(self) -> dict:
+        """
+        Return the stats with their totals as plain JSON-serializable data.
+        """
+        return {
+            "input_bytes": self.input_bytes,
+            "output_bytes": self.output_bytes,
+            "bytes_saved": self.input_bytes - self.output_bytes,
+            "wall_seconds": self.wall_seconds,
+            "cpu_seconds": self.cpu_seconds,
+            "stages": [asdict(stage) for stage in self.stages],
+        }
+
+
+class SimplifyHooks:
+    """
+    Callbacks around the pipeline stages, e.g. to open tracing spans; subclass it and override the callbacks you need.
+
+    Hooks are registered with ``Simplifier(hooks=[...])`` and called for every document simplified by ``run`` and
+    ``simplify``. Without hooks the stages are not instrumented.
+    """
+
+    def on_stage_start(self, name: str, nodes: int) -> None:
+        """
+        Called before a stage runs.
+
+        Args:
+            name (str): The stage, e.g. ``"parse"`` or ``"attributes"``
+            nodes (int): Nodes in the tree (0 before parsing)
+        """
+
+    def on_stage_end(self, stage: StageStats) -> None:
+        """
+        Called after a stage has run, also when it raised.
+
+        Args:
+            stage (StageStats): The stage with its timings and node counts
+        """
+
+    def on_document_done(self, stats: SimplifyStats) -> None:
+        """
+        Called once a document is simplified, also when a limit made the run fail.
+
+        Args:
+            stats (SimplifyStats): All stages of the document and its input and output sizes (the output size is 0
+                if the run failed)
+        """
+
+
+class ChromeTraceCollector(SimplifyHooks):
+    """
+    Hooks that collect the stages as Chrome trace events, to inspect in ``chrome://tracing`` or Perfetto.
+
+    Each stage is a complete event nested in a ``document`` event, on the thread that simplified the document.
+
+    Attributes:
+        events (list[dict]): The collected trace events
+    """
+
+    def __init__(self):
+        self.events = []
+        # Start of the stage and document being simplified on each thread, in microseconds
+        self._stage_started = {}
+        self._document_started = {}
+
+    def on_stage_start(self, name: str, nodes: int) -> None:
+        now = time.perf_counter() * 1e6
+        thread = threading.get_ident()
+        self._stage_started[thread] = now
+        self._document_started.setdefault(thread, now)
+
+    def on_stage_end(self, stage: StageStats) -> None:
+        args = {"nodes_visited": stage.nodes_visited, "nodes_removed": stage.nodes_removed}
+        self._add(stage.name, self._stage_started.pop(threading.get_ident()), stage.wall_seconds * 1e6, args)
+
+    def on_document_done(self, stats: SimplifyStats) -> None:
+        started = self._document_started.pop(threading.get_ident(), None)
+        if started is not None:
+            args = {"input_bytes": stats.input_bytes, "output_bytes": stats.output_bytes}
+            self._add("document", started, time.perf_counter() * 1e6 - started, args)
+
+    def _add(self, name: str, started: float, duration: float, args: dict) -> None:
+        self.events.append(
+            {
+                "name": name,
+                "cat": "simplify_html",
+                "ph": "X",
+                "ts": started,
+                "dur": duration,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": args,
+            }
+        )
+
+    def save(self, path: str) -> None:
+        """
+        Write the collected events as a Chrome trace-event JSON file.
+
+        Args:
+            path (str): File to write
+        """
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, file)
+
+
+class _StageRecorder:
+    """
+    Context manager that records each stage of one run into a ``SimplifyStats`` and calls the hooks around it.
+
+    Use ``with recorder.stage(name):`` around a stage. The node count at the end of a stage is reused as the count at
+    the start of the next one, so the tree is walked once per stage.
+    """
+
+    def __init__(self, stats: SimplifyStats, hooks: tuple[SimplifyHooks, ...] = ()):
+        self.stats = stats
+        self.hooks = hooks
+        # The tree being simplified, set by the parse stage
+        self.soup = None
+        self.nodes = 0
+        self.name = ""
+        self.started = (0.0, 0.0)
+
+    def stage(self, name: str) -> "_StageRecorder":
+        self.name = name
+        return self
+
+    def __enter__(self) -> None:
+        for hook in self.hooks:
+            hook.on_stage_start(self.name, self.nodes)
+        self.started = (time.perf_counter(), time.process_time())
+
+    def __exit__(self, *exc_info) -> None:
+        wall = time.perf_counter() - self.started[0]
+        cpu = time.process_time() - self.started[1]
+        before = self.nodes
+        self.nodes = 0 if self.soup is None else sum(1 for _ in self.soup.descendants)
+        if self.name == "parse":
+            stage = StageStats(self.name, wall, cpu, self.nodes, 0)
+        else:
+            stage = StageStats(self.name, wall, cpu, before, before - self.nodes)
+        self.stats.stages.append(stage)
+        for hook in self.hooks:
+            hook.on_stage_end(stage)
+
+
+_NO_STAGE = nullcontext()
+
+
+def _stage(recorder: _StageRecorder | None, name: str):
+    """
+    Return the context manager that measures stage ``name``, which does nothing without stats or hooks.
+    """
+    return _NO_STAGE if recorder is None else recorder.stage(name)
+
+
+@dataclass
+class SimplifyResult:
+    """
+    The outcome of ``Simplifier.run``.
+
+    Attributes:
+        output (str): The simplified document in the requested format
+        node_index (dict[str, str]): Maps each node ID stamped on the output to the XPath of the element in the
+            original document (empty unless the simplifier was created with ``node_ids=True``)
+        limit_exceeded (str | None): The ``ResourceLimits`` field that was hit, if any; the output is then partial
+            or the ``strip_html`` fallback, as configured
+        budget_exceeded (bool): True if the output is still over ``max_tokens`` after every reduction, e.g. because
+            the budget is smaller than the first element of the page
+    """
+
+    output: str
+    node_index: dict[str, str] = field(default_factory=dict)
+    limit_exceeded: str | None = None
+    budget_exceeded: bool = False
+
+
+class Simplifier:
+    """
+    Reusable HTML simplification engine.
+
+    Policies are compiled once at construction, so a single instance can simplify many documents.
+
+    Args:
+        fold_policy (FoldPolicy | None): How long lists and tables are folded (default: keep the first 3 items)
+        payload_policy (PayloadPolicy | None): How inline SVGs, data URIs and srcset lists are pruned
+        attribute_policy (AttributePolicy | None): Which attributes are kept (default: drop styles, event handlers,
+            tracking and framework attributes)
+        token_counter (Callable[[str], int] | None): Exact token counter used to verify token budgets (default: rely
+            on ``estimate_tokens``)
+        node_ids (bool): Stamp a compact ``data-nid`` ID on every kept element and index it to the element's XPath
+            in the original document (see ``run``)
+        main_content (bool): Keep only the main content of the page, its title and key head metadata
+        boilerplate (BoilerplateIndex | None): Cross-page index; container subtrees it has seen on more than
+            ``boilerplate_threshold`` of the pages are removed
+        boilerplate_threshold (float): Fraction of pages above which a subtree counts as boilerplate
+        remove_hidden (bool): Remove subtrees that browsers do not render (``hidden``, ``aria-hidden``,
+            ``display:none``, hidden inputs, closed dialogs); on by default, pass False to keep them as before
+        hidden_classes (bool): Also treat the Tailwind ``hidden`` and ``sr-only`` classes as hidden, unless a variant
+            such as ``md:block`` shows the element again
+        wrapper_policy (WrapperPolicy | None): Which attribute-less single-child wrappers are collapsed (default:
+            ``div`` and ``span``, semantic tags preserved)
+        collapse_wrappers (bool): Collapse wrapper chains such as ``div > div > div > p``; on by default, pass False
+            to keep the wrappers as before
+        limits (ResourceLimits | None): Deadline, node and input size limits applied to each document in ``run`` and
+            ``simplify``
+        hooks (list[SimplifyHooks] | None): Callbacks around each stage and document of ``run`` and ``simplify``
+    """
+
+    def __init__(
+        self,
+        fold_policy: FoldPolicy | None = None,
+        payload_policy: PayloadPolicy | None = None,
+        attribute_policy: AttributePolicy | None = None,
+        token_counter: Callable[[str], int] | None = None,
+        node_ids: bool = False,
+        main_content: bool = False,
+        boilerplate: BoilerplateIndex | None = None,
+        boilerplate_threshold: float = 0.5,
+        remove_hidden: bool = True,
+        hidden_classes: bool = False,
+        wrapper_policy: WrapperPolicy | None = None,
+        collapse_wrappers: bool = True,
+        limits: ResourceLimits | None = None,
+        hooks: list[SimplifyHooks] | None = None,
+    ):
+        self.fold_policy = fold_policy or DEFAULT_FOLD_POLICY
+        self.payload_policy = payload_policy or DEFAULT_PAYLOAD_POLICY
+        self.attribute_policy = attribute_policy or DEFAULT_ATTRIBUTE_POLICY
+        self.token_counter = token_counter
+        self.node_ids = node_ids
+        self.main_content = main_content
+        self.boilerplate = boilerplate
+        self.remove_hidden = remove_hidden
+        self.hidden_classes = hidden_classes
+        self.wrapper_policy = wrapper_policy or DEFAULT_WRAPPER_POLICY
+        self.collapse_wrappers = collapse_wrappers
+        self.limits = limits
+        self.hooks = tuple(hooks or ())
+        self._boilerplate_hashes = boilerplate.boilerplate_hashes(boilerplate_threshold) if boilerplate else frozenset()
+        self._attribute_rules = _AttributeRules(self.attribute_policy)
+
+    def simplify(self, html: str, max_tokens: int | None = None, output_format: str = "html") -> str:
+        """
+        Simplifies HTML content by removing unnecessary elements for LLM processing.
+
+        Args:
+            html (str): The HTML content to simplify
+            max_tokens (int | None): Token budget; folding, attribute stripping, text truncation and dropping of
+                low-value subtrees are applied in that order until the output fits
+            output_format (str): One of ``OUTPUT_FORMATS``: ``"html"``, ``"markdown"`` or ``"json"``
+
+        Returns:
+            str: Simplified HTML with unnecessary elements removed, in the requested format
+        """
+        return self.run(html, max_tokens, output_format).output
+
+    def run(
+        self,
+        html: str,
+        max_tokens: int | None = None,
+        output_format: str = "html",
+        stats: SimplifyStats | None = None,
+    ) -> SimplifyResult:
+        """
+        Simplify HTML like ``simplify`` and return the output together with the node index.
+
+        Args:
+            html (str): The HTML content to simplify
+            max_tokens (int | None): Token budget for the output
+            output_format (str): One of ``OUTPUT_FORMATS``
+            stats (SimplifyStats | None): Filled with the time, node counts and sizes of each stage; without it or
+                ``hooks`` the run is not instrumented
+
+        Returns:
+            SimplifyResult: The output and, with ``node_ids``, the map from node IDs to original XPaths
+
+        Raises:
+            LimitExceeded: If a limit whose action is ``"raise"`` is exceeded
+        """
+        run = self._run if self.limits is None else self._run_limited
+        if stats is None and not self.hooks:
+            return run(html, max_tokens, output_format)
+
+        stats = SimplifyStats() if stats is None else stats
+        stats.input_bytes = len(html.encode())
+        try:
+            result = run(html, max_tokens, output_format, _StageRecorder(stats, self.hooks))
+            stats.output_bytes = len(result.output.encode())
+        finally:
+            for hook in self.hooks:
+                hook.on_document_done(stats)
+        return result
+
+    def _run_limited(
+        self, html: str, max_tokens: int | None, output_format: str, recorder: _StageRecorder | None = None
+    ) -> SimplifyResult:
+        tracker = _LimitTracker(self.limits)
+        token = _ACTIVE_LIMITS.set(tracker)
+        try:
+            result = self._run(tracker.check_input(html), max_tokens, output_format, recorder)
+            result.limit_exceeded = tracker.exceeded
+            return result
+        except LimitExceeded as error:
+            if self.limits.action(error.limit) == "raise":
+                raise
+            limit = error.limit
+        finally:
+            _ACTIVE_LIMITS.reset(token)
+
+        # Finish the degraded result outside of the limits, honoring the budget and format that were asked for
+        if self.limits.action(limit) == "fallback":
+            with _stage(recorder, "fallback"):
+                return SimplifyResult(
+                    _format_stripped(strip_html(html), max_tokens, output_format), limit_exceeded=limit
+                )
+        # The deadline passed with a partial result: finish the tree as far as the stages got
+        soup = tracker.soup if tracker.soup is not None else BeautifulSoup("", "html.parser")
+        if self.node_ids:
+            # IDs stamped before the deadline have no index entries
+            for tag in soup.find_all(attrs={NODE_ID_ATTRIBUTE: True}):
+                del tag[NODE_ID_ATTRIBUTE]
+        if max_tokens is None:
+            with _stage(recorder, "serialize"):
+                # The stages may not have shrunk the tree yet, so it is cut to the size of the input before it is
+                # serialized, which keeps the time and output after the deadline bounded
+                _truncate_markup(soup, len(html))
+                output = serialize(soup, output_format)
+            fits = True
+        else:
+            with _stage(recorder, "token_budget"):
+                output, fits = self._fit_token_budget(soup, max_tokens, output_format)
+        return SimplifyResult(output, limit_exceeded=limit, budget_exceeded=not fits)
+
+    def _run(
+        self, html: str, max_tokens: int | None, output_format: str, recorder: _StageRecorder | None = None
+    ) -> SimplifyResult:
+        soup, stamped = self._build_tree(html, recorder)
+        fits = True
+        if max_tokens is None:
+            with _stage(recorder, "serialize"):
+                output = serialize(soup, output_format)
+        else:
+            with _stage(recorder, "token_budget"):
+                output, fits = self._fit_token_budget(soup, max_tokens, output_format)
+        # The token budget may have dropped stamped elements, which are left out of the index
+        node_index = {node_id: path for tag, node_id, path in stamped if not _is_decomposed(tag)}
+        return SimplifyResult(output, node_index, budget_exceeded=not fits)
+
+    def chunks(self, html: str, max_tokens: int, overlap: int = 0) -> Iterator[Chunk]:
+        """
+        Simplify HTML and split the result into chunks of at most ``max_tokens`` tokens for parallel LLM calls.
+
+        Args:
+            html (str): The HTML content to simplify
+            max_tokens (int): Token budget per chunk, including its ancestor path
+            overlap (int): Tokens of trailing elements repeated at the start of the next chunk
+
+        Returns:
+            Iterator[Chunk]: The chunks in document order
+        """
+        return iter_chunks(self.simplify_tree(html), max_tokens, overlap)
+
+    def simplify_tree(self, html: str) -> BeautifulSoup:
+        """
+        Run the simplification stages and return the simplified tree instead of serializing it.
+
+        Args:
+            html (str): The HTML content to simplify
+
+        Returns:
+            BeautifulSoup: The simplified tree
+        """
+        return self._build_tree(html)[0]
+
+    def _build_tree(
+        self, html: str, recorder: _StageRecorder | None = None
+    ) -> tuple[BeautifulSoup, list[tuple[Tag, str, str]]]:
+        """
+        Parse and simplify ``html``, returning the tree and the stamped node IDs.
+        """
+        with _stage(recorder, "parse"):
+            tracker = _ACTIVE_LIMITS.get()
+            soup = BeautifulSoup(html, "html.parser") if tracker is None else _LimitedSoup(html, tracker)
+            if recorder is not None:
+                recorder.soup = soup
+            if tracker is not None:
+                # Keep the tree for a partial result, and cut it down to the node limit before any stage walks it
+                tracker.soup = soup
+                tracker.check_nodes(soup)
+                tracker.check()
+        positions = None
+        if self.node_ids:
+            with _stage(recorder, "positions"):
+                positions = _original_positions(soup)
+
+        self._clean(soup, recorder)
+
+        # Drop subtrees that repeat across the pages of the site
+        if self._boilerplate_hashes:
+            with _stage(recorder, "boilerplate"):
+                remove_boilerplate(soup, self._boilerplate_hashes)
+
+        # Narrow the page down to its main content before the class and fold stages
+        if self.main_content:
+            with _stage(recorder, "main_content"):
+                extract_main_content(soup)
+        _checkpoint()
+
+        # Remove empty elements (key metadata kept for the main content is empty by nature); child elements are
+        # checked first, so text is only gathered from leaves
+        with _stage(recorder, "empty"):
+            _decompose_all(
+                [
+                    element
+                    for element in soup.find_all()
+                    if element.name != "meta"
+                    and not any(isinstance(child, Tag) for child in element.contents)
+                    and not element.get_text(strip=True)
+                ]
+            )
+
+        # Filter attributes and remove Tailwind classes in a single traversal
+        with _stage(recorder, "attributes"):
+            for element in soup.find_all(True):
+                _checkpoint()
+                self._attribute_rules.apply(element)
+
+        # Unwrap wrapper chains that are left without attributes once the Tailwind classes are gone
+        if self.collapse_wrappers:
+            with _stage(recorder, "wrappers"):
+                collapse_wrappers(soup, self.wrapper_policy)
+
+        # Fold lists, similar divs, table rows and select options
+        with _stage(recorder, "fold"):
+            fold_repeated_children(soup, self.fold_policy)
+
+        # Stamp IDs last, so they are only assigned to elements that are kept
+        stamped = []
+        if positions is not None:
+            with _stage(recorder, "node_ids"):
+                stamped = _stamp_node_ids(soup, positions)
+
+        return soup, stamped
+
+    def _clean(self, soup: BeautifulSoup, recorder: _StageRecorder | None = None) -> None:
+        """
+        Run the cleanup stages that remove non-content nodes and heavy payloads.
+        """
+        # Remove script and style elements
+        with _stage(recorder, "scripts"):
+            _decompose_all(soup.find_all(["script", "style"]))
+
+        # Remove hidden subtrees early so that every later stage processes less
+        if self.remove_hidden:
+            with _stage(recorder, "hidden"):
+                remove_hidden_elements(soup, self.hidden_classes)
+        _checkpoint()
+
+        # Remove comments
+        with _stage(recorder, "comments"):
+            _decompose_all(soup.find_all(string=lambda text: isinstance(text, Comment)))
+
+        # Remove meta tags, link tags (except for hyperlinks) and noscript tags
+        with _stage(recorder, "head"):
+            _decompose_all(
+                [meta for meta in soup.find_all("meta") if not (self.main_content and _is_key_metadata(meta))]
+            )
+            _decompose_all(soup.find_all("link"))
+            _decompose_all(soup.find_all("noscript"))
+
+        # Prune heavy payloads before the remaining stages walk the tree
+        with _stage(recorder, "payloads"):
+            prune_heavy_payloads(soup, self.payload_policy)
+
+    def _fit_token_budget(self, soup: BeautifulSoup, max_tokens: int, output_format: str) -> tuple[str, bool]:
+        """
+        Reduce ``soup`` until its serialized output fits ``max_tokens`` and return that output and whether it fits.
+
+        The tree is reduced against an estimate for prettified HTML; the output in the requested format is then
+        counted (with ``token_counter``, or ``estimate_tokens``) and reduced further while it does not fit, until
+        every reduction has been applied.
+        """
+        count = self.token_counter or estimate_tokens
+        budget = _TokenBudget(soup, self.fold_policy)
+        target = max_tokens
+        while True:
+            budget.reduce(target)
+            output = serialize(soup, output_format)
+            actual = count(output)
+            if actual <= max_tokens or budget.exhausted:
+                return output, actual <= max_tokens
+            # The estimate was optimistic for this document or format, so tighten the target proportionally
+            target = min(budget.total - 1, target * max_tokens // actual)
+
+
+def simplify_html_for_llm(
+    html: str,
+    fold_policy: FoldPolicy | None = None,
+    payload_policy: PayloadPolicy | None = None,
+    attribute_policy: AttributePolicy | None = None,
+    max_tokens: int | None = None,
+    token_counter: Callable[[str], int] | None = None,
+    output_format: str = "html",
+) -> str:
+    """
+    Simplifies HTML content by removing unnecessary elements for LLM processing.
+
+    Args:
+        html (str): The HTML content to simplify
+        fold_policy (FoldPolicy | None): How long lists and tables are folded (default: keep the first 3 items)
+        payload_policy (PayloadPolicy | None): How inline SVGs, data URIs and srcset lists are pruned
+        attribute_policy (AttributePolicy | None): Which attributes are kept
+        max_tokens (int | None): Reduce the output further until it fits this many tokens
+        token_counter (Callable[[str], int] | None): Exact token counter used to verify ``max_tokens``
+        output_format (str): ``"html"`` (prettified), ``"markdown"`` or ``"json"`` (compact ``[tag, attrs, children]``)
+
+    Returns:
+        str: Simplified HTML with unnecessary elements removed, in the requested format
+    """
+    simplifier = Simplifier(fold_policy, payload_policy, attribute_policy, token_counter)
+    return simplifier.simplify(html, max_tokens=max_tokens, output_format=output_format)
+
+
+PROFILE_FORMATS = ("pstats", "collapsed")
+
+
+def _profile_label(func: tuple[str, int, str]) -> str:
+    filename, line, name = func
+    if filename == "~":
+        return name.replace(";", ":")
+    return f"{name} ({os.path.basename(filename)}:{line})".replace(";", ":")
+
+
+def collapsed_stacks(stats: pstats.Stats, min_microseconds: float = 1.0) -> Iterator[str]:
+    """
+    Convert a cProfile profile into collapsed stacks (``root;caller;callee microseconds``) for flame graph tools.
+
+    cProfile only records caller-callee pairs, so the time of a function is split between the paths leading to it in
+    proportion to the time spent under each caller. Recursive calls are folded into the outermost frame.
+
+    Args:
+        stats (pstats.Stats): The profile to convert
+        min_microseconds (float): Paths that account for less time are left out
+
+    Returns:
+        Iterator[str]: One ``stack microseconds`` line per path with own time
+    """
+    entries = stats.stats
+    callees = {}
+    for func, (_, _, _, _, callers) in entries.items():
+        for caller, (_, _, _, cumulative) in callers.items():
+            callees.setdefault(caller, []).append((func, cumulative))
+
+    # Explicit stack of (function, labels of the path, fraction of the function's time spent on this path)
+    stack = [(func, (_profile_label(func),), 1.0) for func, entry in entries.items() if not entry[4]]
+    while stack:
+        func, path, fraction = stack.pop()
+        own = entries[func][2] * fraction * 1e6
+        if own >= min_microseconds:
+            yield f"{';'.join(path)} {round(own)}"
+        for callee, cumulative in callees.get(func, ()):
+            total = entries[callee][3]
+            label = _profile_label(callee)
+            if total <= 0 or label in path:
+                continue
+            share = cumulative * fraction / total
+            if total * share * 1e6 >= min_microseconds:
+                stack.append((callee, (*path, label), share))
+
+
+def write_profile(profiler: cProfile.Profile, path: str, profile_format: str = "pstats") -> None:
+    """
+    Write a cProfile profile as a ``pstats`` dump or as collapsed stacks.
+
+    Args:
+        profiler (cProfile.Profile): The finished profile
+        path (str): File to write
+        profile_format (str): One of ``PROFILE_FORMATS``
+    """
+    if profile_format == "pstats":
+        profiler.dump_stats(path)
+        return
+    with open(path, "w", encoding="utf-8") as file:
+        file.writelines(line + "\n" for line in collapsed_stacks(pstats.Stats(profiler)))
+
+
+def _add_simplifier_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Add the options that configure the simplification, shared by the single-document and batch commands.
+    """
+    parser.add_argument(
+        "--max-tokens",
+        type=int,
+        default=None,
+        help="Reduce the output further until it fits this many (estimated) tokens",
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        choices=OUTPUT_FORMATS,
+        default="html",
+        help="Output format (default: html)",
+    )
+    parser.add_argument(
+        "--main-content",
+        action="store_true",
+        help="Keep only the main content of the page, its title and key head metadata",
+    )
+    parser.add_argument(
+        "--keep-hidden",
+        action="store_true",
+        help="Keep hidden and non-rendered subtrees (hidden, aria-hidden, display:none, closed dialogs)",
+    )
+    parser.add_argument(
+        "--keep-wrappers",
+        action="store_true",
+        help="Keep attribute-less single-child wrapper chains such as div > div > p",
+    )
+    parser.add_argument(
+        "--boilerplate",
+        default=None,
+        metavar="INDEX",
+        help="Remove subtrees found on most pages of the site, using an index saved by BoilerplateIndex.save",
+    )
+    parser.add_argument(
+        "--boilerplate-threshold",
+        type=float,
+        default=0.5,
+        help="Fraction of pages above which a subtree counts as boilerplate (default: 0.5)",
+    )
+    parser.add_argument("--deadline", type=float, default=None, metavar="SECONDS", help="Time limit per document")
+    parser.add_argument("--max-nodes", type=int, default=None, help="Node limit per document")
+    parser.add_argument("--max-input-bytes", type=int, default=None, help="Input size limit per document")
+    parser.add_argument(
+        "--on-limit",
+        choices=LIMIT_ACTIONS,
+        default="raise",
+        help="What to do when a limit is exceeded: fail, keep a partial result, or fall back to plain text "
+        "(default: raise)",
+    )
+
+
+def _simplifier_from_args(args: argparse.Namespace, **options) -> Simplifier:
+    """
+    Build the simplifier configured by the options of ``_add_simplifier_arguments``.
+    """
+    limits = None
+    if args.deadline is not None or args.max_nodes is not None or args.max_input_bytes is not None:
+        limits = ResourceLimits(
+            deadline_seconds=args.deadline,
+            max_nodes=args.max_nodes,
+            max_input_bytes=args.max_input_bytes,
+            on_deadline=args.on_limit,
+            on_max_nodes=args.on_limit,
+            on_max_input_bytes=args.on_limit,
+        )
+    return Simplifier(
+        main_content=args.main_content,
+        remove_hidden=not args.keep_hidden,
+        collapse_wrappers=not args.keep_wrappers,
+        boilerplate=BoilerplateIndex.load(args.boilerplate) if args.boilerplate else None,
+        boilerplate_threshold=args.boilerplate_threshold,
+        limits=limits,
+        **options,
+    )
+
+
+OUTPUT_EXTENSIONS = {"html": ".html", "markdown": ".md", "json": ".json"}
+SKIP_MODES = ("mtime", "hash", "none")
+_BATCH_MANIFEST = ".simplify-html-manifest.json"
+_GLOB_MAGIC_RE = re.compile(r"[*?[]")
+# Per-process state of the batch workers, set once by ``_init_batch_worker``
+_BATCH_WORKER = {}
+
+
+def _batch_inputs(patterns: list[str]) -> Iterator[tuple[str, str]]:
+    """
+    Yield ``(path, relative path)`` for every file matched by the glob patterns or found in the directories.
+
+    Paths are relative to the directory, or to the part of the pattern before its first wildcard, and are streamed
+    without listing all matches first. A file covered by several inputs is yielded once, for the first of them.
+    """
+    seen = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            base = pattern
+            matches = glob.iglob(os.path.join(pattern, "**", "*.htm*"), recursive=True)
+        else:
+            parts = pattern.split(os.sep)
+            static = next((index for index, part in enumerate(parts) if _GLOB_MAGIC_RE.search(part)), len(parts) - 1)
+            base = os.sep.join(parts[:static]) or "."
+            matches = glob.iglob(pattern, recursive=True)
+        for path in matches:
+            resolved = os.path.realpath(path)
+            if resolved not in seen and os.path.isfile(path):
+                seen.add(resolved)
+                yield path, os.path.relpath(path, base)
+
+
+def _init_batch_worker(
+    simplifier: Simplifier, max_tokens: int | None, output_format: str, skip: str = "none", field: str = "html"
+) -> None:
+    # Each worker keeps one warm simplifier for all its documents
+    _BATCH_WORKER.update(
+        simplifier=simplifier, max_tokens=max_tokens, output_format=output_format, skip=skip, field=field
+    )
+
+
+def _batch_file(task: tuple[str, str, str | None]) -> tuple[str, int, int | None, str | None, str | None]:
+    """
+    Simplify one file of a batch in a worker.
+
+    Returns:
+        tuple: The source, its size, the output size (``None`` if it was unchanged and skipped), the input digest
+        (in ``"hash"`` mode) and the error, if any
+    """
+    source, target, previous_digest = task
+    try:
+        with open(source, "rb") as file:
+            data = file.read()
+        digest = hashlib.sha256(data).hexdigest() if _BATCH_WORKER["skip"] == "hash" else None
+        if digest is not None and digest == previous_digest and os.path.exists(target):
+            return source, len(data), None, digest, None
+        html_content = UnicodeDammit(data, is_html=True).unicode_markup or ""
+        result = _BATCH_WORKER["simplifier"].run(
+            html_content, _BATCH_WORKER["max_tokens"], _BATCH_WORKER["output_format"]
+        )
+        output = result.output.encode()
+        # Write next to the target and rename, so an interrupted batch never leaves a truncated output behind
+        os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+        partial = f"{target}.{os.getpid()}.tmp"
+        with open(partial, "wb") as file:
+            file.write(output)
+        os.replace(partial, target)
+        return source, len(data), len(output), digest, None
+    except Exception as error:  # noqa: BLE001 - any failure is reported per file instead of aborting the batch
+        return source, 0, None, None, f"{type(error).__name__}: {error}"
+
+
+def _jsonl_record(item: tuple[int, str]) -> tuple[str, bool]:
+    """
+    Simplify the HTML of one JSON Lines record and extract its SSR data in a worker.
+
+    Returns:
+        tuple[str, bool]: The output line, with the record's other fields, ``simplified`` and ``ssr`` (or ``error``),
+        and whether it failed
+    """
+    number, line = item
+    record = {}
+    try:
+        record = json.loads(line)
+        html_content = record.pop(_BATCH_WORKER["field"])
+        result = _BATCH_WORKER["simplifier"].run(
+            html_content, _BATCH_WORKER["max_tokens"], _BATCH_WORKER["output_format"]
+        )
+        record["simplified"] = result.output
+        record["ssr"] = extract_ssr_data(html_content)
+        return json.dumps(record, ensure_ascii=False), False
+    except Exception as error:  # noqa: BLE001 - any failure is reported per line instead of aborting the stream
+        failed = {key: record[key] for key in ("id", "url") if isinstance(record, dict) and key in record}
+        failed.update(line=number, error=f"{type(error).__name__}: {error}")
+        return json.dumps(failed, ensure_ascii=False), True
+
+
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+_WARC_LINE_LIMIT = 1 << 16
+_WARC_SKIP_CHUNK = 1 << 20
+
+
+@dataclass(frozen=True)
+class WarcRecord:
+    """
+    An HTML response or resource record of a WARC file, with its body still encoded.
+
+    Attributes:
+        record_id (str): The ``WARC-Record-ID``, e.g. ``<urn:uuid:...>``
+        target_uri (str): The ``WARC-Target-URI``
+        content_type (str): Content type of the body, with its parameters (e.g. ``text/html; charset=utf-8``)
+        headers (dict[str, str]): HTTP response headers with lowercase names (empty for resource records)
+        body (bytes | None): The HTTP body as archived, or None if it was larger than the limit of the reader
+    """
+
+    record_id: str
+    target_uri: str
+    content_type: str
+    headers: dict[str, str]
+    body: bytes | None
+
+    def text(self) -> str:
+        """
+        Undo the transfer and content encodings of the body and decode it, using the charset of the content type
+        when it is declared.
+
+        Returns:
+            str: The HTML of the record
+        """
+        if self.body is None:
+            raise ValueError(f"Body of {self.record_id} is over the size limit")
+        body = self.body
+        if "chunked" in self.headers.get("transfer-encoding", "").lower():
+            body = _dechunk(body)
+        encoding = self.headers.get("content-encoding", "").strip().lower()
+        if encoding in {"gzip", "x-gzip"}:
+            body = gzip.decompress(body)
+        elif encoding == "deflate":
+            # Servers send both zlib-wrapped and raw deflate streams
+            try:
+                body = zlib.decompress(body)
+            except zlib.error:
+                body = zlib.decompress(body, -zlib.MAX_WBITS)
+        elif encoding not in {"", "identity"}:
+            raise ValueError(f"Unsupported content encoding {encoding!r}")
+        charset = re.search(r"charset=[\"']?([\w.:-]+)", self.content_type, re.IGNORECASE)
+        return UnicodeDammit(body, [charset.group(1)] if charset else [], is_html=True).unicode_markup or ""
+
+
+def _dechunk(body: bytes) -> bytes:
+    """
+    Decode an HTTP chunked body, keeping whatever follows a malformed chunk size as is.
+    """
+    chunks = []
+    position = 0
+    while position < len(body):
+        end = body.find(b"\r\n", position)
+        try:
+            size = int(body[position:end].split(b";")[0], 16) if end >= 0 else -1
+        except ValueError:
+            size = -1
+        if size < 0:
+            chunks.append(body[position:])
+            break
+        if size == 0:
+            break
+        chunks.append(body[end + 2 : end + 2 + size])
+        position = end + 2 + size + 2
+    return b"".join(chunks)
+
+
+def _read_header_block(stream: BinaryIO, limit: int | None = None) -> tuple[dict[str, str], int]:
+    """
+    Read ``Name: value`` lines up to a blank line, reading at most ``limit`` bytes.
+
+    Returns:
+        tuple[dict[str, str], int]: The headers with lowercase names, and the bytes read
+    """
+    headers = {}
+    read = 0
+    while limit is None or read < limit:
+        line = stream.readline(_WARC_LINE_LIMIT if limit is None else min(_WARC_LINE_LIMIT, limit - read))
+        read += len(line)
+        if not line.strip():
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return headers, read
+
+
+def _skip(stream: BinaryIO, size: int) -> None:
+    # Read in chunks, so that skipped bodies are never held in memory whole
+    while size > 0:
+        chunk = stream.read(min(size, _WARC_SKIP_CHUNK))
+        if not chunk:
+            break
+        size -= len(chunk)
+
+
+def iter_warc_records(
+    stream: BinaryIO, content_types: tuple[str, ...] = HTML_CONTENT_TYPES, max_body_bytes: int | None = None
+) -> Iterator[WarcRecord]:
+    """
+    Stream the response and resource records of a WARC file whose payload has one of ``content_types``.
+
+    Only the bodies of those records are read; every other block is skipped in chunks, so memory stays bounded on
+    archives of any size. Decompress ``.warc.gz`` files first, e.g. with ``open_warc``.
+
+    Args:
+        stream (BinaryIO): The uncompressed WARC stream
+        content_types (tuple[str, ...]): Payload MIME types to keep
+        max_body_bytes (int | None): Bodies larger than this are skipped and their record has ``body=None``
+
+    Returns:
+        Iterator[WarcRecord]: The matching records
+    """
+    while True:
+        line = stream.readline(_WARC_LINE_LIMIT)
+        if not line:
+            return
+        if not line.strip():
+            continue
+        if not line.startswith(b"WARC/"):
+            raise ValueError(f"Invalid WARC record header {line[:40]!r}")
+        warc_headers, _ = _read_header_block(stream)
+        remaining = int(warc_headers.get("content-length", 0))
+        warc_type = warc_headers.get("warc-type", "").lower()
+        block_type = warc_headers.get("content-type", "")
+        headers = {}
+        if warc_type == "response" and block_type.lower().startswith("application/http"):
+            remaining -= len(stream.readline(min(remaining, _WARC_LINE_LIMIT)))  # Status line
+            headers, header_length = _read_header_block(stream, remaining)
+            remaining -= header_length
+            content_type = headers.get("content-type", "")
+        elif warc_type == "resource":
+            content_type = block_type
+        else:
+            content_type = ""
+
+        if content_type.split(";")[0].strip().lower() in content_types:
+            body = None
+            if max_body_bytes is None or remaining <= max_body_bytes:
+                body = stream.read(remaining)
+                remaining = 0
+            yield WarcRecord(
+                warc_headers.get("warc-record-id", ""),
+                warc_headers.get("warc-target-uri", ""),
+                content_type,
+                headers,
+                body,
+            )
+        _skip(stream, remaining)
+
+
+class _WarcGzipFile(gzip.GzipFile):
+    """
+    A gzip stream that also closes the file it reads from, unless that is stdin.
+    """
+
+    def close(self) -> None:
+        fileobj = self.fileobj
+        try:
+            super().close()
+        finally:
+            if fileobj is not None and fileobj is not sys.stdin.buffer:
+                fileobj.close()
+
+
+def open_warc(path: str) -> BinaryIO:
+    """
+    Open a WARC file for ``iter_warc_records``, decompressing it on the fly if it is gzipped (``.warc.gz``, one gzip
+    member per record or the whole file as one).
+
+    Args:
+        path (str): Path of the file, or ``-`` for stdin
+
+    Returns:
+        BinaryIO: The uncompressed stream
+    """
+    raw = sys.stdin.buffer if path == "-" else open(path, "rb")  # noqa: SIM115
+    if raw.peek(2)[:2] == b"\x1f\x8b":
+        return _WarcGzipFile(fileobj=raw)
+    return raw
+
+
+def _warc_record(record: WarcRecord) -> tuple[str, bool]:
+    """
+    Simplify the HTML of one WARC record and extract its SSR data in a worker.
+
+    Returns:
+        tuple[str, bool]: The output line, keyed by ``record_id`` and ``uri``, with ``simplified`` and ``ssr`` (or
+        ``error``), and whether it failed
+    """
+    output = {"record_id": record.record_id, "uri": record.target_uri}
+    try:
+        html_content = record.text()
+        result = _BATCH_WORKER["simplifier"].run(
+            html_content, _BATCH_WORKER["max_tokens"], _BATCH_WORKER["output_format"]
+        )
+        output["simplified"] = result.output
+        output["ssr"] = extract_ssr_data(html_content)
+        return json.dumps(output, ensure_ascii=False), False
+    except Exception as error:  # noqa: BLE001 - any failure is reported per record instead of aborting the stream
+        output["error"] = f"{type(error).__name__}: {error}"
+        return json.dumps(output, ensure_ascii=False), True
+
+
+def _imap_ordered(executor: Executor, function: Callable, items: Iterator, in_flight: int) -> Iterator:
+    """
+    Like ``executor.map``, but at most ``in_flight`` items are submitted at a time, so arbitrarily many items can be
+    streamed through in order.
+    """
+    pending = deque()
+    for item in items:
+        if len(pending) >= in_flight:
+            yield pending.popleft().result()
+        pending.append(executor.submit(function, item))
+    while pending:
+        yield pending.popleft().result()
+
+
+def _imap_unordered(executor: Executor, function: Callable, items: Iterator, in_flight: int) -> Iterator:
+    """
+    Like ``executor.map``, but results come in completion order and at most ``in_flight`` items are submitted at a
+    time, so arbitrarily many items can be streamed through.
+    """
+    pending = set()
+    for item in items:
+        if len(pending) >= in_flight:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+        pending.add(executor.submit(function, item))
+    for future in as_completed(pending):
+        yield future.result()
+
+
+def batch_main(argv: list[str]) -> None:
+    """
+    ``batch`` command: simplify every file matched by globs or found in directories into an output directory.
+    """
+    parser = argparse.ArgumentParser(
+        prog="simplify_html.py batch",
+        description="Simplify many HTML files in parallel, skipping the ones whose output is up to date.",
+    )
+    parser.add_argument(
+        "inputs",
+        nargs="+",
+        metavar="INPUT_GLOB",
+        help="Glob patterns (quote them; ** matches subdirectories) or directories of .htm/.html files",
+    )
+    parser.add_argument("--out-dir", required=True, help="Directory of the outputs, mirroring the input tree")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Worker processes (default: one per CPU)",
+    )
+    parser.add_argument(
+        "--skip",
+        choices=SKIP_MODES,
+        default="mtime",
+        help="Skip inputs whose output is newer (mtime) or whose content is unchanged (hash) since the last batch "
+        "with the same options (default: mtime)",
+    )
+    _add_simplifier_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    simplifier = _simplifier_from_args(args)
+    extension = OUTPUT_EXTENSIONS[args.format]
+    option_names = ["format", "max_tokens", "main_content", "keep_hidden", "keep_wrappers", "boilerplate"]
+    option_names += ["boilerplate_threshold", "deadline", "max_nodes", "max_input_bytes", "on_limit"]
+    options = {name: getattr(args, name) for name in option_names}
+    manifest_path = os.path.join(args.out_dir, _BATCH_MANIFEST)
+    manifest = {"options": options, "files": {}}
+    try:
+        with open(manifest_path, encoding="utf-8") as file:
+            previous = json.load(file)
+    except (OSError, ValueError):
+        previous = {}
+    # Outputs made with other options are never up to date
+    previous_files = previous.get("files", {}) if previous.get("options") == options else None
+    counts = {"done": 0, "unchanged": 0, "failed": 0, "bytes": 0}
+    # Source -> relative path of the files submitted and not yet finished
+    sources = {}
+    # Output -> the source it is written for
+    targets = {}
+
+    def tasks() -> Iterator[tuple[str, str, str | None]]:
+        for source, relative in _batch_inputs(args.inputs):
+            target = os.path.join(args.out_dir, os.path.splitext(relative)[0] + extension)
+            # Inputs that only differ in their extension (page.htm, page.html) or come from different directories
+            # would overwrite each other's output, so only the first of them is simplified
+            owner = targets.setdefault(os.path.normcase(target), source)
+            if owner != source:
+                counts["failed"] += 1
+                print(f"\rerror: {source}: output {target} is already written for {owner}", file=sys.stderr)
+                continue
+            if previous_files is not None and args.skip == "mtime" and relative in previous_files:
+                try:
+                    if os.stat(target).st_mtime >= os.stat(source).st_mtime:
+                        manifest["files"][relative] = None
+                        counts["unchanged"] += 1
+                        continue
+                except OSError:
+                    pass
+            sources[source] = relative
+            yield source, target, (previous_files or {}).get(relative)
+
+    started = time.perf_counter()
+    last_report = started
+    interactive = sys.stderr.isatty()
+
+    def report(end: str) -> None:
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        print(
+            f"\r{counts['done']} simplified, {counts['unchanged']} unchanged, {counts['failed']} failed; "
+            f"{counts['bytes'] / elapsed / 1e6:.2f} MB/s, {counts['done'] / elapsed:.1f} files/s",
+            end=end,
+            file=sys.stderr,
+        )
+
+    initargs = (simplifier, args.max_tokens, args.format, args.skip)
+    executor = (
+        ProcessPoolExecutor(args.jobs, initializer=_init_batch_worker, initargs=initargs) if args.jobs > 1 else None
+    )
+    try:
+        if executor is None:
+            _init_batch_worker(*initargs)
+            results = map(_batch_file, tasks())
+        else:
+            results = _imap_unordered(executor, _batch_file, tasks(), in_flight=4 * args.jobs)
+        for source, size, output_size, digest, error in results:
+            relative = sources.pop(source)
+            if error is not None:
+                counts["failed"] += 1
+                print(f"\rerror: {source}: {error}", file=sys.stderr)
+                continue
+            manifest["files"][relative] = digest
+            if output_size is None:
+                counts["unchanged"] += 1
+            else:
+                counts["done"] += 1
+                counts["bytes"] += size
+            if interactive and time.perf_counter() - last_report >= 0.5:
+                last_report = time.perf_counter()
+                report("")
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        # Keep what was done, so an interrupted batch resumes where it stopped
+        os.makedirs(args.out_dir, exist_ok=True)
+        with open(manifest_path, "w", encoding="utf-8") as file:
+            json.dump(manifest, file)
+    report("\n")
+    if counts["failed"]:
+        parser.exit(1)
+
+
+def _add_stream_arguments(parser: argparse.ArgumentParser, unit: str) -> None:
+    """
+    Add the output and worker pool arguments of the commands that stream JSON Lines results.
+    """
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=argparse.FileType("w", encoding="utf-8"),
+        default=sys.stdout,
+        help="Output JSON Lines file (default: write to stdout)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Worker processes (default: one per CPU)",
+    )
+    parser.add_argument(
+        "--in-flight",
+        type=int,
+        default=None,
+        metavar="N",
+        help=f"Most {unit} read ahead of the output, which bounds memory (default: 4 per worker)",
+    )
+    parser.add_argument(
+        "--unordered",
+        action="store_true",
+        help=f"Write {unit} as soon as they are done instead of in input order",
+    )
+    _add_simplifier_arguments(parser)
+
+
+def _stream_results(
+    parser: argparse.ArgumentParser,
+    args: argparse.Namespace,
+    function: Callable[[object], tuple[str, bool]],
+    items: Iterator,
+    field: str = "html",
+) -> None:
+    """
+    Run ``function`` on each item in the worker pool, write the output lines and report the counts on stderr.
+
+    Exits with status 1 if any item failed.
+    """
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    initargs = (_simplifier_from_args(args), args.max_tokens, args.format, "none", field)
+    in_flight = args.in_flight or 4 * args.jobs
+    executor = (
+        ProcessPoolExecutor(args.jobs, initializer=_init_batch_worker, initargs=initargs) if args.jobs > 1 else None
+    )
+    counts = {"records": 0, "failed": 0}
+    started = time.perf_counter()
+    try:
+        if executor is None:
+            _init_batch_worker(*initargs)
+            results = map(function, items)
+        elif args.unordered:
+            results = _imap_unordered(executor, function, items, in_flight)
+        else:
+            results = _imap_ordered(executor, function, items, in_flight)
+        for line, failed in results:
+            args.output.write(line + "\n")
+            counts["records"] += 1
+            counts["failed"] += failed
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        if args.output != sys.stdout:
+            args.output.close()
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    print(
+        f"{counts['records']} records, {counts['failed']} failed; {counts['records'] / elapsed:.1f} records/s",
+        file=sys.stderr,
+    )
+    if counts["failed"]:
+        parser.exit(1)
+
+
+def jsonl_main(argv: list[str]) -> None:
+    """
+    ``jsonl`` command: stream JSON Lines records through a worker pool, simplifying each record's HTML.
+    """
+    parser = argparse.ArgumentParser(
+        prog="simplify_html.py jsonl",
+        description='Simplify the HTML of JSON Lines records (e.g. {"id": ..., "url": ..., "html": ...}) and '
+        "extract their SSR data. Each output record keeps the other fields and adds 'simplified' and 'ssr', or "
+        "'line' and 'error' if the record failed.",
+    )
+    parser.add_argument(
+        "input",
+        nargs="?",
+        type=argparse.FileType("r", encoding="utf-8"),
+        default=sys.stdin,
+        help="Input JSON Lines file (default: read from stdin)",
+    )
+    parser.add_argument("--field", default="html", help="Field holding the HTML of a record (default: html)")
+    _add_stream_arguments(parser, "records")
+    args = parser.parse_args(argv)
+
+    records = ((number, line) for number, line in enumerate(args.input, 1) if line.strip())
+    try:
+        _stream_results(parser, args, _jsonl_record, records, args.field)
+    finally:
+        if args.input != sys.stdin:
+            args.input.close()
+
+
+def warc_main(argv: list[str]) -> None:
+    """
+    ``warc`` command: stream the HTML records of WARC files through a worker pool.
+    """
+    parser = argparse.ArgumentParser(
+        prog="simplify_html.py warc",
+        description="Simplify the HTML response and resource records of WARC files (gzipped or not) and extract their "
+        "SSR data. Writes one JSON line per record with 'record_id', 'uri', and 'simplified' and 'ssr', or 'error'.",
+    )
+    parser.add_argument("inputs", nargs="+", metavar="WARC", help="WARC files (.warc or .warc.gz), or - for stdin")
+    parser.add_argument(
+        "--content-type",
+        action="append",
+        dest="content_types",
+        metavar="MIME",
+        help=f"Payload type to keep; repeat for several (default: {', '.join(HTML_CONTENT_TYPES)})",
+    )
+    parser.add_argument(
+        "--max-record-bytes",
+        type=int,
+        default=50_000_000,
+        metavar="N",
+        help="Records with a larger body are skipped and reported as failed (default: 50000000)",
+    )
+    _add_stream_arguments(parser, "records")
+    args = parser.parse_args(argv)
+    content_types = tuple(content_type.lower() for content_type in args.content_types or HTML_CONTENT_TYPES)
+
+    def records() -> Iterator[WarcRecord]:
+        for path in args.inputs:
+            with open_warc(path) as stream:
+                yield from iter_warc_records(stream, content_types, args.max_record_bytes)
+
+    _stream_results(parser, args, _warc_record, records())
+
+
+_WARM_UP_HTML = (
+    "<html><head><title>t</title></head><body><div class='flex p-4'><ul><li>a</li><li>b</li><li>c</li><li>d</li>"
+    "</ul></div><script>window.__INITIAL_STATE__ = {};</script></body></html>"
+)
+
+
+class _SimplifyHandler(BaseHTTPRequestHandler):
+    """
+    Request handler of ``SimplifyServer``: ``POST /simplify`` with the HTML as body, ``GET /health``.
+    """
+
+    protocol_version = "HTTP/1.1"  # Keep-alive, so that clients do not pay a connection per request
+    server_version = "simplify-html"
+    timeout = 60  # Closes idle keep-alive connections
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, message: str) -> None:
+        # The request body may be left unread, so the connection cannot be reused
+        self.close_connection = True
+        self._send_json(status, {"error": message})
+
+    def do_GET(self) -> None:
+        if urlsplit(self.path).path == "/health":
+            self._send_json(200, {"status": "ok", "pid": os.getpid()})
+        else:
+            self._send_error(404, f"Not found: {self.path}")
+
+    def do_POST(self) -> None:
+        url = urlsplit(self.path)
+        if url.path != "/simplify":
+            self._send_error(404, f"Not found: {self.path}")
+            return
+        length = self.headers.get("Content-Length", "")
+        if not length.isdigit():
+            self._send_error(411, "Content-Length is required")
+            return
+        if int(length) > self.server.max_request_bytes:
+            self._send_error(413, f"Body is over {self.server.max_request_bytes} bytes")
+            return
+        body = self.rfile.read(int(length))
+
+        query = parse_qs(url.query)
+        output_format = query.get("format", [self.server.output_format])[-1]
+        try:
+            max_tokens = int(query["max_tokens"][-1]) if "max_tokens" in query else self.server.max_tokens
+        except ValueError:
+            self._send_error(400, "max_tokens must be an integer")
+            return
+        if output_format not in OUTPUT_FORMATS:
+            self._send_error(400, f"format must be one of {', '.join(OUTPUT_FORMATS)}")
+            return
+        charset = re.search(r"charset=[\"']?([\w.:-]+)", self.headers.get("Content-Type", ""), re.IGNORECASE)
+        html_content = UnicodeDammit(body, [charset.group(1)] if charset else [], is_html=True).unicode_markup or ""
+
+        try:
+            result = self.server.simplifier.run(html_content, max_tokens, output_format)
+        except LimitExceeded as error:
+            self._send_error(422, str(error))
+            return
+        except Exception as error:  # noqa: BLE001 - a failing document answers 500 instead of dropping the connection
+            self._send_error(500, f"{type(error).__name__}: {error}")
+            return
+        payload = {"simplified": result.output}
+        if result.node_index:
+            payload["node_index"] = result.node_index
+        if query.get("ssr", ["1"])[-1] not in {"0", "false"}:
+            payload["ssr"] = extract_ssr_data(html_content)
+        self._send_json(200, payload)
+
+    def address_string(self) -> str:
+        # Clients of a Unix socket have no address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format: str, *args) -> None:
+        if self.server.access_log:
+            super().log_message(format, *args)
+
+
+class SimplifyServer(ThreadingHTTPServer):
+    """
+    HTTP server around one warm ``Simplifier``.
+
+    ``POST /simplify`` takes the HTML as body, decoded with the charset of its content type or detected, and returns
+    ``{"simplified": ..., "ssr": [...]}`` (plus ``node_index`` when node IDs are stamped). The query parameters
+    ``format``, ``max_tokens`` and ``ssr=0`` override the defaults per request. ``GET /health`` returns
+    ``{"status": "ok"}``.
+
+    Attributes:
+        simplifier (Simplifier): The simplifier shared by all requests
+        max_tokens (int | None): Default token budget
+        output_format (str): Default output format
+        max_request_bytes (int): Larger bodies are rejected with 413
+        access_log (bool): Log each request to stderr
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple[str, int] | str,
+        simplifier: Simplifier | None = None,
+        max_tokens: int | None = None,
+        output_format: str = "html",
+        max_request_bytes: int = 50_000_000,
+        access_log: bool = False,
+    ):
+        self.simplifier = simplifier or Simplifier()
+        self.max_tokens = max_tokens
+        self.output_format = output_format
+        self.max_request_bytes = max_request_bytes
+        self.access_log = access_log
+        super().__init__(address, _SimplifyHandler)
+
+    def warm_up(self) -> None:
+        """
+        Run a small document through the simplifier and the SSR extractor, so that lazily built state is ready
+        before the first request (and before workers are forked from this process).
+        """
+        self.simplifier.run(_WARM_UP_HTML, self.max_tokens, self.output_format)
+        extract_ssr_data(_WARM_UP_HTML)
+
+
+class UnixSimplifyServer(SimplifyServer):
+    """
+    ``SimplifyServer`` listening on a Unix socket, whose address is the path of the socket.
+    """
+
+    address_family = socket.AF_UNIX
+
+    def server_bind(self) -> None:
+        # HTTPServer.server_bind expects a (host, port) address
+        socketserver.TCPServer.server_bind(self)
+        self.server_name = "localhost"
+        self.server_port = 0
+
+
+def _exit_on_signal(signum: int, frame) -> None:
+    sys.exit(0)
+
+
+def _prefork(server: SimplifyServer, workers: int) -> None:
+    """
+    Fork ``workers`` processes that serve on the listening socket of ``server``, replace any worker that dies, and
+    terminate them all when the parent exits.
+    """
+    # Keep the warm objects out of the collector, so that workers do not copy the pages they share with the parent
+    gc.freeze()
+    children = {}
+
+    def spawn() -> None:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            try:
+                server.serve_forever()
+            finally:
+                os._exit(1)
+        children[pid] = time.monotonic()
+
+    try:
+        for _ in range(workers):
+            spawn()
+        while True:
+            pid, _ = os.wait()
+            started = children.pop(pid, None)
+            if started is not None and time.monotonic() - started < 1:
+                time.sleep(1)  # Do not spin on a worker that dies on start-up
+            spawn()
+    finally:
+        for pid in children:
+            with suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGTERM)
+        for pid in children:
+            with suppress(ChildProcessError):
+                os.waitpid(pid, 0)
+
+
+def serve_main(argv: list[str]) -> None:
+    """
+    ``serve`` command: serve the simplifier over HTTP from a pool of pre-forked, warm worker processes.
+    """
+    parser = argparse.ArgumentParser(
+        prog="simplify_html.py serve",
+        description="Serve the simplifier over HTTP, on TCP or a Unix socket, from pre-forked worker processes that "
+        "keep it and its caches warm. POST HTML to /simplify (optionally ?format=markdown&max_tokens=500&ssr=0) to "
+        "get {'simplified': ..., 'ssr': [...]}; GET /health checks that the server is up.",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on, 0 for any free port (default: 8000)")
+    parser.add_argument("--unix-socket", default=None, metavar="PATH", help="Listen on this Unix socket instead")
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Worker processes, each serving requests on its own threads (default: one per CPU; 1 where fork is "
+        "unavailable)",
+    )
+    parser.add_argument(
+        "--max-request-bytes",
+        type=int,
+        default=50_000_000,
+        metavar="N",
+        help="Largest accepted body (default: 50000000)",
+    )
+    parser.add_argument("--access-log", action="store_true", help="Log each request to stderr")
+    _add_simplifier_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    options = {
+        "max_tokens": args.max_tokens,
+        "output_format": args.format,
+        "max_request_bytes": args.max_request_bytes,
+        "access_log": args.access_log,
+    }
+    if args.unix_socket is not None:
+        # A socket left by an earlier server that did not shut down cleanly
+        if os.path.exists(args.unix_socket) and stat.S_ISSOCK(os.stat(args.unix_socket).st_mode):
+            os.unlink(args.unix_socket)
+        server = UnixSimplifyServer(args.unix_socket, _simplifier_from_args(args), **options)
+        where = f"unix:{args.unix_socket}"
+    else:
+        server = SimplifyServer((args.host, args.port), _simplifier_from_args(args), **options)
+        where = f"http://{args.host}:{server.server_port}"
+    workers = args.workers if hasattr(os, "fork") else 1
+    signal.signal(signal.SIGTERM, _exit_on_signal)
+    try:
+        server.warm_up()
+        print(f"Serving on {where} with {workers} worker(s)", file=sys.stderr, flush=True)
+        if workers == 1:
+            server.serve_forever()
+        else:
+            _prefork(server, workers)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.unix_socket is not None:
+            with suppress(FileNotFoundError):
+                os.unlink(args.unix_socket)
+
+
+_COMMANDS = {"batch": batch_main, "jsonl": jsonl_main, "warc": warc_main, "serve": serve_main}
+
+
+def main(argv: list[str] | None = None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in _COMMANDS:
+        _COMMANDS[argv[0]](argv[1:])
+        return
+
+    parser = argparse.ArgumentParser(
+        description="Simplify HTML content by removing unnecessary elements and folding long lists. Commands: "
+        "'batch' simplifies many files in parallel, 'jsonl' streams JSON Lines records, 'warc' streams the HTML "
+        "records of WARC archives, 'serve' runs an HTTP server (see '<command> --help')."
+    )
+    parser.add_argument(
+        "input",
+        nargs="?",
+        type=argparse.FileType("r"),
+        default=sys.stdin,
+        help="Input HTML file (default: read from stdin)",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=argparse.FileType("w"),
+        default=sys.stdout,
+        help="Output file (default: write to stdout)",
+    )
+
+    _add_simplifier_arguments(parser)
+    parser.add_argument(
+        "--node-index",
+        type=argparse.FileType("w"),
+        default=None,
+        help="Stamp data-nid IDs on kept elements and write the ID -> original XPath index to this JSON file",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Write per-stage timings, node counts and input/output sizes as JSON to stderr",
+    )
+    parser.add_argument(
+        "--profile",
+        default=None,
+        metavar="FILE",
+        help="Profile the simplification with cProfile and write the profile to this file",
+    )
+    parser.add_argument(
+        "--profile-format",
+        choices=PROFILE_FORMATS,
+        default="pstats",
+        help="Profile file format: a pstats dump, or collapsed stacks for flame graph tools (default: pstats)",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Simplify the input N times and report the timings on stderr (default: 1)",
+    )
+    parser.add_argument(
+        "--trace",
+        default=None,
+        metavar="FILE",
+        help="Write the stages as Chrome trace-event JSON to this file (open it in chrome://tracing or Perfetto)",
+    )
+
+    args = parser.parse_args(argv)
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+
+    trace = ChromeTraceCollector() if args.trace else None
+    try:
+        html_content = args.input.read()
+        simplifier = _simplifier_from_args(
+            args, node_ids=args.node_index is not None, hooks=[trace] if trace is not None else None
+        )
+        profiler = cProfile.Profile() if args.profile else None
+        timings = []
+        try:
+            for _ in range(args.repeat):
+                # Stats describe the last run
+                stats = SimplifyStats() if args.stats else None
+                started = time.perf_counter()
+                if profiler is not None:
+                    profiler.enable()
+                try:
+                    result = simplifier.run(
+                        html_content, max_tokens=args.max_tokens, output_format=args.format, stats=stats
+                    )
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+                timings.append(time.perf_counter() - started)
+        except LimitExceeded as error:
+            parser.exit(1, f"error: {error}\n")
+        finally:
+            if trace is not None:
+                trace.save(args.trace)
+            if profiler is not None:
+                write_profile(profiler, args.profile, args.profile_format)
+        if args.repeat > 1:
+            print(
+                f"{args.repeat} runs: min {min(timings) * 1000:.2f} ms, median {statistics.median(timings) * 1000:.2f} "
+                f"ms, mean {statistics.mean(timings) * 1000:.2f} ms, max {max(timings) * 1000:.2f} ms",
+                file=sys.stderr,
+            )
+        if result.limit_exceeded is not None:
+            print(f"warning: {result.limit_exceeded} exceeded, the output is incomplete", file=sys.stderr)
+        if result.budget_exceeded:
+            print(f"warning: the output does not fit {args.max_tokens} tokens", file=sys.stderr)
+        args.output.write(result.output)
+        if args.node_index is not None:
+            json.dump(result.node_index, args.node_index, indent=2)
+        if stats is not None:
+            json.dump(stats.to_dict(), sys.stderr, indent=2)
+            print(file=sys.stderr)
     finally:
         if args.input != sys.stdin:
             args.input.close()
         if args.output != sys.stdout:
             args.output.close()
+        if args.node_index is not None:
+            args.node_index.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,84 @@
+import pytest
+
+from benchmarks import PAGE_KINDS, benchmark, generate_page, memory_profile, parse_size, run_benchmarks
+from benchmarks.differential import compare, corpus, load_engine, minimize
+from simplify_html import Simplifier, extract_ssr_data, simplify_html_for_llm
+
+
+def test_generated_pages_are_deterministic_and_sized():
+    for kind in PAGE_KINDS:
+        page = generate_page(kind, 20_000, seed=1)
+        assert page == generate_page(kind, 20_000, seed=1)
+        assert page != generate_page(kind, 20_000, seed=2)
+        assert 20_000 <= len(page.encode()) < 60_000
+        assert page.startswith("<!DOCTYPE html>") and page.endswith("</html>")
+
+    # Every SSR payload style is found by the extractor
+    assert len(extract_ssr_data(generate_page("ssr_blob", 30_000))) >= 4
+
+
+def test_parse_size():
+    assert parse_size("10KB") == 10_000
+    assert parse_size("1.5mb") == 1_500_000
+    assert parse_size("2048") == 2048
+    with pytest.raises(ValueError):
+        parse_size("ten")
+
+
+def test_benchmark_reports_throughput_latency_and_stages():
+    result = benchmark("simplify_html_for_llm", generate_page("lists_tables", 5_000), runs=2)
+    assert result["runs"] == 2
+    assert 0 < result["latency_seconds"]["p50"] <= result["latency_seconds"]["p99"]
+    assert result["throughput_mb_per_s"] > 0 and result["pages_per_s"] > 0
+    assert [stage["name"] for stage in result["stages"]][:2] == ["parse", "scripts"]
+    assert all(stage["peak_rss_bytes"] > 0 for stage in result["stages"])
+
+    report = run_benchmarks(("ssr_blob",), (5_000,), ("extract_ssr_data",), runs=1)
+    assert report["config"]["sizes"] == [5_000]
+    assert [stage["name"] for stage in report["results"][0]["stages"]] == ["extract_ssr_data"]
+
+
+def test_memory_profile_reports_stages_and_allocation_sites():
+    html = generate_page("tailwind_spa", 20_000)
+    profile = memory_profile("simplify_html_for_llm", html, top=3)
+    stages = {stage["name"]: stage for stage in profile["stages"]}
+    # The parse tree is the largest allocation, and the later stages free parts of it
+    assert profile["peak_bytes"] >= stages["parse"]["peak_bytes"] >= stages["parse"]["retained_bytes"] > len(html)
+    assert stages["scripts"]["retained_bytes"] < 0
+    assert all(0 < len(stage["top_sites"]) <= 3 for stage in profile["stages"])
+    assert any("bs4" in site["site"] for site in stages["parse"]["top_sites"])
+
+    ssr = memory_profile("extract_ssr_data", generate_page("ssr_blob", 20_000), top=0)
+    assert [stage["name"] for stage in ssr["stages"]] == ["parse", "json_scripts", "inline_scripts", "data_attributes"]
+    assert "top_sites" not in ssr["stages"][0]
+    assert ssr["peak_bytes"] > 0
+
+
+def test_differential_harness(tmp_path):
+    engine_file = tmp_path / "engine.py"
+    engine_file.write_text(
+        "from simplify_html import Simplifier\n"
+        "def buggy(html):\n"
+        "    return Simplifier().simplify(html).replace('Hello', 'Bye')\n"
+    )
+    documents = list(corpus(fuzz_documents=20, seed=3))
+
+    same = compare(simplify_html_for_llm, load_engine("simplify_html:Simplifier")().simplify, iter(documents))
+    assert same["documents"] == len(documents)
+    assert same["mismatch_count"] == 0
+    assert same["throughput_mb_per_s"]["reference"] > 0 and same["speedup"] > 0
+
+    different = compare(simplify_html_for_llm, load_engine(f"{engine_file}:buggy"), iter(documents), max_mismatches=2)
+    assert different["mismatch_count"] > 2
+    assert len(different["mismatches"]) == 2
+    assert "-Hello" in different["mismatches"][0]["diff"]
+    # Inputs are minimized to a run of text with the word in it
+    assert all(mismatch["minimized"].startswith("Hello") for mismatch in different["mismatches"])
+    assert all("<" not in mismatch["minimized"] for mismatch in different["mismatches"])
+
+
+def test_minimize_keeps_the_failure():
+    html = "<div><p>keep</p><span>noise</span><ul><li>bad</li><li>more</li></ul></div>"
+    simplifier = Simplifier()
+    minimized = minimize(html, lambda text: "bad" in simplifier.simplify(text))
+    assert minimized == "bad"
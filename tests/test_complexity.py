@@ -0,0 +1,123 @@
+"""
+Asymptotic complexity regression tests.
+
+Every pipeline stage is timed through ``SimplifyStats`` on documents of size n, 2n and 4n, growing in width and in
+depth. The growth exponent is fitted on a log-log scale and compared with the one of the parse stage, which is
+linear by construction, so a stage scaling clearly worse than the parser fails without absolute timing thresholds.
+
+Stages are timed in CPU time, which other processes competing for the CPU do not inflate. Timer noise and cache
+effects can only make a single timing slower, so the sizes are interleaved within each repeat and the fastest run is
+kept; a case that looks superlinear is measured again before it fails, since a real regression persists and noise
+does not. By default the documents are small and the tests take a few seconds; set
+``SIMPLIFY_HTML_STRESS=1`` to run them four times larger with one more doubling, like the full-size stress tests.
+"""
+
+import gc
+import math
+import os
+
+import pytest
+
+from simplify_html import Simplifier, SimplifyStats
+
+FULL = os.environ.get("SIMPLIFY_HTML_STRESS") == "1"
+SCALES = (1, 2, 4, 8) if FULL else (1, 2, 4)
+# Fraction of the base sizes of ``CASES`` that is measured
+SIZE = 1 if FULL else 1 / 4
+REPEATS = 3
+# Measurements of a case before a superlinear stage fails it
+ROUNDS = 3
+# A linear stage fits an exponent close to the parser's and a quadratic one close to 2
+MAX_EXCESS = 0.4
+# Stages faster than this at the smallest size are dominated by timer noise and are not judged
+MIN_SECONDS = 0.005 if FULL else 0.002
+
+
+def _cards(n: int) -> str:
+    # Wide, attribute-heavy markup: Tailwind classes, empty elements, short lists and similar sibling divs
+    cards = "".join(
+        f'<div class="card flex p-4 text-sm" data-testid="c{i}" style="color: red"><h3 class="font-bold">Title {i}'
+        f"</h3><p>Text {i}</p><span></span><ul><li>a</li><li>b</li><li>c</li><li>d</li></ul></div>"
+        for i in range(n)
+    )
+    return f"<body>{cards}</body>"
+
+
+def _siblings(n: int) -> str:
+    # One long list and many paragraph siblings, which the fold stage compares
+    items = "".join(f"<li>item {i}</li>" for i in range(n))
+    return f"<body><ul>{items}</ul>{'<p>text</p>' * n}</body>"
+
+
+def _deep(n: int) -> str:
+    return "<body>" + '<div class="flex" id="d"><p>x</p><span></span>' * n + "</div>" * n + "</body>"
+
+
+def _wrappers(n: int) -> str:
+    # Attribute-less wrapper chains n levels deep, collapsed by the wrapper stage
+    return "<body>" + "<div><span>" * n + "<p>text</p>" + "</span></div>" * n + "</body>"
+
+
+def _svg(n: int) -> str:
+    # One inline SVG with n paths, replaced by a placeholder in the payload stage
+    paths = '<path d="M0 0"/>' * n
+    return f"<body><svg><title>Logo</title>{paths}</svg><p>text</p></body>"
+
+
+# Case -> (document of size n, base n, options of the run); the bases put the main stages well above MIN_SECONDS
+CASES = {
+    "cards": (_cards, 150, {}),
+    "cards_token_budget": (_cards, 150, {"max_tokens": 500}),
+    "siblings": (_siblings, 1000, {}),
+    "deep": (_deep, 200, {}),
+    "wrappers": (_wrappers, 400, {}),
+    # Large enough for a quadratic removal of the paths to show
+    "svg": (_svg, 10_000, {}),
+}
+
+
+def _measure(simplifier: Simplifier, documents: list[str], options: dict, fastest: list[dict[str, float]]) -> None:
+    """
+    Run every document ``REPEATS`` times, sizes interleaved, keeping the fastest CPU time of each stage per document.
+    """
+    for _ in range(REPEATS):
+        for html, timing in zip(documents, fastest, strict=True):
+            stats = SimplifyStats()
+            simplifier.run(html, stats=stats, **options)
+            for stage in stats.stages:
+                timing[stage.name] = min(timing.get(stage.name, math.inf), stage.cpu_seconds)
+
+
+def _exponent(sizes: list[int], seconds: list[float]) -> float:
+    """
+    Least-squares slope of ``log(seconds)`` against ``log(sizes)``.
+    """
+    xs = [math.log(size) for size in sizes]
+    ys = [math.log(max(value, 1e-9)) for value in seconds]
+    mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys, strict=True)) / sum((x - mean_x) ** 2 for x in xs)
+
+
+@pytest.mark.parametrize("case", CASES)
+def test_stages_scale_linearly(case):
+    document, base, options = CASES[case]
+    simplifier = Simplifier()
+    documents = [document(int(base * SIZE) * scale) for scale in SCALES]
+    sizes = [len(html) for html in documents]
+    timings = [{} for _ in documents]
+    gc.collect()
+    for _ in range(ROUNDS):
+        _measure(simplifier, documents, options, timings)
+        exponents = {
+            stage: _exponent(sizes, [timing[stage] for timing in timings])
+            for stage in timings[0]
+            if timings[0][stage] >= MIN_SECONDS
+        }
+        # The documents must be large enough for the timings to be judged at all
+        assert "parse" in exponents
+        # Cache effects and load make the whole run grow a little faster than linearly, the parser included
+        limit = max(1.0, exponents["parse"]) + MAX_EXCESS
+        superlinear = {stage: round(exponent, 2) for stage, exponent in exponents.items() if exponent > limit}
+        if not superlinear:
+            return
+    pytest.fail(f"Stages scale worse than linearly on {case}: {superlinear}")
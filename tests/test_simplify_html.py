@@ -1,7 +1,45 @@
 import base64
+import gzip
+import http.client
+import io
 import json
-
-from simplify_html import extract_ssr_data, simplify_html_for_llm
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+from bs4 import BeautifulSoup
+
+import simplify_html
+from simplify_html import (
+    AttributePolicy,
+    BoilerplateIndex,
+    ChromeTraceCollector,
+    FoldPolicy,
+    LimitExceeded,
+    PayloadPolicy,
+    ResourceLimits,
+    Simplifier,
+    SimplifyHooks,
+    SimplifyServer,
+    SimplifyStats,
+    UnixSimplifyServer,
+    WarcRecord,
+    WrapperPolicy,
+    estimate_tokens,
+    extract_ssr_data,
+    iter_chunks,
+    iter_html,
+    iter_warc_records,
+    main,
+    open_warc,
+    remove_hidden_elements,
+    simplify_html_for_llm,
+    strip_html,
+)
 
 
 def test_removes_script_tags():
@@ -284,6 +322,678 @@ def test_preserves_formatting():
     assert "..." in simplified
 
 
+def test_fold_annotation_reports_folded_count():
+    html = "<ul>" + "".join(f"<li>Item {i}</li>" for i in range(1, 501)) + "</ul>"
+    simplified = simplify_html_for_llm(html)
+
+    assert "Item 3" in simplified
+    assert "Item 4" not in simplified
+    assert "... (+497)" in simplified
+
+
+def test_fold_policy_keep_last_and_comment_annotation():
+    html = "<ol>" + "".join(f"<li>Step {i}</li>" for i in range(1, 11)) + "</ol>"
+    policy = FoldPolicy(keep_first=2, keep_last=1, annotation="{count} more {tag}", as_comment=True)
+    simplified = simplify_html_for_llm(html, fold_policy=policy)
+
+    assert "Step 1" in simplified
+    assert "Step 2" in simplified
+    assert "Step 3" not in simplified
+    assert "Step 9" not in simplified
+    assert "Step 10" in simplified
+    assert "<!-- 7 more li -->" in simplified
+    # The marker sits between the leading and trailing items
+    assert simplified.index("Step 2") < simplified.index("7 more li") < simplified.index("Step 10")
+
+
+def test_fold_policy_min_items_threshold():
+    html = """
+    <select>
+        <option>One</option>
+        <option>Two</option>
+        <option>Three</option>
+        <option>Four</option>
+        <option>Five</option>
+    </select>
+    """
+    assert "Five" not in simplify_html_for_llm(html)
+    assert "Five" in simplify_html_for_llm(html, fold_policy=FoldPolicy(min_items=6))
+
+
+def test_folds_table_rows_and_keeps_header():
+    rows = "".join(f"<tr><td>Row {i}</td><td>Value {i}</td></tr>" for i in range(1, 5001))
+    html = f"<table><thead><tr><th>Name</th><th>Value</th></tr></thead><tbody>{rows}</tbody></table>"
+    simplified = simplify_html_for_llm(html)
+
+    assert "<thead>" in simplified
+    assert "Name" in simplified
+    assert "Row 3" in simplified
+    assert "Row 4" not in simplified
+    assert "Row 5000" not in simplified
+    assert "... (+4997)" in simplified
+
+
+def test_folding_removes_emptied_table_sections():
+    bodies = "".join(f"<tbody><tr><td>Row {i}</td></tr></tbody>" for i in range(8))
+    simplified = simplify_html_for_llm(f"<table>{bodies}</table>")
+
+    # Three sections keep their row and one keeps the marker
+    assert simplified.count("<tbody>") == 4
+    assert "Row 2" in simplified and "Row 3" not in simplified
+    assert "... (+5)" in simplified
+
+
+def test_truncates_wide_tables_by_column():
+    header = "".join(f"<th>H{i}</th>" for i in range(1, 41))
+    row = "".join(f"<td>C{i}</td>" for i in range(1, 41))
+    html = f"<table><tr>{header}</tr><tr>{row}</tr></table>"
+    simplified = simplify_html_for_llm(html, fold_policy=FoldPolicy(max_columns=5))
+
+    assert "H5" in simplified
+    assert "C5" in simplified
+    assert "H6" not in simplified
+    assert "C6" not in simplified
+    assert simplified.count("... (+35)") == 2
+
+    with pytest.raises(ValueError):
+        FoldPolicy(max_columns=0)
+
+
+def test_prunes_inline_svg_and_template():
+    html = """
+    <button>
+        <svg viewBox="0 0 24 24" aria-label="Close"><path d="M6 6L18 18M6 18L18 6"/></svg>
+    </button>
+    <template><p>Hidden template</p></template>
+    <p>Hello World</p>
+    """
+    simplified = simplify_html_for_llm(html)
+
+    assert "<path" not in simplified
+    assert "viewBox" not in simplified
+    assert "[svg: Close]" in simplified
+    assert "Hidden template" not in simplified
+    assert "Hello World" in simplified
+
+    removed = simplify_html_for_llm(html, payload_policy=PayloadPolicy(svg_placeholder=None))
+    assert "<svg" not in removed
+
+
+def test_truncates_data_uris_and_drops_srcset():
+    payload = "A" * 500
+    html = f"""
+    <div>
+        <a href="data:image/png;base64,{payload}">Download</a>
+        <a href="/image" srcset="small.png 1x, large.png 2x" sizes="100vw">Image</a>
+    </div>
+    """
+    simplified = simplify_html_for_llm(html)
+
+    assert payload not in simplified
+    assert "data:image/png;base64,..." in simplified
+    assert "srcset" not in simplified
+    assert "sizes" not in simplified
+    assert 'href="/image"' in simplified
+
+
+def test_attribute_policy_removes_noise_attributes():
+    html = """
+    <div id="menu" style="color: red" onclick="toggle()" data-gtm-id="42" data-v-1a2b3c ng-if="open"
+         aria-hidden="false" aria-label="Main menu" data-ssr="true">
+        <a href="/products?utm_source=newsletter&utm_medium=email&utm_campaign=spring_sale_2024_final_v2">Products</a>
+    </div>
+    """
+    simplified = simplify_html_for_llm(html)
+
+    for noise in ["style=", "onclick", "data-gtm-id", "data-v-1a2b3c", "ng-if", "aria-hidden", "utm_source"]:
+        assert noise not in simplified
+    assert 'id="menu"' in simplified
+    assert 'aria-label="Main menu"' in simplified
+    assert 'data-ssr="true"' in simplified
+    assert 'href="/products?..."' in simplified
+
+
+def test_attribute_policy_tag_overrides():
+    html = """
+    <div title="Card" data-id="7">
+        <a href="/item/7" title="Item" rel="nofollow">Item</a>
+    </div>
+    """
+    policy = AttributePolicy(tag_overrides={"a": AttributePolicy(allow=("href",), keep_unlisted=False)})
+    simplified = simplify_html_for_llm(html, attribute_policy=policy)
+
+    assert 'href="/item/7"' in simplified
+    assert 'title="Item"' not in simplified
+    assert "nofollow" not in simplified
+    assert 'title="Card"' in simplified
+    assert 'data-id="7"' in simplified
+
+
+def _long_article(sections=20):
+    body = "".join(
+        f"<section><h2>Section {s}</h2><p>{'Lorem ipsum dolor sit amet consectetur adipiscing. ' * 20}</p>"
+        f"<ul>{''.join(f'<li>Item {s}.{i}</li>' for i in range(8))}</ul></section>"
+        for s in range(sections)
+    )
+    return f"<html><body><nav><a href='/'>Home</a></nav><main>{body}</main><footer>Footer</footer></body></html>"
+
+
+def test_max_tokens_fits_budget():
+    html = _long_article()
+    full = simplify_html_for_llm(html)
+
+    for max_tokens in [2000, 500, 100]:
+        simplified = simplify_html_for_llm(html, max_tokens=max_tokens)
+        assert estimate_tokens(simplified) <= max_tokens < estimate_tokens(full)
+        assert "Section 0" in simplified
+
+
+def test_max_tokens_fits_budget_in_every_format():
+    # The JSON AST is not smaller than prettified HTML for every document, so it is measured as serialized
+    cards = "".join(f"<div class='c'><a href='/{i}'>{i}</a> <b>x</b> <i>y</i></div>" for i in range(300))
+    html = _long_article().replace("</main>", f"{cards}</main>")
+    for output_format in ("json", "markdown"):
+        for max_tokens in [2000, 500]:
+            simplified = simplify_html_for_llm(html, max_tokens=max_tokens, output_format=output_format)
+            assert estimate_tokens(simplified) <= max_tokens, (output_format, max_tokens)
+            assert "Section 0" in simplified
+    json.loads(simplify_html_for_llm(html, max_tokens=500, output_format="json"))
+
+
+def test_max_tokens_counts_serialized_nodes():
+    # Entities, the doctype and the truncation marker cost tokens in the output, not only their text
+    html = "<!DOCTYPE html><html><body>" + "<p>Tom &amp; Jerry &lt;3 &amp; co</p><div>x</div>" * 30 + "</body></html>"
+    for max_tokens in range(60, 200, 7):
+        assert estimate_tokens(simplify_html_for_llm(html, max_tokens=max_tokens)) <= max_tokens
+
+
+def test_max_tokens_reports_unreachable_budget():
+    html = "<html><head><title>A fairly long page title</title></head><body><p>Some text here</p></body></html>"
+
+    # The title and the first element are always kept, so a tiny budget cannot be met
+    assert Simplifier().run(html, max_tokens=3).budget_exceeded
+    assert not Simplifier().run(html, max_tokens=100).budget_exceeded
+    assert not Simplifier().run(html).budget_exceeded
+
+
+def test_max_tokens_merges_fold_markers():
+    html = "<ul>" + "".join(f"<li>Item {i}</li>" for i in range(1, 101)) + "</ul>" + "<p>Text</p>" * 20
+    simplified = simplify_html_for_llm(html, max_tokens=60)
+
+    assert "Item 1" in simplified
+    assert "Item 2" not in simplified
+    assert "... (+99)" in simplified
+
+
+def test_max_tokens_with_exact_counter():
+    def count_words(text):
+        return len(text.split())
+
+    simplified = simplify_html_for_llm(_long_article(), max_tokens=300, token_counter=count_words)
+    assert count_words(simplified) <= 300
+
+
+def test_chunks_fit_budget_and_keep_elements_whole():
+    html = _long_article(sections=10)
+    chunks = list(Simplifier().chunks(html, max_tokens=150))
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk.tokens <= 150
+        assert estimate_tokens(chunk.html) + estimate_tokens(chunk.context) <= 150
+        # Every chunk holds whole elements, so its tags are balanced
+        assert chunk.html.count("<li>") == chunk.html.count("</li>")
+        assert chunk.html.count("<section>") == chunk.html.count("</section>")
+
+    # Chunks come in document order and carry their ancestor path
+    headings = [chunk for chunk in chunks if "Section" in chunk.html]
+    assert "Section 0" in headings[0].html
+    assert "Section 9" in headings[-1].html
+    assert all(chunk.path[:3] == ("html", "body", "main") for chunk in headings)
+
+
+def test_chunks_overlap_and_long_text():
+    html = "<ul>" + "".join(f"<li>Entry number {i}</li>" for i in range(40)) + "</ul><p>" + "word " * 500 + "</p>"
+    chunks = list(Simplifier(fold_policy=FoldPolicy(min_items=100)).chunks(html, max_tokens=60, overlap=15))
+
+    list_chunks = [chunk for chunk in chunks if chunk.path == ("ul",)]
+    assert len(list_chunks) > 1
+    # The last item of a chunk is repeated at the start of the next one
+    last_item = list_chunks[0].html.rsplit("<li>", 1)[1]
+    assert list_chunks[1].html.startswith("<li>" + last_item)
+
+    text_chunks = [chunk for chunk in chunks if chunk.path == ("p",)]
+    assert sum(chunk.html.count("word") for chunk in text_chunks) == 500
+    assert all(chunk.tokens <= 60 for chunk in text_chunks)
+
+
+def test_chunks_serialize_strings_and_fit_deep_trees():
+    soup = BeautifulSoup("<!DOCTYPE html><body>Tom &amp; Jerry &lt;3<!-- ... (+5) --><p>x</p></body>", "html.parser")
+    assert [chunk.html for chunk in iter_chunks(soup, max_tokens=20)] == [
+        "<!DOCTYPE html>\n",
+        "Tom &amp; Jerry &lt;3\n",
+        "<!-- ... (+5) -->\n",
+        "<p>\n x\n</p>\n",
+    ]
+
+    # The path of deeply nested elements is shortened, so it leaves room for the content
+    deep = "".join(f'<div id="level-{i}" class="wrapper">' for i in range(300))
+    soup = BeautifulSoup(
+        deep + "".join(f"<p>Paragraph {i} text</p>" for i in range(50)) + "</div>" * 300, "html.parser"
+    )
+    chunks = list(iter_chunks(soup, max_tokens=50))
+    assert all(chunk.tokens <= 50 for chunk in chunks)
+    assert all(estimate_tokens(chunk.html) + estimate_tokens(chunk.context) <= 50 for chunk in chunks)
+    assert sum(chunk.html.count("<p>") for chunk in chunks) == 50
+    assert chunks[-1].path == ("div#level-0.wrapper", "...", "div#level-299.wrapper")
+
+
+def test_markdown_output():
+    html = """
+    <html>
+        <head><title>Shop</title></head>
+        <body>
+            <h1>Products</h1>
+            <p>Our <strong>best</strong> items, see <a href="/all">all products</a>.</p>
+            <ul>
+                <li>Chair</li>
+                <li>Table</li>
+            </ul>
+            <table>
+                <tr><th>Name</th><th>Price</th></tr>
+                <tr><td>Chair</td><td>10</td></tr>
+            </table>
+        </body>
+    </html>
+    """
+    markdown = simplify_html_for_llm(html, output_format="markdown")
+
+    assert "# Shop" in markdown
+    assert "# Products" in markdown
+    assert "Our **best** items, see [all products](/all)." in markdown
+    assert "- Chair\n- Table" in markdown
+    assert "| Name | Price |\n| --- | --- |\n| Chair | 10 |" in markdown
+    assert "<" not in markdown
+
+
+def test_markdown_separates_text_runs_and_continues_quotes():
+    html = "<p>Line<br>break</p><blockquote><p>First</p><p>Second</p></blockquote><p>After</p>"
+    markdown = simplify_html_for_llm(html, output_format="markdown")
+
+    assert "Line break" in markdown
+    assert "> First\n>\n> Second\n\nAfter" in markdown
+
+    # The blank lines around a quote are outside of it, and nested quotes continue the outer one
+    html = "<ul><li>Item</li></ul><blockquote><p>Outer</p><blockquote><p>Inner</p></blockquote><p>End</p></blockquote>"
+    markdown = simplify_html_for_llm(html, output_format="markdown")
+    assert markdown == "- Item\n\n> Outer\n>\n> > Inner\n>\n> End\n"
+
+
+def test_markdown_code_spans_fence_backticks():
+    html = "<p>Run <code>a`b</code>, <code>``x</code> or <code>ls</code></p>"
+    markdown = simplify_html_for_llm(html, output_format="markdown")
+
+    assert markdown == "Run `` a`b ``, ``` ``x ``` or `ls`\n"
+
+
+def test_json_ast_output():
+    html = '<div id="main"><h1>Title</h1><p>Hello <a href="/x">world</a></p></div>'
+    ast = json.loads(simplify_html_for_llm(html, output_format="json"))
+
+    assert ast == [
+        ["div", {"id": "main"}, [["h1", {}, ["Title"]], ["p", {}, ["Hello ", ["a", {"href": "/x"}, ["world"]]]]]]
+    ]
+
+
+def test_node_ids_index_original_xpath():
+    html = """
+    <html>
+        <body>
+            <script>track();</script>
+            <div class="flex"><p>Intro</p></div>
+            <div id="products">
+                <span></span>
+                <ul>
+                    <li>Chair</li>
+                    <li>Table</li>
+                </ul>
+            </div>
+        </body>
+    </html>
+    """
+    result = Simplifier(node_ids=True).run(html)
+    original = BeautifulSoup(html, "html.parser")
+
+    def resolve(xpath):
+        node = original
+        for step in xpath.strip("/").split("/"):
+            name, position = step[:-1].split("[")
+            node = node.find_all(name, recursive=False)[int(position) - 1]
+        return node
+
+    simplified = BeautifulSoup(result.output, "html.parser")
+    stamped = simplified.find_all(attrs={"data-nid": True})
+    assert len(stamped) == len(result.node_index)
+    for element in stamped:
+        xpath = result.node_index[element["data-nid"]]
+        assert resolve(xpath).name == element.name
+
+    table = simplified.find("li", string=lambda text: "Table" in text)
+    assert result.node_index[table["data-nid"]] == "/html[1]/body[1]/div[2]/ul[1]/li[2]"
+    assert resolve(result.node_index[table["data-nid"]]).get_text() == "Table"
+
+
+NEWS_PAGE = """
+<html>
+<head>
+    <title>Big News</title>
+    <meta name="description" content="All about it">
+    <meta name="viewport" content="width=device-width">
+</head>
+<body>
+    <header class="site-header">
+        <nav class="menu"><a href="/">Home</a><a href="/world">World</a><a href="/tech">Tech</a></nav>
+    </header>
+    <div id="cookie-banner">
+        <p>We use cookies to improve your experience, please accept them all.</p>
+        <button>Accept</button>
+    </div>
+    <div class="layout">
+        <aside class="sidebar">
+            <h3>Related</h3>
+            <ul><li><a href="/1">Other story one is here</a></li><li><a href="/2">Another story</a></li></ul>
+        </aside>
+        <article class="post">
+            <h1>Big News Happened</h1>
+            <p>Today, in a surprising turn of events, something big happened, and people everywhere noticed it.</p>
+            <p>Experts say the consequences, which are many, will be felt for years, perhaps decades, to come.</p>
+            <p>More details will follow as the story develops, according to sources close to the matter.</p>
+        </article>
+    </div>
+    <footer><p>Copyright 2024, Example News, all rights reserved, do not copy.</p></footer>
+</body>
+</html>
+"""
+
+
+def test_main_content_extraction():
+    simplified = Simplifier(main_content=True).simplify(NEWS_PAGE)
+
+    assert "Big News Happened" in simplified
+    assert "Experts say the consequences" in simplified
+    assert "<title>" in simplified
+    assert 'content="All about it"' in simplified
+    for boilerplate in ["Home", "cookies", "Accept", "Related", "Other story", "Copyright", "viewport"]:
+        assert boilerplate not in simplified
+
+    # Without the option the page is kept whole
+    assert "Copyright" in simplify_html_for_llm(NEWS_PAGE)
+
+
+def _site_page(number):
+    return f"""
+    <html>
+        <body>
+            <header><nav><a href="/">Home</a><a href="/about">About</a></nav></header>
+            <div id="cookie-notice"><p>We use cookies.</p></div>
+            <main>
+                <h1>Article {number}</h1>
+                <div class="body"><p>Text of article {number}</p></div>
+            </main>
+            <footer><p>Example Inc.</p></footer>
+        </body>
+    </html>
+    """
+
+
+def test_boilerplate_index_removes_site_template(tmp_path):
+    index = BoilerplateIndex()
+    for number in range(10):
+        index.learn(_site_page(number))
+    index_file = tmp_path / "boilerplate.json"
+    index.save(str(index_file))
+
+    simplifier = Simplifier(boilerplate=BoilerplateIndex.load(str(index_file)))
+    simplified = simplifier.simplify(_site_page(42))
+
+    assert "Article 42" in simplified
+    assert "Text of article 42" in simplified
+    for boilerplate in ["Home", "About", "cookies", "Example Inc."]:
+        assert boilerplate not in simplified
+
+    # Subtrees below the threshold are kept
+    assert "Home" in Simplifier(boilerplate=index, boilerplate_threshold=1.0).simplify(_site_page(42))
+
+
+def test_removes_hidden_elements():
+    html = """
+    <body>
+        <p>Visible text</p>
+        <div hidden><p>Hidden attribute</p></div>
+        <div aria-hidden="true"><p>Aria hidden</p></div>
+        <div style="color: red; display: none"><p>Display none</p></div>
+        <ul style="position: absolute; left: -9999px"><li>Off-screen menu</li></ul>
+        <dialog><p>Closed dialog</p></dialog>
+        <dialog open><p>Open dialog</p></dialog>
+        <details><div hidden="until-found"><p>Findable text</p></div></details>
+        <span class="sr-only">Screen reader text</span>
+        <div class="hidden md:block"><p>Responsive menu</p></div>
+        <ul class="hidden group-hover:block"><li>Hover menu</li></ul>
+        <p class="md:hidden">Mobile notice</p>
+        <p class="hidden lg:hidden">Never shown</p>
+        <p class="sr-only lg:not-sr-only">Large screen label</p>
+    </body>
+    """
+    simplified = simplify_html_for_llm(html)
+
+    for kept in ["Visible text", "Open dialog", "Findable text", "Screen reader text", "Responsive menu"]:
+        assert kept in simplified
+    for hidden in ["Hidden attribute", "Aria hidden", "Display none", "Off-screen menu", "Closed dialog"]:
+        assert hidden not in simplified
+
+    with_classes = Simplifier(hidden_classes=True).simplify(html)
+    for kept in ["Responsive menu", "Hover menu", "Mobile notice", "Large screen label"]:
+        assert kept in with_classes
+    for hidden in ["Screen reader text", "Never shown"]:
+        assert hidden not in with_classes
+    # The variants are recognized by the same classifier that strips Tailwind classes
+    assert "class=" not in with_classes
+
+    assert "Closed dialog" in Simplifier(remove_hidden=False).simplify(html)
+
+    form = BeautifulSoup('<form><input type="hidden" name="csrf"><input name="q"></form>', "html.parser")
+    assert remove_hidden_elements(form) == 1
+    assert form.find("input")["name"] == "q"
+
+
+def test_collapses_wrapper_chains():
+    html = """
+    <body>
+        <div class="flex flex-col"><div class="p-4"><div><div><p>Deep text</p></div></div></div></div>
+        <div id="card"><span><a href="/more">More</a></span></div>
+        <section><div><p>Section text</p></div></section>
+        <div><p>First</p><p>Second</p></div>
+    </body>
+    """
+    simplified = Simplifier().simplify(html)
+    soup = BeautifulSoup(simplified, "html.parser")
+
+    assert soup.body.find("p").parent is soup.body
+    assert soup.find("a").parent is soup.find(id="card")
+    assert soup.find("section").find("p").parent is soup.find("section")
+    # Wrappers with several children are kept
+    assert soup.find(string=lambda text: "First" in text).parent.parent.name == "div"
+
+    semantic = Simplifier(wrapper_policy=WrapperPolicy(preserve_semantic=False)).simplify(html)
+    assert "<section>" not in semantic
+    assert "<section>" in Simplifier(collapse_wrappers=False).simplify(html)
+
+
+def test_collapsed_wrappers_keep_text_apart():
+    simplifier = Simplifier()
+    assert simplifier.simplify("<p>foo<div><span>bar</span></div>baz</p>", output_format="markdown") == "foo bar baz\n"
+    assert (
+        simplifier.simplify("<p>foo<span> <b>bar</b> </span>baz</p>", output_format="markdown") == "foo **bar** baz\n"
+    )
+    # Inline wrappers without whitespace do not separate their text
+    assert simplifier.simplify("<p>foo<span><b>bar</b></span>baz</p>", output_format="markdown") == "foo**bar**baz\n"
+
+
+def test_html_output_matches_prettify():
+    html = """
+    <html><head><meta charset="utf-8"><title>A &amp; B</title></head>
+    <body><p class="a b" hidden>x &lt; y<br>z</p><pre>  keep <b>this</b>\n  as is</pre><img src="a.png"></body></html>
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    assert "".join(iter_html(soup)) == soup.prettify()
+    assert "".join(iter_html(soup.p)) == soup.p.prettify()
+
+    # Indentation stops growing past the cap
+    deep = BeautifulSoup("<div>" * 10 + "text" + "</div>" * 10, "html.parser")
+    lines = "".join(iter_html(deep, max_indent_depth=3)).splitlines()
+    assert max(len(line) - len(line.lstrip()) for line in lines) == 3
+
+
+def test_resource_limits():
+    html = "<html><body><script>track()</script><p>First paragraph</p><p>Second paragraph</p></body></html>"
+
+    with pytest.raises(LimitExceeded) as error:
+        Simplifier(limits=ResourceLimits(max_input_bytes=10)).run(html)
+    assert error.value.limit == "max_input_bytes"
+
+    fallback = Simplifier(limits=ResourceLimits(max_nodes=3, on_max_nodes="fallback")).run(html)
+    assert fallback.limit_exceeded == "max_nodes"
+    assert fallback.output == strip_html(html) == "First paragraph\nSecond paragraph\n"
+
+    # Partial results keep the start of the document
+    partial_nodes = Simplifier(limits=ResourceLimits(max_nodes=6, on_max_nodes="partial")).run(html)
+    assert partial_nodes.limit_exceeded == "max_nodes"
+    assert "First paragraph" in partial_nodes.output
+    assert "Second paragraph" not in partial_nodes.output
+    partial_input = Simplifier(limits=ResourceLimits(max_input_bytes=60, on_max_input_bytes="partial")).run(html)
+    assert partial_input.limit_exceeded == "max_input_bytes"
+    assert "First paragraph" in partial_input.output
+    assert "Second paragraph" not in partial_input.output
+
+    # A passed deadline stops the stages right after parsing
+    expired = Simplifier(limits=ResourceLimits(deadline_seconds=0, on_deadline="partial")).run(html)
+    assert expired.limit_exceeded == "deadline_seconds"
+    assert "track()" in expired.output
+
+    within = Simplifier(limits=ResourceLimits(deadline_seconds=60, max_nodes=100, max_input_bytes=1000)).run(html)
+    assert within.limit_exceeded is None
+    assert within.output == simplify_html_for_llm(html)
+
+
+def test_resource_limits_keep_budget_and_format(monkeypatch):
+    html = "<html><body>" + "".join(f"<p>Paragraph {i} with Tom &amp; Jerry</p>" for i in range(500)) + "</body></html>"
+
+    # Degraded results still fit the token budget
+    for action in ("partial", "fallback"):
+        limits = ResourceLimits(deadline_seconds=0, on_deadline=action)
+        for output_format in ("html", "markdown", "json"):
+            result = Simplifier(limits=limits).run(html, max_tokens=100, output_format=output_format)
+            assert result.limit_exceeded == "deadline_seconds"
+            assert 0 < estimate_tokens(result.output) <= 100, (action, output_format)
+
+    # The fallback is rendered in the requested format
+    limits = ResourceLimits(deadline_seconds=0, on_deadline="fallback")
+    assert json.loads(Simplifier(limits=limits).run(html, output_format="json").output)[0] == [
+        "p",
+        {},
+        ["Paragraph 0 with Tom & Jerry"],
+    ]
+    assert Simplifier(limits=limits).run(html).output.startswith("Paragraph 0 with Tom &amp; Jerry\n")
+
+    # IDs stamped before the deadline are removed from the partial output, which has no index
+    def stamp_then_expire(soup, positions):
+        stamp_node_ids(soup, positions)
+        raise LimitExceeded("deadline_seconds", "Deadline exceeded")
+
+    stamp_node_ids = simplify_html._stamp_node_ids
+    monkeypatch.setattr(simplify_html, "_stamp_node_ids", stamp_then_expire)
+    limits = ResourceLimits(deadline_seconds=60, on_deadline="partial")
+    result = Simplifier(node_ids=True, limits=limits).run(html)
+    assert result.limit_exceeded == "deadline_seconds"
+    assert "Paragraph 0" in result.output and "data-nid" not in result.output
+    assert result.node_index == {}
+
+
+def test_resource_limits_stop_parsing_and_bound_partial_results():
+    html = "<html><body>" + "".join(f"<p>Paragraph {i}</p>" for i in range(1000)) + "</body></html>"
+
+    # Parsing stops once the document has more tags than the node limit
+    soup = simplify_html._LimitedSoup(html, simplify_html._LimitTracker(ResourceLimits(max_nodes=100)))
+    assert len(soup.find_all("p")) == 98
+    assert str(soup).endswith("</p></body></html>")
+
+    # and when the deadline passes, so the partial result is the start of the document
+    partial = Simplifier(limits=ResourceLimits(deadline_seconds=0, on_deadline="partial")).run(html)
+    assert "Paragraph 0" in partial.output and "Paragraph 999" not in partial.output
+
+    # Markup closed by the parser is cut to the length of the input
+    unclosed = "<div>text" * 200
+    partial = Simplifier(limits=ResourceLimits(deadline_seconds=0, on_deadline="partial")).run(unclosed)
+    assert 0 < partial.output.count("text") < 200
+
+
+def test_stage_stats():
+    html = "<html><head><script>track()</script></head><body><div><div><p>Text</p></div></div></body></html>"
+    simplifier = Simplifier()
+    stats = SimplifyStats()
+    result = simplifier.run(html, stats=stats)
+
+    # Stats do not change the output, and stages that are disabled are not recorded
+    assert result.output == simplifier.simplify(html)
+    names = [stage.name for stage in stats.stages]
+    assert names[0] == "parse" and names[-1] == "serialize"
+    assert "main_content" not in names and "node_ids" not in names
+    stages = {stage.name: stage for stage in stats.stages}
+    assert stages["parse"].nodes_visited == 9
+    assert stages["scripts"].nodes_removed == 2
+    assert stages["wrappers"].nodes_removed == 2
+    assert all(stage.wall_seconds >= 0 and stage.cpu_seconds >= 0 for stage in stats.stages)
+    assert stats.input_bytes == len(html)
+    assert stats.output_bytes == len(result.output)
+    summary = stats.to_dict()
+    assert summary["bytes_saved"] == len(html) - len(result.output)
+    assert [stage["name"] for stage in summary["stages"]] == names
+
+
+def test_stage_hooks(tmp_path):
+    class RecordingHooks(SimplifyHooks):
+        def __init__(self):
+            self.calls = []
+
+        def on_stage_start(self, name, nodes):
+            self.calls.append(("start", name, nodes))
+
+        def on_stage_end(self, stage):
+            self.calls.append(("end", stage.name, stage.nodes_visited - stage.nodes_removed))
+
+        def on_document_done(self, stats):
+            self.calls.append(("done", len(stats.stages), stats.output_bytes))
+
+    html = "<html><body><script>track()</script><p>Text</p></body></html>"
+    hooks = RecordingHooks()
+    trace = ChromeTraceCollector()
+    output = Simplifier(hooks=[hooks, trace]).simplify(html)
+
+    assert output == simplify_html_for_llm(html)
+    assert hooks.calls[:3] == [("start", "parse", 0), ("end", "parse", 6), ("start", "scripts", 6)]
+    assert ("end", "scripts", 4) in hooks.calls
+    assert hooks.calls[-1] == ("done", len(hooks.calls) // 2, len(output))
+
+    # One complete event per stage, nested in a document event
+    *stages, document = trace.events
+    assert [event["name"] for event in stages] == [call[1] for call in hooks.calls if call[0] == "end"]
+    assert document["name"] == "document"
+    assert all(event["ph"] == "X" and event["dur"] >= 0 for event in trace.events)
+    assert all(document["ts"] <= event["ts"] <= document["ts"] + document["dur"] for event in stages)
+    trace.save(tmp_path / "trace.json")
+    assert json.loads((tmp_path / "trace.json").read_text())["traceEvents"] == trace.events
+
+
 def test_cli_functionality(tmp_path):
     # Create a test HTML file
     test_html = """
@@ -331,6 +1041,280 @@ def test_cli_functionality(tmp_path):
         sys.argv = original_argv
 
 
+def test_cli_profile(tmp_path, monkeypatch, capsys):
+    input_file = tmp_path / "input.html"
+    input_file.write_text("<html><body><div class='flex'><p>Text</p></div></body></html>")
+    profile_file = tmp_path / "profile.txt"
+    monkeypatch.setattr(
+        "sys.argv",
+        ["simplify_html.py", str(input_file), "--repeat", "3", "--profile", str(profile_file)]
+        + ["--profile-format", "collapsed", "--stats"],
+    )
+    main()
+
+    captured = capsys.readouterr()
+    assert captured.out == simplify_html_for_llm(input_file.read_text())
+    assert "3 runs: min" in captured.err
+    assert '"stages"' in captured.err
+    # Apart from the profiler switching itself off, every stack starts at the profiled call
+    stacks = [line.rsplit(" ", 1) for line in profile_file.read_text().splitlines() if "_lsprof" not in line]
+    assert stacks
+    assert all(stack.startswith("run (simplify_html.py:") and int(micros) >= 1 for stack, micros in stacks)
+    assert any(";_build_tree (simplify_html.py:" in stack for stack, _ in stacks)
+
+
+def test_cli_keeps_hidden_elements_and_wrappers(tmp_path, monkeypatch, capsys):
+    input_file = tmp_path / "input.html"
+    input_file.write_text("<html><body><div><div><p>Text</p></div></div><p hidden>Hidden</p></body></html>")
+    monkeypatch.setattr("sys.argv", ["simplify_html.py", str(input_file), "--keep-hidden", "--keep-wrappers"])
+    main()
+
+    captured = capsys.readouterr()
+    assert captured.out == Simplifier(remove_hidden=False, collapse_wrappers=False).simplify(input_file.read_text())
+    assert "Hidden" in captured.out
+    assert "<div>" in captured.out
+
+
+def test_cli_batch(tmp_path, capsys):
+    pages = tmp_path / "pages"
+    (pages / "blog").mkdir(parents=True)
+    (pages / "index.html").write_text("<html><body><div class='flex'><p>Home</p></div></body></html>")
+    (pages / "blog" / "post.htm").write_bytes("<html><body><p>Café</p></body></html>".encode("latin-1"))
+    (pages / "notes.txt").write_text("not html")
+    out_dir = tmp_path / "out"
+
+    main(["batch", str(pages / "**" / "*.htm*"), "--out-dir", str(out_dir), "-j", "2", "-f", "markdown"])
+    assert (out_dir / "index.md").read_text() == simplify_html_for_llm(
+        (pages / "index.html").read_text(), output_format="markdown"
+    )
+    assert "Café" in (out_dir / "blog" / "post.md").read_text()
+    assert not (out_dir / "notes.md").exists()
+    assert "2 simplified, 0 unchanged, 0 failed" in capsys.readouterr().err
+
+    # Unchanged inputs are skipped, by modification time or by content, unless the options change
+    main(["batch", str(pages), "--out-dir", str(out_dir), "-j", "1", "-f", "markdown"])
+    assert "0 simplified, 2 unchanged" in capsys.readouterr().err
+    main(["batch", str(pages), "--out-dir", str(out_dir), "--skip", "hash", "-f", "markdown"])
+    assert "2 simplified, 0 unchanged" in capsys.readouterr().err
+    (pages / "index.html").write_text("<html><body><p>Changed</p></body></html>")
+    main(["batch", str(pages), "--out-dir", str(out_dir), "--skip", "hash", "-f", "markdown"])
+    assert "1 simplified, 1 unchanged" in capsys.readouterr().err
+    assert (out_dir / "index.md").read_text() == "Changed\n"
+    main(["batch", str(pages), "--out-dir", str(out_dir), "--skip", "hash"])
+    assert "2 simplified, 0 unchanged" in capsys.readouterr().err
+    assert (out_dir / "index.html").exists()
+
+    # Files covered by several inputs are simplified once
+    for jobs in ("1", "2"):
+        main(["batch", str(pages), str(pages / "*.html"), "--out-dir", str(tmp_path / jobs), "-j", jobs])
+        assert "2 simplified, 0 unchanged, 0 failed" in capsys.readouterr().err
+
+    # Inputs mapping to the same output are reported instead of overwriting it
+    (pages / "index.htm").write_text("<html><body><p>Other</p></body></html>")
+    with pytest.raises(SystemExit) as exit_info:
+        main(["batch", str(pages), "--out-dir", str(tmp_path / "collide"), "-f", "markdown"])
+    assert exit_info.value.code == 1
+    err = capsys.readouterr().err
+    assert "2 simplified, 0 unchanged, 1 failed" in err
+    assert "index.md is already written for" in err
+
+
+def test_cli_jsonl(tmp_path, capsys):
+    next_data = '<script id="__NEXT_DATA__" type="application/json">{"page": "/a"}</script>'
+    records = [
+        {
+            "id": 1,
+            "url": "https://a.example",
+            "html": f"<html><body><div class='flex'><p>A</p></div>{next_data}</body></html>",
+        },
+        {"id": 2, "url": "https://b.example", "html": "<html><body><p>B</p></body></html>"},
+        {"id": 3, "url": "https://c.example"},
+    ]
+    source = tmp_path / "in.jsonl"
+    source.write_text("".join(json.dumps(record) + "\n" for record in records) + "\nnot json\n")
+    output = tmp_path / "out.jsonl"
+
+    with pytest.raises(SystemExit) as exit_info:
+        main(["jsonl", str(source), "-o", str(output), "-j", "2", "--in-flight", "1"])
+    assert exit_info.value.code == 1
+    assert "4 records, 2 failed" in capsys.readouterr().err
+    results = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [result.get("id") for result in results] == [1, 2, 3, None]
+    assert results[0]["url"] == "https://a.example"
+    assert results[0]["simplified"] == simplify_html_for_llm(records[0]["html"])
+    assert results[0]["ssr"] == [{"page": "/a"}]
+    assert results[1]["ssr"] == []
+    assert results[2]["error"].startswith("KeyError") and results[2]["line"] == 3
+    assert results[3]["line"] == 5 and "html" not in results[3]
+
+    # Unordered results can come in any order, but every record is written once
+    source.write_text("".join(json.dumps(record) + "\n" for record in records[:2]))
+    main(["jsonl", str(source), "-o", str(output), "-j", "2", "--unordered", "-f", "markdown"])
+    results = {result["id"]: result for result in map(json.loads, output.read_text().splitlines())}
+    assert sorted(results) == [1, 2]
+    assert results[2]["simplified"] == "B\n"
+
+
+def _warc(warc_type: str, uri: str, block: bytes, content_type: str = "application/http; msgtype=response") -> bytes:
+    # One record, gzipped as its own member like in crawler output
+    header = (
+        f"WARC/1.0\r\nWARC-Type: {warc_type}\r\nWARC-Record-ID: <urn:uuid:{uri}>\r\nWARC-Target-URI: {uri}\r\n"
+        f"Content-Type: {content_type}\r\nContent-Length: {len(block)}\r\n\r\n"
+    )
+    return gzip.compress(header.encode() + block + b"\r\n\r\n")
+
+
+def _warc_archive() -> bytes:
+    page = gzip.compress("<html><body><div class='flex'><p>Café</p></div></body></html>".encode("latin-1"))
+    chunked = b"%x\r\n%s\r\n0\r\n\r\n" % (len(page), page)
+    http = (
+        b"HTTP/1.1 200 OK\r\nContent-Type: text/html; charset=iso-8859-1\r\nContent-Encoding: gzip\r\n"
+        b"Transfer-Encoding: chunked\r\n\r\n" + chunked
+    )
+    image = b"HTTP/1.1 200 OK\r\nContent-Type: image/png\r\n\r\n" + b"\0" * 5000
+    return b"".join(
+        (
+            _warc("warcinfo", "info", b"software: test\r\n", "application/warc-fields"),
+            _warc("request", "https://a.example/", b"GET / HTTP/1.1\r\n\r\n", "application/http; msgtype=request"),
+            _warc("response", "https://a.example/", http),
+            _warc("response", "https://a.example/logo.png", image),
+            _warc("resource", "file:///b.html", b"<html><body><p>B</p></body></html>", "text/html"),
+        )
+    )
+
+
+def test_iter_warc_records():
+    records = list(iter_warc_records(gzip.GzipFile(fileobj=io.BytesIO(_warc_archive()))))
+    assert [(record.record_id, record.target_uri) for record in records] == [
+        ("<urn:uuid:https://a.example/>", "https://a.example/"),
+        ("<urn:uuid:file:///b.html>", "file:///b.html"),
+    ]
+    assert records[0].headers["content-encoding"] == "gzip"
+    assert records[0].text() == "<html><body><div class='flex'><p>Café</p></div></body></html>"
+    assert records[1].content_type == "text/html"
+    assert "<p>B</p>" in records[1].text()
+
+    # Bodies over the limit are skipped without being read
+    records = list(iter_warc_records(gzip.GzipFile(fileobj=io.BytesIO(_warc_archive())), max_body_bytes=40))
+    assert records[0].body is None and records[1].body is not None
+    with pytest.raises(ValueError, match="over the size limit"):
+        records[0].text()
+    assert WarcRecord("id", "uri", "text/html", {}, b"<p>x</p>").text() == "<p>x</p>"
+
+
+def test_open_warc_closes_file(tmp_path):
+    path = tmp_path / "crawl.warc.gz"
+    path.write_bytes(_warc_archive())
+    with open_warc(str(path)) as stream:
+        raw = stream.fileobj
+        assert len(list(iter_warc_records(stream))) == 2
+    assert raw.closed
+
+    path.write_bytes(gzip.decompress(_warc_archive()))
+    with open_warc(str(path)) as stream:
+        assert len(list(iter_warc_records(stream))) == 2
+    assert stream.closed
+
+
+def test_cli_warc(tmp_path, capsys):
+    archive = tmp_path / "crawl.warc.gz"
+    archive.write_bytes(_warc_archive())
+    output = tmp_path / "out.jsonl"
+
+    main(["warc", str(archive), "-o", str(output), "-j", "2", "-f", "markdown"])
+    assert "2 records, 0 failed" in capsys.readouterr().err
+    results = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [(result["uri"], result["simplified"]) for result in results] == [
+        ("https://a.example/", "Café\n"),
+        ("file:///b.html", "B\n"),
+    ]
+    assert results[0]["record_id"] == "<urn:uuid:https://a.example/>"
+    assert results[0]["ssr"] == []
+
+    # Uncompressed archives work too, and oversized records are reported as failed
+    archive.write_bytes(gzip.decompress(_warc_archive()))
+    with pytest.raises(SystemExit):
+        main(["warc", str(archive), "-o", str(output), "-j", "1", "--max-record-bytes", "40"])
+    assert "2 records, 1 failed" in capsys.readouterr().err
+    assert "over the size limit" in json.loads(output.read_text().splitlines()[0])["error"]
+
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path: str):
+        super().__init__("localhost")
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+def _request(connection: http.client.HTTPConnection, method: str, path: str, body: bytes | None = None):
+    connection.request(method, path, body, {"Content-Type": "text/html; charset=utf-8"} if body else {})
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+
+def test_server(tmp_path):
+    page = (
+        "<html><body><div class='flex'><p>Héllo</p></div>"
+        "<script id='__NEXT_DATA__' type='application/json'>{\"a\": 1}</script></body></html>"
+    )
+    server = SimplifyServer(("127.0.0.1", 0))
+    server.warm_up()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        connection = http.client.HTTPConnection("127.0.0.1", server.server_port)
+        assert _request(connection, "GET", "/health")[1]["status"] == "ok"
+        # Requests reuse the connection
+        status, payload = _request(connection, "POST", "/simplify", page.encode())
+        assert status == 200
+        assert payload == {"simplified": simplify_html_for_llm(page), "ssr": [{"a": 1}]}
+        assert _request(connection, "POST", "/simplify?format=markdown&ssr=0", page.encode()) == (
+            200,
+            {"simplified": "Héllo\n"},
+        )
+        assert _request(connection, "POST", "/simplify?format=pdf", b"<p>x</p>")[0] == 400
+        connection = http.client.HTTPConnection("127.0.0.1", server.server_port)
+        assert _request(connection, "POST", "/other", b"<p>x</p>")[0] == 404
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    path = str(tmp_path / "simplify.sock")
+    server = UnixSimplifyServer(path, Simplifier(limits=ResourceLimits(max_input_bytes=100)), output_format="markdown")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        status, payload = _request(_UnixConnection(path), "POST", "/simplify", b"<p>x</p>")
+        assert (status, payload["simplified"]) == (200, "x\n")
+        assert _request(_UnixConnection(path), "POST", "/simplify", page.encode() * 2)[0] == 422
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="pre-forking needs fork")
+def test_cli_serve_preforks_workers(tmp_path):
+    path = str(tmp_path / "simplify.sock")
+    script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "simplify_html.py")
+    process = subprocess.Popen(
+        [sys.executable, script, "serve", "--unix-socket", path, "-j", "2", "-f", "markdown"], stderr=subprocess.PIPE
+    )
+    try:
+        assert "with 2 worker(s)" in process.stderr.readline().decode()
+        deadline = time.monotonic() + 10
+        pids = set()
+        # Each connection is accepted by whichever worker is free, so both show up sooner or later
+        while len(pids) < 2 and time.monotonic() < deadline:
+            pids.add(_request(_UnixConnection(path), "GET", "/health")[1]["pid"])
+        assert len(pids) == 2 and process.pid not in pids
+        assert _request(_UnixConnection(path), "POST", "/simplify", b"<p>x</p>")[1]["simplified"] == "x\n"
+    finally:
+        process.terminate()
+        assert process.wait(10) == 0
+    assert not os.path.exists(path)
+
+
 def test_removes_tailwind_classes():
     html = """
     <div class="my-wrapper">
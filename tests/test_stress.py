@@ -0,0 +1,96 @@
+"""
+Stress tests for pathologically deep and wide documents.
+
+The documents are simplified under a recursion limit barely above the current stack depth, so any recursion that
+grows with the document fails, and the run is checked against time and memory bounds that grow linearly with the
+input. The full sizes (depth 50k, breadth 1M) take minutes; set ``SIMPLIFY_HTML_STRESS=1`` to run them, otherwise
+the same documents are built at a reduced size.
+"""
+
+import inspect
+import os
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable
+from functools import partial
+
+from simplify_html import OUTPUT_FORMATS, Simplifier, estimate_tokens
+
+FULL = os.environ.get("SIMPLIFY_HTML_STRESS") == "1"
+DEPTH = 50_000 if FULL else 1_000
+BREADTH = 1_000_000 if FULL else 1_000
+# Generous bounds per input byte: a parsed bs4 node costs a few hundred bytes and tens of microseconds
+MAX_SECONDS_PER_BYTE = 50e-6
+MAX_PEAK_BYTES_PER_BYTE = 2_000
+
+
+def _deep_document(depth: int) -> str:
+    # The ids keep the wrappers from being collapsed, so the tree stays as deep as the markup
+    return "<body>" + '<div id="d"><p>x</p>' * depth + "text" + "</div>" * depth + "</body>"
+
+
+def _wide_document(breadth: int) -> str:
+    # One list of ``breadth`` items, followed by a tenth as many paragraphs and wrapped elements under <body>
+    items = "".join(f"<li>item {number}</li>" for number in range(breadth))
+    siblings = breadth // 10
+    return f"<body><ul>{items}</ul>{'<p>text</p>' * siblings}{'<div><div><b>x</b></div></div>' * siblings}</body>"
+
+
+def _simplify_bounded(html: str, runs: list[Callable[[str], object]]) -> list:
+    """
+    Call every function in ``runs`` on ``html`` under a tight recursion limit, checking time and peak memory.
+    """
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(len(inspect.stack()) + 150)
+    try:
+        started = time.perf_counter()
+        results = [run(html) for run in runs]
+        elapsed = time.perf_counter() - started
+        # Tracing slows the run down several times, so memory is measured on a separate run
+        tracemalloc.start()
+        try:
+            runs[0](html)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    finally:
+        sys.setrecursionlimit(limit)
+    assert elapsed < len(html) * len(runs) * MAX_SECONDS_PER_BYTE
+    assert peak < len(html) * MAX_PEAK_BYTES_PER_BYTE
+    return results
+
+
+def test_deep_document():
+    simplifier = Simplifier()
+    runs = [partial(simplifier.simplify, output_format=output_format) for output_format in OUTPUT_FORMATS]
+    runs.append(lambda html: simplifier.simplify(html, max_tokens=1000))
+    runs.append(lambda html: list(simplifier.chunks(html, 500)))
+    html_output, markdown, json_ast, budgeted, chunks = _simplify_bounded(_deep_document(DEPTH), runs)
+
+    assert html_output.count("<div") == DEPTH
+    assert "text" in markdown
+    assert json_ast.count("[") > DEPTH
+    assert estimate_tokens(budgeted) <= 1000
+    # Indentation is capped, so the output grows linearly with the depth
+    assert max(len(line) - len(line.lstrip()) for line in html_output.splitlines()) <= 64
+    # The paths are cut below the outermost ancestor, so they fit the budget at any depth
+    assert sum(chunk.html.count("<p>") for chunk in chunks) == DEPTH
+    assert all(estimate_tokens(chunk.html) + estimate_tokens(chunk.context) <= 500 for chunk in chunks)
+    assert all(chunk.tokens <= 500 and chunk.path[1] == "..." for chunk in chunks[-10:])
+
+
+def test_wide_document():
+    simplifier = Simplifier(main_content=True)
+    runs = [partial(simplifier.simplify, output_format=output_format) for output_format in OUTPUT_FORMATS]
+    runs.append(lambda html: list(simplifier.chunks(html, 500)))
+    html_output, markdown, json_ast, chunks = _simplify_bounded(_wide_document(BREADTH), runs)
+
+    assert f"... (+{BREADTH - 3})" in html_output
+    assert html_output.count("<li>") == 3
+    # The attribute-less wrappers are collapsed around their only child
+    assert html_output.count("<b>") == BREADTH // 10
+    assert "<div>" not in html_output
+    assert markdown.count("**x**") == BREADTH // 10
+    assert json_ast.startswith("[")
+    assert all(chunk.tokens <= 500 for chunk in chunks)